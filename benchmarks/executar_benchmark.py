@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_local import CacheMetadados
+from motor_intersecao import (
+    AreaInteresse, PoolConexoes, RegistroDesempenho, listar_camadas, executar_intersecoes,
+    exportar_geopackage
+)
+from fixture_postgis import CENARIOS, AOIS, instancia_temporaria, banco_descartavel, criar_cenario, gravar_aoi
+
+# Benchmark do diagnóstico e da exportação sobre esquemas sintéticos num banco descartável.
+# Cada combinação cenário x AOI é medida de ponta a ponta e por etapa; o resultado vai para
+# um JSON que pode ser comparado com o de outra versão.
+#
+#   python benchmarks/executar_benchmark.py --initdb --saida linha_de_base.json
+#   python benchmarks/executar_benchmark.py --credenciais credenciais.json \
+#       --cenarios poucas_tabelas zm --comparar linha_de_base.json
+#
+# Com --credenciais, um banco temporário é criado (e removido) no servidor indicado, que
+# precisa ter o PostGIS disponível; com --initdb, um cluster inteiro é criado numa pasta
+# temporária com os binários do PATH (ou de --pg-bin).
+
+VERSAO_FORMATO = 1
+
+
+def log(msg):
+    print(msg, flush=True)
+
+
+def silencioso(msg):
+    pass
+
+
+def versao_codigo():
+    # Commit atual do repositório, para identificar a linha de base
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def versoes_servidor(conexoes):
+    with conexoes.conexao() as conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT current_setting('server_version'), postgis_lib_version()")
+                return cur.fetchone()
+        finally:
+            conn.rollback()
+
+
+def medir(conexoes, esquema, caminho_aoi, pasta, args):
+    # Uma rodada completa: leitura da AOI, listagem das camadas, diagnóstico e exportação
+    etapas = {}
+    inicio = time.perf_counter()
+    aoi = AreaInteresse.ler(caminho_aoi)
+    etapas["ler_aoi"] = time.perf_counter() - inicio
+
+    t = time.perf_counter()
+    cache = CacheMetadados(os.path.join(pasta, f"metadados_{time.monotonic_ns()}.json"))
+    with conexoes.conexao() as conn:
+        camadas = listar_camadas(conn, esquema, cache=cache, chave="bench", log=silencioso)
+    etapas["listar"] = time.perf_counter() - t
+
+    desempenho = RegistroDesempenho()
+    t = time.perf_counter()
+    resultados, falhas, _, _ = executar_intersecoes(
+        conexoes, camadas, aoi, workers=args.workers, log=silencioso, registrar=not args.sem_exportacao,
+        em_lote=args.lote, desempenho=desempenho
+    )
+    etapas["diagnostico"] = time.perf_counter() - t
+
+    if not args.sem_exportacao and resultados:
+        por_nome = {c["nome"]: c for c in camadas}
+        selecionadas = [
+            dict(por_nome[r["tabela"]], colunas=r["colunas"], acertos=r.get("acertos")) for r in resultados
+        ]
+        caminho_gpkg = os.path.join(pasta, f"{esquema}.gpkg")
+        if os.path.exists(caminho_gpkg):
+            os.remove(caminho_gpkg)
+        t = time.perf_counter()
+        exportar_geopackage(conexoes, caminho_gpkg, aoi, selecionadas, log=silencioso, desempenho=desempenho)
+        etapas["exportacao"] = time.perf_counter() - t
+    etapas["total"] = time.perf_counter() - inicio
+
+    # Somas das medições por tabela (tempo no servidor, linhas lidas e bytes) por etapa
+    for etapa in ("diagnostico", "exportacao"):
+        linhas = [l for l in desempenho.linhas if l["etapa"] == etapa]
+        if linhas:
+            etapas[f"{etapa}_servidor"] = sum(l["tempo_servidor"] or 0 for l in linhas)
+    feicoes = sum(r["count"] for r in resultados)
+    linhas_lidas = sum(l["linhas_lidas"] or 0 for l in desempenho.linhas if l["etapa"] == "diagnostico")
+    bytes_exportados = sum(l["bytes"] or 0 for l in desempenho.linhas if l["etapa"] == "exportacao")
+    return etapas, {"camadas": len(camadas), "feicoes": feicoes, "falhas": len(falhas),
+                    "linhas_lidas": linhas_lidas, "bytes_exportados": bytes_exportados}
+
+
+def executar(credenciais, args):
+    conexoes = PoolConexoes(credenciais, args.workers)
+    pasta = tempfile.mkdtemp(prefix="diglet_bench_")
+    resultados = {}
+    try:
+        postgres, postgis = versoes_servidor(conexoes)
+        caminhos_aoi = {nome: gravar_aoi(os.path.join(pasta, f"{nome}.geojson"), AOIS[nome]) for nome in args.aois}
+        for nome in args.cenarios:
+            with conexoes.conexao() as conn:
+                esquema = criar_cenario(conn, nome, CENARIOS[nome], escala=args.escala, log=log)
+            for nome_aoi, caminho_aoi in caminhos_aoi.items():
+                rodadas = []
+                for _ in range(args.repeticoes):
+                    rodadas.append(medir(conexoes, esquema, caminho_aoi, pasta, args))
+                etapas = {
+                    etapa: round(statistics.median(r[0][etapa] for r in rodadas), 4)
+                    for etapa in rodadas[0][0]
+                }
+                chave = f"{nome}|{nome_aoi}"
+                resultados[chave] = {"etapas": etapas, "minimo_total": round(min(r[0]["total"] for r in rodadas), 4),
+                                     **rodadas[-1][1]}
+                log(f"[Bench] {chave}: total {etapas['total']:.2f}s (diagnóstico {etapas['diagnostico']:.2f}s"
+                    + (f", exportação {etapas['exportacao']:.2f}s" if "exportacao" in etapas else "")
+                    + f"), {rodadas[-1][1]['feicoes']} feições")
+    finally:
+        conexoes.fechar()
+        shutil.rmtree(pasta, ignore_errors=True)
+    return {
+        "formato": VERSAO_FORMATO,
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "codigo": versao_codigo(),
+        "ambiente": {"python": platform.python_version(), "sistema": platform.platform(),
+                     "postgres": postgres, "postgis": postgis},
+        "parametros": {"workers": args.workers, "lote": args.lote, "escala": args.escala,
+                       "repeticoes": args.repeticoes, "exportacao": not args.sem_exportacao},
+        "resultados": resultados,
+    }
+
+
+def comparar(atual, anterior, tolerancia):
+    # Compara as medianas etapa a etapa; retorna as combinações que ficaram mais lentas que
+    # a linha de base além da tolerância (fração, ex.: 0.10 = 10%)
+    if atual["parametros"] != anterior.get("parametros"):
+        log(f"[Aviso] Parâmetros diferentes da linha de base: {anterior.get('parametros')}")
+    regressoes = []
+    for chave, r in atual["resultados"].items():
+        base = anterior.get("resultados", {}).get(chave)
+        if base is None:
+            log(f"[Comparação] {chave}: sem linha de base")
+            continue
+        for etapa, tempo in r["etapas"].items():
+            antes = base["etapas"].get(etapa)
+            if not antes:
+                continue
+            variacao = tempo / antes - 1
+            marca = ""
+            if variacao > tolerancia:
+                marca = "  <-- mais lento"
+                regressoes.append((chave, etapa, variacao))
+            log(f"[Comparação] {chave} {etapa}: {antes:.3f}s -> {tempo:.3f}s ({variacao:+.1%}){marca}")
+        if base.get("feicoes") != r["feicoes"]:
+            log(f"[Aviso] {chave}: {base.get('feicoes')} feições na linha de base, {r['feicoes']} agora")
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do diagnóstico e da exportação DIGLET com dados sintéticos.")
+    origem = parser.add_mutually_exclusive_group(required=True)
+    origem.add_argument("--credenciais", help="JSON com host, port, dbname, user e password de um servidor com PostGIS")
+    origem.add_argument("--initdb", action="store_true", help="Cria uma instância temporária com initdb")
+    parser.add_argument("--pg-bin", help="Pasta com initdb e pg_ctl (padrão: PATH)")
+    parser.add_argument("--cenarios", nargs="+", choices=list(CENARIOS), default=list(CENARIOS))
+    parser.add_argument("--aois", nargs="+", choices=list(AOIS), default=list(AOIS))
+    parser.add_argument("--escala", type=float, default=1.0, help="Multiplica o número de linhas de cada cenário")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Rodadas por combinação (vale a mediana)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lote", action="store_true", help="Diagnóstico em lote (uma ida ao servidor por conexão)")
+    parser.add_argument("--sem-exportacao", action="store_true", help="Mede só o diagnóstico")
+    parser.add_argument("--saida", default="benchmark_diglet.json", help="JSON com os resultados")
+    parser.add_argument("--comparar", metavar="LINHA_DE_BASE", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--tolerancia", type=float, default=0.10,
+                        help="Variação aceita antes de apontar uma regressão (padrão: 0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    if args.initdb:
+        with instancia_temporaria(args.pg_bin, log=log) as credenciais:
+            with banco_descartavel(credenciais, log=log) as banco:
+                relatorio = executar(banco, args)
+    else:
+        with open(args.credenciais, "r", encoding="utf-8") as f:
+            dados = json.load(f)
+        credenciais = {k: str(dados[k]) for k in ("host", "port", "dbname", "user", "password")}
+        with banco_descartavel(credenciais, log=log) as banco:
+            relatorio = executar(banco, args)
+
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    log(f"[Export] Resultados salvos em: {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            anterior = json.load(f)
+        regressoes = comparar(relatorio, anterior, args.tolerancia)
+        if regressoes:
+            log(f"[Aviso] {len(regressoes)} etapa(s) mais lenta(s) que a linha de base")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import psycopg2
+from psycopg2 import sql
+import geopandas as gpd
+import shapely
+
+# Banco descartável com esquemas sintéticos para o benchmark. Todas as camadas ficam
+# espalhadas pela mesma região (EPSG:4674) e são geradas no servidor com semente fixa,
+# então o mesmo cenário produz sempre as mesmas feições.
+
+EXTENSAO = (-50.0, -20.0, -40.0, -10.0)
+
+# Cada cenário vira um esquema "bench_<nome>". vertices = 1 gera pontos; acima disso,
+# polígonos com aproximadamente esse número de vértices.
+CENARIOS = {
+    "poucas_tabelas": {"tabelas": 5, "linhas": 20000, "vertices": 32, "indice": True, "zm": False},
+    "muitas_tabelas": {"tabelas": 200, "linhas": 500, "vertices": 32, "indice": True, "zm": False},
+    "muitas_linhas": {"tabelas": 3, "linhas": 500000, "vertices": 16, "indice": True, "zm": False},
+    "geometria_complexa": {"tabelas": 3, "linhas": 20000, "vertices": 1024, "indice": True, "zm": False},
+    "pontos": {"tabelas": 5, "linhas": 200000, "vertices": 1, "indice": True, "zm": False},
+    "sem_indice": {"tabelas": 5, "linhas": 20000, "vertices": 32, "indice": False, "zm": False},
+    "zm": {"tabelas": 5, "linhas": 20000, "vertices": 32, "indice": True, "zm": True},
+}
+
+# AOIs gravadas em GeoJSON: do retângulo simples ao multipolígono com cerca de cem mil vértices
+AOIS = {
+    "retangulo": {"partes": 1, "vertices": 4},
+    "multipoligono_medio": {"partes": 20, "vertices": 200},
+    "multipoligono_denso": {"partes": 60, "vertices": 2000},
+}
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def instancia_temporaria(pasta_bin=None, log=print):
+    # Cluster criado com initdb numa pasta temporária e removido ao final. O PostGIS
+    # precisa estar instalado para os binários usados (pasta_bin ou os do PATH).
+    def executavel(nome):
+        return os.path.join(pasta_bin, nome) if pasta_bin else nome
+
+    pasta = tempfile.mkdtemp(prefix="diglet_pg_")
+    dados = os.path.join(pasta, "dados")
+    porta = porta_livre()
+    opcoes = f"-p {porta} -c listen_addresses=localhost -c fsync=off"
+    if os.name != "nt":
+        opcoes += f" -c unix_socket_directories='{pasta}'"
+    try:
+        subprocess.run([executavel("initdb"), "-D", dados, "-U", "postgres", "-A", "trust", "-E", "UTF8"],
+                       check=True, capture_output=True)
+        subprocess.run([executavel("pg_ctl"), "-D", dados, "-o", opcoes, "-l", os.path.join(pasta, "postgres.log"),
+                        "-w", "start"], check=True, capture_output=True)
+        log(f"[Bench] Instância temporária em localhost:{porta}")
+        try:
+            yield {"host": "localhost", "port": str(porta), "dbname": "postgres", "user": "postgres", "password": ""}
+        finally:
+            subprocess.run([executavel("pg_ctl"), "-D", dados, "-m", "fast", "-w", "stop"], capture_output=True)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+@contextmanager
+def banco_descartavel(credenciais, log=print):
+    # Cria um banco próprio no servidor indicado (com PostGIS) e o remove ao final
+    nome = f"diglet_bench_{os.getpid()}_{int(time.time())}"
+    conn = psycopg2.connect(**credenciais)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(nome)))
+        log(f"[Bench] Banco descartável '{nome}' criado")
+        try:
+            banco = dict(credenciais, dbname=nome)
+            with psycopg2.connect(**banco) as novo:
+                with novo.cursor() as cur:
+                    cur.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+            novo.close()
+            yield banco
+        finally:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(nome)))
+            log(f"[Bench] Banco '{nome}' removido")
+    finally:
+        conn.close()
+
+
+def geometria_sintetica(cenario):
+    # Expressão SQL de cada feição: ponto aleatório na extensão ou um buffer em volta dele.
+    # ST_Buffer com quad_segs = k gera 4k vértices no contorno.
+    xmin, ymin, xmax, ymax = EXTENSAO
+    ponto = sql.SQL("ST_SetSRID(ST_MakePoint({} + random() * {}, {} + random() * {}), 4674)").format(
+        sql.Literal(xmin), sql.Literal(xmax - xmin), sql.Literal(ymin), sql.Literal(ymax - ymin)
+    )
+    if cenario["vertices"] <= 1:
+        geom, tipo = ponto, "Point"
+    else:
+        geom = sql.SQL("ST_Buffer({}, 0.01 + random() * 0.04, {})").format(
+            ponto, sql.Literal(f"quad_segs={max(1, cenario['vertices'] // 4)}")
+        )
+        tipo = "Polygon"
+    if cenario["zm"]:
+        geom, tipo = sql.SQL("ST_Force4D({})").format(geom), tipo + "ZM"
+    return geom, tipo
+
+
+def criar_cenario(conn, nome, cenario, escala=1.0, log=print):
+    # Esquema bench_<nome> com as tabelas do cenário; escala multiplica o número de linhas
+    esquema = f"bench_{nome}"
+    linhas = max(1, int(cenario["linhas"] * escala))
+    geom, tipo = geometria_sintetica(cenario)
+    inicio = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(esquema)))
+        cur.execute(sql.SQL("CREATE SCHEMA {}").format(sql.Identifier(esquema)))
+        for n in range(cenario["tabelas"]):
+            tabela = sql.Identifier(esquema, f"camada_{n:03d}")
+            cur.execute("SELECT setseed(%s)", (((n + 1) % 1000) / 1000,))
+            cur.execute(sql.SQL("""
+                CREATE TABLE {tabela} (
+                    id serial PRIMARY KEY,
+                    classe text,
+                    valor double precision,
+                    geom geometry({tipo}, 4674)
+                )
+            """).format(tabela=tabela, tipo=sql.SQL(tipo)))
+            cur.execute(sql.SQL("""
+                INSERT INTO {tabela} (classe, valor, geom)
+                SELECT 'classe_' || (g % 7), round((random() * 1000)::numeric, 2), {geom}
+                FROM generate_series(1, {linhas}) g
+            """).format(tabela=tabela, geom=geom, linhas=sql.Literal(linhas)))
+            if cenario["indice"]:
+                cur.execute(sql.SQL("CREATE INDEX ON {} USING gist (geom)").format(tabela))
+            cur.execute(sql.SQL("ANALYZE {}").format(tabela))
+    conn.commit()
+    log(f"[Bench] Esquema '{esquema}': {cenario['tabelas']} tabelas x {linhas} linhas "
+        f"({tipo}) em {time.perf_counter() - inicio:.1f}s")
+    return esquema
+
+
+def gravar_aoi(caminho, aoi, semente=42):
+    # Partes circulares espalhadas pelo centro da extensão; com uma parte e 4 vértices, um retângulo
+    xmin, ymin, xmax, ymax = EXTENSAO
+    cx, cy = (xmin + xmax) / 2, (ymin + ymax) / 2
+    if aoi["partes"] == 1 and aoi["vertices"] <= 4:
+        geometrias = [shapely.box(cx - 1, cy - 1, cx + 1, cy + 1)]
+    else:
+        aleatorio = np.random.RandomState(semente)
+        centros = shapely.points(aleatorio.uniform(cx - 2, cx + 2, aoi["partes"]),
+                                 aleatorio.uniform(cy - 2, cy + 2, aoi["partes"]))
+        # A união mantém a AOI válida quando as partes se sobrepõem
+        geometrias = [shapely.union_all(shapely.buffer(centros, 0.15, quad_segs=max(1, aoi["vertices"] // 4)))]
+    gpd.GeoDataFrame(geometry=geometrias, crs=4674).to_file(caminho, driver="GeoJSON")
+    return caminho
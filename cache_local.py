@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def diretorio_cache():
+    # DIGLET_CACHE permite apontar o cache para outro local (ex.: disco de rede ou testes)
+    caminho = os.environ.get("DIGLET_CACHE") or os.path.join(os.path.expanduser("~"), ".diglet")
+    os.makedirs(caminho, exist_ok=True)
+    return caminho
+
+
+def chave_conexao(credenciais):
+    # Identifica o banco sem guardar a senha
+    return f"{credenciais.get('user')}@{credenciais.get('host')}:{credenciais.get('port')}/{credenciais.get('dbname')}"
+
+
+class ArquivoJson:
+    # Dicionário persistido em JSON; a gravação é atômica para não corromper o cache
+    # se o programa for encerrado no meio da escrita. O arquivo só é lido no primeiro
+    # acesso a dados, para que criar o cache não pese na abertura do programa.
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._carga = threading.Lock()
+        self._dados = None
+
+    @property
+    def dados(self):
+        if self._dados is None:
+            with self._carga:
+                if self._dados is None:
+                    try:
+                        with open(self.caminho, "r", encoding="utf-8") as f:
+                            self._dados = json.load(f)
+                    except (OSError, ValueError):
+                        self._dados = {}
+        return self._dados
+
+    def salvar(self):
+        temporario = self.caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(self.dados, f, ensure_ascii=False, default=str)
+        os.replace(temporario, self.caminho)
+
+
+class CacheMetadados(ArquivoJson):
+    # Por conexão e esquema: marcadores de alteração das relações e metadados das camadas
+    # (coluna geométrica, SRID, tipo, linhas estimadas e extensão estimada em EPSG:4674)
+    def __init__(self, caminho=None):
+        super().__init__(caminho or os.path.join(diretorio_cache(), "metadados.json"))
+
+    def obter(self, chave, esquema):
+        with self._lock:
+            return self.dados.get(chave, {}).get(esquema)
+
+    def gravar(self, chave, esquema, entrada):
+        with self._lock:
+            self.dados.setdefault(chave, {})[esquema] = entrada
+            self.salvar()
+
+
+class CacheResultados(ArquivoJson):
+    # Contagem e amostras por (conexão, esquema, tabela, AOI), válidas enquanto o marcador
+    # de alteração da tabela não mudar. As entradas mais antigas saem primeiro.
+    LIMITE_ENTRADAS = 20000
+
+    def __init__(self, caminho=None):
+        super().__init__(caminho or os.path.join(diretorio_cache(), "resultados.json"))
+
+    @staticmethod
+    def chave(conexao, esquema, tabela, aoi_hash, versao):
+        return f"{conexao}|{esquema}|{tabela}|{aoi_hash}|{versao}"
+
+    def obter(self, chave, marcador):
+        with self._lock:
+            entrada = self.dados.get(chave)
+        if entrada and entrada["marcador"] == marcador:
+            return entrada["resultado"]
+        return None
+
+    def gravar(self, novos):
+        # novos: {chave: (marcador, resultado)}
+        if not novos:
+            return
+        with self._lock:
+            for chave, (marcador, resultado) in novos.items():
+                self.dados.pop(chave, None)
+                self.dados[chave] = {"marcador": marcador, "resultado": resultado}
+            excesso = len(self.dados) - self.LIMITE_ENTRADAS
+            for chave in list(self.dados)[:max(excesso, 0)]:
+                del self.dados[chave]
+            self.salvar()
+
+
+class CacheFeicoes(ArquivoJson):
+    # Feições já exportadas, num GeoPackage por (conexão, esquema, tabela) na pasta
+    # "feicoes": camada "feicoes" (com índice espacial R-tree) e camada "cobertura", a área
+    # em EPSG:4674 cujas feições estão todas no arquivo. O índice guarda, por arquivo, o
+    # marcador de alteração da tabela, as colunas, o tamanho e o último acesso; acima do
+    # limite, os arquivos usados há mais tempo são apagados.
+    LIMITE_MB = 2048
+
+    def __init__(self, caminho=None, limite_mb=None):
+        super().__init__(caminho or os.path.join(diretorio_cache(), "feicoes.json"))
+        self.pasta = os.path.join(os.path.dirname(self.caminho), "feicoes")
+        os.makedirs(self.pasta, exist_ok=True)
+        self.limite = (limite_mb or self.LIMITE_MB) * 1024 * 1024
+
+    @staticmethod
+    def chave(conexao, esquema, tabela):
+        return f"{conexao}|{esquema}|{tabela}"
+
+    def arquivo(self, chave):
+        return os.path.join(self.pasta, hashlib.sha1(chave.encode("utf-8")).hexdigest() + ".gpkg")
+
+    def obter(self, chave, marcador):
+        # Entrada válida para o marcador atual (marcando o acesso) ou None; uma entrada
+        # desatualizada é apagada junto com o arquivo
+        with self._lock:
+            entrada = self.dados.get(chave)
+            if entrada is None:
+                return None
+            if entrada["marcador"] != marcador or not os.path.exists(self.arquivo(chave)):
+                self._remover(chave)
+                self.salvar()
+                return None
+            entrada["acesso"] = time.time()
+            return dict(entrada)
+
+    def gravar(self, chave, entrada):
+        # Registra o arquivo já escrito e aplica o limite de tamanho (menos recentes primeiro)
+        with self._lock:
+            self.dados.pop(chave, None)
+            self.dados[chave] = dict(entrada, bytes=os.path.getsize(self.arquivo(chave)), acesso=time.time())
+            total = sum(e["bytes"] for e in self.dados.values())
+            for antiga in sorted(self.dados, key=lambda c: self.dados[c]["acesso"]):
+                if total <= self.limite:
+                    break
+                total -= self.dados[antiga]["bytes"]
+                self._remover(antiga)
+            self.salvar()
+
+    def descartar(self, chave):
+        with self._lock:
+            self._remover(chave)
+            self.salvar()
+
+    def _remover(self, chave):
+        self.dados.pop(chave, None)
+        for sufixo in ("", "-wal", "-shm", "-journal"):
+            try:
+                os.remove(self.arquivo(chave) + sufixo)
+            except OSError:
+                pass
@@ -0,0 +1,21 @@
+import importlib
+import time
+
+# Módulos pesados usados pelo motor, na ordem em que convém importá-los: o tempo de cada
+# um inclui só as dependências que os anteriores ainda não tinham carregado.
+MODULOS_PESADOS = ("numpy", "psycopg2", "pandas", "shapely", "pyproj", "pyogrio", "geopandas", "motor_intersecao")
+
+
+def carregar_modulos(modulos=MODULOS_PESADOS):
+    # Importa os módulos e retorna [(nome, segundos)]; módulos já carregados contam ~0 e os
+    # ausentes (ex.: pyogrio quando o geopandas usa o fiona) ficam com None
+    tempos = []
+    for nome in modulos:
+        inicio = time.perf_counter()
+        try:
+            importlib.import_module(nome)
+        except ImportError:
+            tempos.append((nome, None))
+            continue
+        tempos.append((nome, time.perf_counter() - inicio))
+    return tempos
@@ -0,0 +1,223 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+INICIO = time.perf_counter()
+
+from cache_local import CacheMetadados, CacheResultados, CacheFeicoes, chave_conexao
+from carregamento import carregar_modulos
+
+# Execução em lote sem interface gráfica: cada AOI é cruzada com cada esquema usando o
+# mesmo motor da janela e um único pool de conexões aberto do início ao fim.
+#
+#   python diglet_lote.py --credenciais credenciais.json --aoi "aois/*.geojson" \
+#       --esquemas base_a base_b --workers 8 --saida resultados --gpkg
+#
+# Com --banco-inteiro, todas as camadas de todos os esquemas formam um único grupo ("banco").
+# O motor (geopandas, pandas, shapely, psycopg2) só é importado depois de validados os
+# argumentos, as credenciais e as AOIs, então erros de uso aparecem sem essa espera.
+
+
+def log(msg):
+    print(msg, flush=True)
+
+
+def ler_credenciais(caminho):
+    with open(caminho, "r", encoding="utf-8") as f:
+        dados = json.load(f)
+    chaves = {"host", "port", "dbname", "user", "password"}
+    if not chaves.issubset(dados.keys()):
+        raise ValueError(f"Arquivo de credenciais inválido ou incompleto: {caminho}")
+    return {
+        "host": dados["host"],
+        "port": str(dados["port"]),
+        "dbname": dados["dbname"],
+        "user": dados["user"],
+        "password": dados["password"]
+    }
+
+
+def expandir_aois(padroes):
+    # Os padrões são expandidos aqui porque o shell do Windows não expande curingas
+    caminhos = []
+    for padrao in padroes:
+        encontrados = sorted(glob.glob(padrao)) if glob.has_magic(padrao) else [padrao]
+        if not encontrados:
+            log(f"[Aviso] Nenhuma AOI encontrada para '{padrao}'")
+        caminhos.extend(encontrados)
+    return list(dict.fromkeys(caminhos))
+
+
+def processar_aoi(conexoes, caminho_aoi, camadas_por_grupo, args, chave, cache_resultados, cache_feicoes):
+    from motor_intersecao import (
+        AreaInteresse, RegistroDesempenho, executar_intersecoes, exportar_geopackage, exportar_geoparquet,
+        gravar_csv_diagnostico, calcular_metricas, gravar_csv_metricas, calcular_matriz, gravar_csv_matriz,
+        capturar_planos, gravar_relatorio_desempenho
+    )
+    nome = os.path.splitext(os.path.basename(caminho_aoi))[0]
+    pasta = os.path.join(args.saida, nome)
+    os.makedirs(pasta, exist_ok=True)
+    aoi = AreaInteresse.ler(caminho_aoi)
+    falhas_aoi = []
+    for esquema, camadas in camadas_por_grupo.items():
+        inicio = time.monotonic()
+        desempenho = RegistroDesempenho() if args.desempenho else None
+        resultados, falhas, ignoradas, esgotadas = executar_intersecoes(
+            conexoes, camadas, aoi, workers=args.workers, log=log,
+            cache=cache_resultados, chave=chave, registrar=args.gpkg or args.parquet, em_lote=args.lote,
+            tempo_limite=args.tempo_limite, aproximar=args.aproximar, desempenho=desempenho
+        )
+        if desempenho is not None and args.explicar:
+            capturar_planos(conexoes, camadas, aoi, desempenho, args.explicar, log=log,
+                            tempo_limite=args.tempo_limite)
+        falhas_aoi.extend(t if args.banco_inteiro else f"{esquema}.{t}" for t in esgotadas)
+        falhas_aoi.extend(t if args.banco_inteiro else f"{esquema}.{t}" for t in falhas)
+        caminho_csv = os.path.join(pasta, f"{nome}_{esquema}_diagnostico.csv")
+        gravar_csv_diagnostico(caminho_csv, resultados)
+        log(f"[Resumo] {nome} x {esquema}: {len(resultados)} camadas com interseção, "
+            f"{len(falhas)} com erro, {len(esgotadas)} fora do tempo, {len(ignoradas)} ignoradas ({time.monotonic() - inicio:.1f}s)")
+        log(f"[Export] Diagnóstico salvo em: {caminho_csv}")
+
+        por_nome = {c["nome"]: c for c in camadas}
+        selecionadas = [
+            dict(por_nome[r["tabela"]], colunas=r["colunas"], acertos=r.get("acertos"))
+            for r in resultados
+        ]
+        if args.metricas and selecionadas:
+            linhas, falhas_metricas = calcular_metricas(conexoes, selecionadas, aoi, campo_grupo=args.agrupar,
+                                                        workers=args.workers, log=log)
+            falhas_aoi.extend(t if args.banco_inteiro else f"{esquema}.{t}" for t in falhas_metricas)
+            caminho_metricas = os.path.join(pasta, f"{nome}_{esquema}_metricas.csv")
+            gravar_csv_metricas(caminho_metricas, linhas, args.agrupar)
+            log(f"[Export] Métricas salvas em: {caminho_metricas}")
+
+        if args.matriz and selecionadas:
+            ids, matriz, falhas_matriz = calcular_matriz(conexoes, selecionadas, aoi, campo_id=args.campo_id,
+                                                         workers=args.workers, log=log)
+            falhas_aoi.extend(t if args.banco_inteiro else f"{esquema}.{t}" for t in falhas_matriz)
+            caminho_matriz = os.path.join(pasta, f"{nome}_{esquema}_matriz.csv")
+            gravar_csv_matriz(caminho_matriz, ids, matriz, args.campo_id)
+            log(f"[Export] Matriz salva em: {caminho_matriz}")
+
+        if args.gpkg and selecionadas:
+            caminho_gpkg = os.path.join(pasta, f"{nome}_{esquema}.gpkg")
+            exportar_geopackage(conexoes, caminho_gpkg, aoi, selecionadas, log=log, recortar=args.recortar,
+                                tolerancia=args.simplificar, casas_decimais=args.casas_decimais,
+                                desempenho=desempenho, cache_feicoes=cache_feicoes, chave=chave)
+            log(f"[Export] GeoPackage salvo em: {caminho_gpkg}")
+
+        if args.parquet and selecionadas:
+            pasta_parquet = os.path.join(pasta, f"{nome}_{esquema}_parquet")
+            exportar_geoparquet(conexoes, pasta_parquet, aoi, selecionadas, log=log, recortar=args.recortar,
+                                tolerancia=args.simplificar, casas_decimais=args.casas_decimais,
+                                desempenho=desempenho)
+            log(f"[Export] GeoParquet salvo em: {pasta_parquet}")
+
+        if desempenho is not None:
+            for extensao in ("json", "csv"):
+                caminho_desempenho = os.path.join(pasta, f"{nome}_{esquema}_desempenho.{extensao}")
+                gravar_relatorio_desempenho(caminho_desempenho, desempenho)
+            log(f"[Export] Relatório de desempenho salvo em: {os.path.splitext(caminho_desempenho)[0]}.json/.csv")
+    return falhas_aoi
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Diagnóstico DIGLET em lote: várias AOIs contra vários esquemas, sem interface gráfica."
+    )
+    parser.add_argument("--credenciais", required=True, help="JSON com host, port, dbname, user e password")
+    parser.add_argument("--aoi", required=True, nargs="+", help="Arquivos GeoJSON ou padrões (ex.: 'aois/*.geojson')")
+    alvo = parser.add_mutually_exclusive_group(required=True)
+    alvo.add_argument("--esquemas", nargs="+", help="Esquemas a consultar")
+    alvo.add_argument("--banco-inteiro", action="store_true", help="Consulta as camadas de todos os esquemas")
+    parser.add_argument("--saida", default="resultados_diglet", help="Pasta de saída (uma subpasta por AOI)")
+    parser.add_argument("--workers", type=int, default=4, help="Consultas simultâneas (tamanho do pool de conexões)")
+    parser.add_argument("--gpkg", action="store_true", help="Exporta também um GeoPackage por AOI e esquema")
+    parser.add_argument("--parquet", action="store_true",
+                        help="Exporta também uma pasta por AOI e esquema com um GeoParquet por camada")
+    parser.add_argument("--recortar", action="store_true",
+                        help="No GeoPackage e no GeoParquet, recorta as feições pela AOI no servidor")
+    parser.add_argument("--simplificar", type=float, metavar="TOLERANCIA",
+                        help="No GeoPackage e no GeoParquet, simplifica as geometrias (unidades do SRID de cada camada)")
+    parser.add_argument("--casas-decimais", type=int, metavar="N",
+                        help="No GeoPackage e no GeoParquet, quantiza as coordenadas mantendo N casas decimais")
+    parser.add_argument("--metricas", action="store_true",
+                        help="Grava também a área, o comprimento e o %% da AOI por camada, calculados no servidor")
+    parser.add_argument("--agrupar", help="Campo para agrupar as métricas (ex.: classe)")
+    parser.add_argument("--matriz", action="store_true",
+                        help="Grava também a matriz feição da AOI x camada com o número de feições que se cruzam")
+    parser.add_argument("--campo-id", help="Campo da AOI que identifica cada feição na matriz (padrão: posição no arquivo)")
+    parser.add_argument("--lote", action="store_true",
+                        help="Consulta as tabelas em lote (uma ida ao servidor por conexão)")
+    parser.add_argument("--tempo-limite", type=float, metavar="SEGUNDOS",
+                        help="Tempo máximo de consulta por tabela (statement_timeout)")
+    parser.add_argument("--aproximar", action="store_true",
+                        help="Conta pelo retângulo envolvente as tabelas que excederem o tempo limite")
+    parser.add_argument("--desempenho", action="store_true",
+                        help="Grava o relatório de desempenho (tempos, linhas lidas e bytes por tabela) em JSON e CSV")
+    parser.add_argument("--explicar", type=int, default=0, metavar="N",
+                        help="Guarda o EXPLAIN (ANALYZE, BUFFERS) das N tabelas mais lentas no relatório de "
+                             "desempenho (implica --desempenho)")
+    parser.add_argument("--cache-feicoes", action="store_true",
+                        help="No GeoPackage, reaproveita as feições já exportadas guardadas no cache local")
+    parser.add_argument("--limite-cache-feicoes", type=float, metavar="MB",
+                        help=f"Tamanho máximo do cache de feições (padrão: {CacheFeicoes.LIMITE_MB} MB)")
+    parser.add_argument("--perfil-inicio", action="store_true",
+                        help="Mostra quanto tempo levou a importação de cada módulo pesado")
+    parser.add_argument("--sem-cache", action="store_true", help="Ignora os caches locais de metadados, resultados e feições")
+    args = parser.parse_args(argv)
+    # Os planos só têm onde ficar no relatório de desempenho
+    if args.explicar:
+        args.desempenho = True
+
+    credenciais = ler_credenciais(args.credenciais)
+    aois = expandir_aois(args.aoi)
+    if not aois:
+        log("[Erro] Nenhuma AOI para processar")
+        return 2
+    chave = chave_conexao(credenciais)
+    cache_metadados = None if args.sem_cache else CacheMetadados()
+    cache_resultados = None if args.sem_cache else CacheResultados()
+    cache_feicoes = CacheFeicoes(limite_mb=args.limite_cache_feicoes) if args.cache_feicoes and not args.sem_cache else None
+    if args.perfil_inicio:
+        log(f"[Início] argumentos e AOIs validados em {time.perf_counter() - INICIO:.3f}s")
+        for modulo, segundos in carregar_modulos():
+            log(f"[Início]   import {modulo}: " + ("não encontrado" if segundos is None else f"{segundos:.3f}s"))
+    from motor_intersecao import PoolConexoes, listar_camadas, listar_camadas_banco
+
+    conexoes = PoolConexoes(credenciais, args.workers)
+    houve_erro = False
+    try:
+        camadas_por_grupo = {}
+        with conexoes.conexao() as conn:
+            if args.banco_inteiro:
+                camadas_por_grupo["banco"] = listar_camadas_banco(conn, cache=cache_metadados,
+                                                                  chave=chave, log=log)
+                log(f"[Tabelas] Banco inteiro: {len(camadas_por_grupo['banco'])} camadas")
+            for esquema in args.esquemas or []:
+                camadas_por_grupo[esquema] = listar_camadas(conn, esquema, cache=cache_metadados,
+                                                            chave=chave, log=log)
+                log(f"[Tabelas] Esquema '{esquema}': {len(camadas_por_grupo[esquema])} camadas")
+
+        for n, caminho_aoi in enumerate(aois, start=1):
+            log(f"[AOI] ({n}/{len(aois)}) {caminho_aoi}")
+            try:
+                falhas = processar_aoi(conexoes, caminho_aoi, camadas_por_grupo, args, chave, cache_resultados,
+                                       cache_feicoes)
+            except Exception as e:
+                log(f"[Erro] Falha ao processar AOI '{caminho_aoi}': {e}")
+                houve_erro = True
+                continue
+            if falhas:
+                log(f"[Aviso] Tabelas com erro de interseção: {falhas}")
+                houve_erro = True
+    finally:
+        conexoes.fechar()
+    return 1 if houve_erro else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,552 +1,1070 @@
-import sys
-import json
-import psycopg2
-import geopandas as gpd
-from PyQt6.QtWidgets import (
-    QApplication, QDialog, QVBoxLayout, QLabel, QLineEdit,
-    QPushButton, QMessageBox, QComboBox, QFileDialog,
-    QTabWidget, QWidget, QTreeWidget, QTreeWidgetItem,
-    QHBoxLayout, QFrame, QTextEdit
-)
-from shapely.geometry import mapping, shape
-from PyQt6.QtCore import Qt
-#COmnetário ~ivsfdn~ihvfn~kvfnmkç]fvs
-DARK_STYLE = """
-QWidget {
-    background-color: #232629;
-    color: #e0e0e0;
-    font-family: 'Segoe UI', Arial, sans-serif;
-    font-size: 10.5pt;
-}
-QLineEdit, QComboBox, QTreeWidget, QTabWidget, QTableWidget, QTextEdit {
-    background-color: #31363b;
-    color: #e0e0e0;
-    border: 1px solid #444;
-    border-radius: 4px;
-}
-QPushButton {
-    background-color: #3daee9;
-    color: #232629;
-    border: none;
-    border-radius: 4px;
-    padding: 6px 14px;
-    font-weight: bold;
-}
-QPushButton:hover {
-    background-color: #6cc7f7;
-}
-QPushButton:pressed {
-    background-color: #2d8abf;
-}
-QLabel {
-    color: #e0e0e0;
-}
-QTabBar::tab {
-    background: #31363b;
-    color: #e0e0e0;
-    padding: 8px;
-    border-top-left-radius: 6px;
-    border-top-right-radius: 6px;
-}
-QTabBar::tab:selected {
-    background: #3daee9;
-    color: #232629;
-}
-QTreeWidget::item:selected {
-    background: #3daee9;
-    color: #232629;
-}
-QMessageBox {
-    background-color: #232629;
-    color: #e0e0e0;
-}
-"""
-
-class AbaConexaoPostgre(QDialog):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Conexão e Consulta Espacial")
-        self.resize(600, 600)
-        self.setMinimumWidth(520)
-        # Adicione esta linha para garantir todos os botões da janela:
-        self.setWindowFlags(
-            Qt.WindowType.Window |
-            Qt.WindowType.WindowMinimizeButtonHint |
-            Qt.WindowType.WindowMaximizeButtonHint |
-            Qt.WindowType.WindowCloseButtonHint
-        )
-
-        self.conn = None
-        self.credenciais = {}
-        self.aoi_info = {}
-
-        self.tabs = QTabWidget()
-        self.setLayout(QVBoxLayout())
-        self.layout().addWidget(self.tabs)
-
-        # Abas
-        self.tab_input = QWidget()
-        self.tab_visualizacao = QWidget()
-
-        # Layout da aba de visualização
-        self.visualizacao_layout = QVBoxLayout(self.tab_visualizacao)
-        self.tab_visualizacao.setLayout(self.visualizacao_layout)
-
-        self.tree_resultados = QTreeWidget()
-        self.tree_resultados.setHeaderLabels(["Camada"])  # Removido "Campo"
-        self.visualizacao_layout.addWidget(self.tree_resultados)
-
-        botoes_visualizacao = QHBoxLayout()
-
-        self.diagnostico_btn = QPushButton("Diagnóstico")
-        self.diagnostico_btn.setMinimumHeight(32)
-        self.diagnostico_btn.setEnabled(False)
-        self.diagnostico_btn.clicked.connect(self.exportar_csv_diagnostico)
-
-        self.exportar_gpkg_btn = QPushButton("Exportar GeoPackage")
-        self.exportar_gpkg_btn.setMinimumHeight(32)
-        self.exportar_gpkg_btn.clicked.connect(self.exportar_geopackage_final)
-
-        botoes_visualizacao.addWidget(self.diagnostico_btn)
-        botoes_visualizacao.addWidget(self.exportar_gpkg_btn)
-        botoes_visualizacao.addStretch()
-
-        self.visualizacao_layout.addLayout(botoes_visualizacao)
-
-        self.tabs.addTab(self.tab_input, "Entrada")
-        self.tabs.addTab(self.tab_visualizacao, "Visualização")
-        self.tabs.setTabVisible(1, False)
-
-        # Layout da aba de entrada
-        self.input_layout = QVBoxLayout(self.tab_input)
-        self.tab_input.setLayout(self.input_layout)
-
-        # Título principal: DIGLET
-        titulo_diglet = QLabel("DIGLET")
-        titulo_diglet.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        titulo_diglet.setStyleSheet("""
-            font-size: 24pt;
-            font-weight: bold;
-            color: #3daee9;
-            margin-top: 12px;
-        """)
-
-        # Subtítulo: sigla por extenso
-        subtitulo = QLabel("Diagnóstico Interativo de Geoinformação e Levantamento Espacial Territorial")
-        subtitulo.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        subtitulo.setStyleSheet("""
-            font-size: 10.5pt;
-            color: #e0e0e0;
-            margin-bottom: 12px;
-        """)
-
-        # Adiciona ao layout
-        self.input_layout.addWidget(titulo_diglet)
-        self.input_layout.addWidget(subtitulo)
-
-        # Entradas de conexão em grid compacto
-        grid = QHBoxLayout()
-        self.host_input = QLineEdit(); self.host_input.setPlaceholderText("Host")
-        self.port_input = QLineEdit(); self.port_input.setPlaceholderText("Porta"); self.port_input.setText("5432")
-        self.db_input = QLineEdit(); self.db_input.setPlaceholderText("Banco")
-        self.user_input = QLineEdit(); self.user_input.setPlaceholderText("Usuário")
-        self.pass_input = QLineEdit(); self.pass_input.setPlaceholderText("Senha"); self.pass_input.setEchoMode(QLineEdit.EchoMode.Password)
-        for w in [self.host_input, self.port_input, self.db_input, self.user_input, self.pass_input]:
-            w.setMaximumWidth(120)
-            grid.addWidget(w)
-        self.input_layout.addLayout(grid)
-
-        # Botões de importação/exportação JSON em linha
-        btns_json = QHBoxLayout()
-        self.importar_json_btn = QPushButton("Importar JSON")
-        self.importar_json_btn.setToolTip("Importar credenciais do arquivo JSON")
-        self.importar_json_btn.clicked.connect(self.importar_credenciais_json)
-        self.exportar_json_btn = QPushButton("Exportar JSON")
-        self.exportar_json_btn.setToolTip("Exportar credenciais para arquivo JSON")
-        self.exportar_json_btn.clicked.connect(self.exportar_credenciais_json)
-        btns_json.addWidget(self.importar_json_btn)
-        btns_json.addWidget(self.exportar_json_btn)
-        btns_json.addStretch()
-        self.input_layout.addLayout(btns_json)
-
-        # Botão de conexão
-        self.connect_button = QPushButton("Conectar")
-        self.connect_button.setMinimumHeight(28)
-        self.connect_button.clicked.connect(self.conectar_banco)
-        self.input_layout.addWidget(self.connect_button)
-
-        # Linha separadora
-        self.input_layout.addWidget(self._linha())
-
-        # ComboBox de esquemas (mais larga)
-        schema_row = QHBoxLayout()
-        self.schema_label = QLabel("Esquema:")
-        self.schema_combo = QComboBox()
-        self.schema_combo.setMinimumWidth(350)
-        self.schema_combo.setSizePolicy(self.schema_combo.sizePolicy().horizontalPolicy(), self.schema_combo.sizePolicy().verticalPolicy())
-        self.schema_combo.setEnabled(False)
-        schema_row.addWidget(self.schema_label)
-        schema_row.addWidget(self.schema_combo, stretch=1)
-        self.input_layout.addLayout(schema_row)
-
-        # Seletor de GeoJSON
-        geo_row = QHBoxLayout()
-        self.geojson_label = QLabel("AOI (GeoJSON):")
-        self.geojson_input = QLineEdit(); self.geojson_input.setReadOnly(True)
-        self.geojson_btn = QPushButton("Selecionar")
-        self.geojson_btn.setMaximumWidth(90)
-        self.geojson_btn.clicked.connect(self.selecionar_geojson)
-        geo_row.addWidget(self.geojson_label)
-        geo_row.addWidget(self.geojson_input)
-        geo_row.addWidget(self.geojson_btn)
-        self.input_layout.addLayout(geo_row)
-
-        # Botões principais em linha
-        btns_main = QHBoxLayout()
-        self.buscar_tabelas_btn = QPushButton("Buscar Tabelas")
-        self.buscar_tabelas_btn.clicked.connect(self.listar_tabelas_do_esquema)
-        self.buscar_tabelas_btn.setEnabled(False)
-        self.executar_intersecoes_btn = QPushButton("Executar Intersecção")
-        self.executar_intersecoes_btn.clicked.connect(self.executar_st_intersect)
-        self.executar_intersecoes_btn.setEnabled(False)
-        for b in [self.buscar_tabelas_btn, self.executar_intersecoes_btn]:
-            b.setMinimumHeight(28)
-            btns_main.addWidget(b)
-        btns_main.addStretch()
-        self.input_layout.addLayout(btns_main)
-
-        # Log de operações
-        self.log_box = QTextEdit()
-        self.log_box.setReadOnly(True)
-        self.log_box.setMinimumHeight(110)
-        self.log_box.setStyleSheet("font-family: 'Consolas', 'Courier New', monospace; font-size: 10pt;")
-        self.input_layout.addWidget(self.log_box)
-
-        self.input_layout.addStretch()
-
-    def _linha(self):
-        line = QFrame()
-        line.setFrameShape(QFrame.Shape.HLine)
-        line.setFrameShadow(QFrame.Shadow.Sunken)
-        line.setStyleSheet("color: #444; margin: 8px 0;")
-        return line
-
-    def log(self, msg):
-        self.log_box.append(msg)
-        self.log_box.verticalScrollBar().setValue(self.log_box.verticalScrollBar().maximum())
-
-    def importar_credenciais_json(self):
-        caminho, _ = QFileDialog.getOpenFileName(self, "Selecionar arquivo JSON", "", "JSON (*.json)")
-        if not caminho:
-            return
-        try:
-            with open(caminho, 'r', encoding='utf-8') as f:
-                dados = json.load(f)
-            chaves = {"host", "port", "dbname", "user", "password"}
-            if not chaves.issubset(dados.keys()):
-                QMessageBox.warning(self, "Erro", "Arquivo JSON inválido ou incompleto.")
-                return
-            self.host_input.setText(dados["host"])
-            self.port_input.setText(str(dados["port"]))
-            self.db_input.setText(dados["dbname"])
-            self.user_input.setText(dados["user"])
-            self.pass_input.setText(dados["password"])
-            self.credenciais = {
-                "host": dados["host"],
-                "port": str(dados["port"]),
-                "dbname": dados["dbname"],
-                "user": dados["user"],
-                "password": dados["password"]
-            }
-            self.log(f"[Import] Credenciais carregadas: {self.credenciais}")
-        except Exception as e:
-            QMessageBox.critical(self, "Erro", f"Erro ao ler o JSON:\n{e}")
-
-    def exportar_credenciais_json(self):
-        dados = {
-            "host": self.host_input.text(),
-            "port": self.port_input.text(),
-            "dbname": self.db_input.text(),
-            "user": self.user_input.text(),
-            "password": self.pass_input.text()
-        }
-        caminho, _ = QFileDialog.getSaveFileName(self, "Salvar arquivo JSON", "", "JSON (*.json)")
-        if not caminho:
-            return
-        try:
-            with open(caminho, 'w', encoding='utf-8') as f:
-                json.dump(dados, f, indent=4, ensure_ascii=False)
-            QMessageBox.information(self, "Exportado", "Credenciais salvas com sucesso!")
-            self.log(f"[Export] Credenciais exportadas: {dados}")
-        except Exception as e:
-            QMessageBox.critical(self, "Erro", f"Erro ao salvar JSON:\n{e}")
-
-    def conectar_banco(self):
-        self.credenciais = {
-            "host": self.host_input.text(),
-            "port": self.port_input.text(),
-            "dbname": self.db_input.text(),
-            "user": self.user_input.text(),
-            "password": self.pass_input.text()
-        }
-        try:
-            self.conn = psycopg2.connect(**self.credenciais)
-            QMessageBox.information(self, "Conexão", "Conectado ao banco com sucesso!")
-            self.log(f"[Conexão] Credenciais: {self.credenciais}")
-            self.preencher_combobox_esquemas()
-        except Exception as e:
-            QMessageBox.critical(self, "Erro de Conexão", f"Erro ao conectar:\n{e}")
-            self.log(f"[Erro] Falha ao conectar: {e}")
-
-    def preencher_combobox_esquemas(self):
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT schema_name FROM information_schema.schemata;")
-            esquemas = [row[0] for row in cursor.fetchall()]
-            cursor.close()
-            ignorar = {"pg_catalog", "information_schema"}
-            esquemas_validos = sorted([e for e in esquemas if e not in ignorar])
-            self.schema_combo.clear()
-            self.schema_combo.addItems(esquemas_validos)
-            self.schema_combo.setEnabled(True)
-            self.buscar_tabelas_btn.setEnabled(True)
-            self.log(f"[Esquemas] Disponíveis: {esquemas_validos}")
-        except Exception as e:
-            QMessageBox.warning(self, "Erro", f"Erro ao buscar esquemas:\n{e}")
-            self.log(f"[Erro] Falha ao buscar esquemas: {e}")
-
-    def selecionar_geojson(self):
-        caminho, _ = QFileDialog.getOpenFileName(self, "Selecionar GeoJSON", "", "GeoJSON (*.geojson)")
-        if caminho:
-            self.geojson_input.setText(caminho)
-            self.aoi_info = {"geojson": caminho}
-            self.log(f"[AOI] Selecionado: {self.aoi_info}")
-
-    def listar_tabelas_do_esquema(self):
-        esquema = self.schema_combo.currentText()
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT f_table_name 
-                FROM geometry_columns 
-                WHERE f_table_schema = %s;
-            """, (esquema,))
-            tabelas = [row[0] for row in cursor.fetchall()]
-            cursor.close()
-            self.tabelas_com_geometria = tabelas
-            self.executar_intersecoes_btn.setEnabled(True)
-            self.log(f"[Tabelas] Esquema '{esquema}': {tabelas}")
-        except Exception as e:
-            QMessageBox.warning(self, "Erro", f"Erro ao listar tabelas:\n{e}")
-            self.log(f"[Erro] Falha ao listar tabelas: {e}")
-
-    def executar_st_intersect(self):
-        if not self.aoi_info.get("geojson"):
-            QMessageBox.warning(self, "Erro", "Selecione uma AOI antes de executar.")
-            return
-
-        try:
-            aoi = gpd.read_file(self.aoi_info["geojson"]).to_crs(epsg=4674)
-            wkt = aoi.geometry.union_all().wkt
-        except Exception as e:
-            QMessageBox.critical(self, "Erro", f"Erro ao ler a AOI:\n{e}")
-            self.log(f"[Erro] Falha ao ler AOI: {e}")
-            return
-
-        resultados = []
-        ignoradas = []
-        falhas = []
-        esquema = self.schema_combo.currentText()
-
-        for tabela in self.tabelas_com_geometria:
-            try:
-                query = f"""
-                    SELECT COUNT(*) 
-                    FROM "{esquema}"."{tabela}"
-                    WHERE geom IS NOT NULL
-                    AND ST_IsValid(geom)
-                    AND ST_SRID(geom) = 4674
-                    AND ST_Intersects(geom, ST_GeomFromText('{wkt}', 4674));
-                """
-                with self.conn.cursor() as cur:
-                    cur.execute(query)
-                    count = cur.fetchone()[0]
-
-                    if count > 0:
-                        # Coleta colunas e amostras
-                        cur.execute(f"""SELECT * FROM "{esquema}"."{tabela}" LIMIT 5""")
-                        colunas = [desc[0] for desc in cur.description if desc[0] != "geom"]
-                        linhas = cur.fetchall()
-
-                        resultados.append({
-                            "tabela": tabela,
-                            "count": count,
-                            "colunas": colunas,
-                            "linhas": linhas
-                        })
-                        self.log(f"[OK] {tabela} -> {count} feições intersectam")
-                    else:
-                        self.log(f"[Info] {tabela} -> 0 feições intersectam")
-
-            except Exception as e:
-                self.log(f"[Erro] ao processar {tabela}: {e}")
-                falhas.append(tabela)
-
-        if falhas:
-            self.log(f"[Aviso] Tabelas com erro de interseção: {falhas}")
-        if ignoradas:
-            self.log(f"[Aviso] Tabelas ignoradas: {ignoradas}")
-
-        # Salva para uso posterior
-        self.resultados_intersecao = resultados
-
-        # Gera visualização
-        self.atualizar_arvore_resultados()
-
-        self.tabs.setTabVisible(1, True)
-        self.tabs.setCurrentIndex(1)
-        self.diagnostico_btn.setEnabled(True)
-        self.log(f"[Resumo] Total de camadas com interseção: {len(resultados)}")
-
-    def atualizar_arvore_resultados(self):
-        self.tree_resultados.clear()
-
-        for r in self.resultados_intersecao:
-            tabela = r['tabela']
-            colunas = r['colunas']
-            linhas = r['linhas']
-
-            try:
-                item = QTreeWidgetItem([tabela])
-                item.setCheckState(0, Qt.CheckState.Checked)
-
-                # Transforma linhas em dicionários para acesso por campo
-                registros = [
-                    {col: val for col, val in zip(colunas, linha)}
-                    for linha in linhas
-                ]
-
-                for campo in colunas:
-                    child = QTreeWidgetItem([f" {campo}"])
-                    valores = []
-
-                    for reg in registros:
-                        val = reg.get(campo)
-                        if val is not None and type(val) not in (dict, list):
-                            val_str = str(val).strip()
-                            if val_str and val_str not in valores:
-                                valores.append(val_str)
-                        if len(valores) >= 5:
-                            break
-
-                    for v in valores:
-                        subitem = QTreeWidgetItem([f"  -> {v[:100]}"])
-                        child.addChild(subitem)
-
-                    item.addChild(child)
-
-                self.tree_resultados.addTopLevelItem(item)
-
-            except Exception as e:
-                self.log(f"[ERRO] ao exibir {tabela}: {e}")
-
-
-    def exportar_csv_diagnostico(self):
-        if not hasattr(self, 'resultados_intersecao') or not self.resultados_intersecao:
-            QMessageBox.warning(self, "Aviso", "Nenhum resultado disponível para exportar.")
-            return
-
-        caminho, _ = QFileDialog.getSaveFileName(self, "Salvar Diagnóstico CSV", "", "CSV (*.csv)")
-        if not caminho:
-            return
-
-        try:
-            import pandas as pd
-            dados = [
-                {"Tabela": r["tabela"], "Feições Encontradas": r["count"]}
-                for r in self.resultados_intersecao
-            ]
-            df = pd.DataFrame(dados)
-            df.to_csv(caminho, index=False, encoding="utf-8-sig")
-            QMessageBox.information(self, "Sucesso", "Diagnóstico exportado com sucesso!")
-            self.log(f"[Export] Diagnóstico salvo em: {caminho}")
-        except Exception as e:
-            QMessageBox.critical(self, "Erro", f"Erro ao exportar CSV:\n{e}")
-            self.log(f"[Erro] Falha ao exportar CSV: {e}")
-
-
-    def exportar_geopackage_final(self):
-        caminho, _ = QFileDialog.getSaveFileName(self, "Salvar GeoPackage", "", "GeoPackage (*.gpkg)")
-        if not caminho:
-            return
-        try:
-            aoi = gpd.read_file(self.aoi_info["geojson"]).to_crs(epsg=4674)
-            aoi.to_file(caminho, layer="AOI", driver="GPKG")
-            esquema = self.schema_combo.currentText()
-            cursor = self.conn.cursor()
-            union_wkt = aoi.geometry.union_all().wkt
-            for i in range(self.tree_resultados.topLevelItemCount()):
-                item = self.tree_resultados.topLevelItem(i)
-                if item.checkState(0) == Qt.CheckState.Checked:
-                    tabela = item.text(0)
-                    nome_geom = "geom"
-                    if not nome_geom:
-                        self.log(f"[Aviso] Tabela '{tabela}' ignorada na exportação (sem campo de geometria identificado).")
-                        continue
-                    query = f'''
-                        SELECT * FROM "{esquema}"."{tabela}"
-                        WHERE ST_Intersects("{nome_geom}", ST_GeomFromText(%s, 4674))
-                    '''
-                    cursor.execute(f'SELECT * FROM "{esquema}"."{tabela}" LIMIT 0')
-                    colunas = [desc[0] for desc in cursor.description]
-                    try:
-                        gdf = gpd.read_postgis(query, self.conn, geom_col=nome_geom, params=[union_wkt])
-                        if gdf.empty:
-                            self.log(f"[Aviso] Tabela '{tabela}' não possui feições para exportar.")
-                            continue
-                        # Remove geometrias inválidas e vazias, mas aceita qualquer tipo
-                        gdf = gdf[gdf.is_valid & ~gdf.is_empty]
-                        if gdf.empty:
-                            self.log(f"[Aviso] Tabela '{tabela}' só possui geometrias inválidas/vazias e foi ignorada.")
-                            continue
-                        # Se houver geometrias ZM, converte para Z (descarta M)
-                        if any("ZM" in str(geom) for geom in gdf.geometry):
-                            from shapely.geometry import mapping, shape
-                            def remove_m(geom):
-                                # Converte para dict, remove 'm', reconstrói
-                                geom_dict = mapping(geom)
-                                if "coordinates" in geom_dict:
-                                    def strip_m(coords):
-                                        # Remove M de cada coordenada
-                                        if isinstance(coords[0], (float, int)):
-                                            # É um ponto
-                                            return coords[:3]
-                                        return [strip_m(c) for c in coords]
-                                    geom_dict["coordinates"] = strip_m(geom_dict["coordinates"])
-                                return shape(geom_dict)
-                            gdf["geometry"] = gdf["geometry"].apply(remove_m)
-                            self.log(f"[Aviso] Geometrias ZM convertidas para Z na camada '{tabela}'.")
-                        # Exporta sem transformar o tipo de geometria, aceita qualquer tipo (incluindo Z)
-                        gdf.to_file(
-                            caminho,
-                            layer=tabela,
-                            driver="GPKG",
-                            encoding="utf-8",
-                            geometry_type=None
-                        )
-                    except Exception as e:
-                        self.log(f"[Erro] Falha ao exportar camada '{tabela}': {e}")
-                        continue
-            cursor.close()
-            QMessageBox.information(self, "Sucesso", "GeoPackage exportado com sucesso!")
-            self.log(f"[Export] GeoPackage salvo em: {caminho}")
-        except Exception as e:
-            QMessageBox.critical(self, "Erro", f"Erro ao exportar GeoPackage:\n{e}")
-            self.log(f"[Erro] Falha ao exportar GeoPackage: {e}")
-
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    app.setStyleSheet(DARK_STYLE)
-    janela = AbaConexaoPostgre()
-    janela.show()
-    sys.exit(app.exec())
+import sys
+import json
+import time
+
+INICIO = time.perf_counter()
+
+from PyQt6.QtWidgets import (
+    QApplication, QDialog, QVBoxLayout, QLabel, QLineEdit,
+    QPushButton, QMessageBox, QComboBox, QFileDialog,
+    QTabWidget, QWidget, QTreeView,
+    QHBoxLayout, QFrame, QTextEdit, QSpinBox, QProgressBar, QCheckBox, QDoubleSpinBox,
+    QTableWidget, QTableWidgetItem, QHeaderView
+)
+from PyQt6.QtCore import Qt, QObject, QThread, QTimer, pyqtSignal
+from cache_local import CacheMetadados, CacheResultados, CacheFeicoes, chave_conexao
+from modelo_resultados import ModeloResultados, FiltroResultados
+from carregamento import carregar_modulos
+# psycopg2 e motor_intersecao (que traz geopandas, pandas e shapely) são importados dentro
+# dos métodos que os usam, para que a janela apareça sem esperar por eles; pre_carregar
+# os importa em segundo plano logo depois.
+#COmnetário ~ivsfdn~ihvfn~kvfnmkç]fvs
+DARK_STYLE = """
+QWidget {
+    background-color: #232629;
+    color: #e0e0e0;
+    font-family: 'Segoe UI', Arial, sans-serif;
+    font-size: 10.5pt;
+}
+QLineEdit, QComboBox, QTreeView, QTabWidget, QTableWidget, QTextEdit {
+    background-color: #31363b;
+    color: #e0e0e0;
+    border: 1px solid #444;
+    border-radius: 4px;
+}
+QPushButton {
+    background-color: #3daee9;
+    color: #232629;
+    border: none;
+    border-radius: 4px;
+    padding: 6px 14px;
+    font-weight: bold;
+}
+QPushButton:hover {
+    background-color: #6cc7f7;
+}
+QPushButton:pressed {
+    background-color: #2d8abf;
+}
+QLabel {
+    color: #e0e0e0;
+}
+QTabBar::tab {
+    background: #31363b;
+    color: #e0e0e0;
+    padding: 8px;
+    border-top-left-radius: 6px;
+    border-top-right-radius: 6px;
+}
+QTabBar::tab:selected {
+    background: #3daee9;
+    color: #232629;
+}
+QTreeView::item:selected {
+    background: #3daee9;
+    color: #232629;
+}
+QMessageBox {
+    background-color: #232629;
+    color: #e0e0e0;
+}
+"""
+
+class Trabalhador(QObject):
+    # Executa uma tarefa longa fora da thread da interface. A tarefa recebe o próprio
+    # trabalhador e usa seus sinais para reportar mensagens, progresso e resultados parciais.
+    mensagem = pyqtSignal(str)
+    progresso = pyqtSignal(int, int)
+    parcial = pyqtSignal(object)
+    concluido = pyqtSignal(object)
+    falhou = pyqtSignal(str)
+    finalizado = pyqtSignal()
+
+    def __init__(self, tarefa):
+        super().__init__()
+        self.tarefa = tarefa
+
+    def executar(self):
+        try:
+            self.concluido.emit(self.tarefa(self))
+        except Exception as e:
+            self.falhou.emit(str(e))
+        finally:
+            self.finalizado.emit()
+
+class AbaConexaoPostgre(QDialog):
+    # Colunas da tabela de desempenho: (título, campo de RegistroDesempenho)
+    COLUNAS_DESEMPENHO = [
+        ("Camada", "tabela"), ("Etapa", "etapa"), ("Tempo total (s)", "tempo_total"),
+        ("Tempo no servidor (s)", "tempo_servidor"), ("Linhas lidas", "linhas_lidas"),
+        ("Feições", "linhas_encontradas"), ("KB recebidos", "bytes"),
+    ]
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Conexão e Consulta Espacial")
+        self.resize(600, 600)
+        self.setMinimumWidth(520)
+        # Adicione esta linha para garantir todos os botões da janela:
+        self.setWindowFlags(
+            Qt.WindowType.Window |
+            Qt.WindowType.WindowMinimizeButtonHint |
+            Qt.WindowType.WindowMaximizeButtonHint |
+            Qt.WindowType.WindowCloseButtonHint
+        )
+
+        self.conn = None
+        self.pool_conexoes = None
+        self.credenciais = {}
+        self.aoi_info = {}
+        self.cache_metadados = CacheMetadados()
+        self.cache_resultados = CacheResultados()
+        self.cache_feicoes = CacheFeicoes()
+        self.thread_trabalho = None
+        self.trabalhador = None
+        self.thread_carga = None
+        self.apos_trabalho = None
+        self.cancelamento = None
+        self.desempenho = None
+
+        self.tabs = QTabWidget()
+        self.setLayout(QVBoxLayout())
+        self.layout().addWidget(self.tabs)
+
+        # Barra de progresso compartilhada pelo diagnóstico e pela exportação
+        progresso_row = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        self.eta_label = QLabel("")
+        self.cancelar_btn = QPushButton("Cancelar")
+        self.cancelar_btn.setVisible(False)
+        self.cancelar_btn.clicked.connect(self.cancelar_operacao)
+        progresso_row.addWidget(self.progress_bar, stretch=1)
+        progresso_row.addWidget(self.eta_label)
+        progresso_row.addWidget(self.cancelar_btn)
+        self.layout().addLayout(progresso_row)
+
+        # Abas
+        self.tab_input = QWidget()
+        self.tab_visualizacao = QWidget()
+
+        # Layout da aba de visualização
+        self.visualizacao_layout = QVBoxLayout(self.tab_visualizacao)
+        self.tab_visualizacao.setLayout(self.visualizacao_layout)
+
+        # Árvore sobre um modelo: campos e valores de cada camada só são criados ao expandi-la
+        self.filtro_input = QLineEdit()
+        self.filtro_input.setPlaceholderText("Filtrar por nome de camada ou campo")
+        self.filtro_input.setClearButtonEnabled(True)
+        self.modelo_resultados = ModeloResultados(self)
+        self.filtro_resultados = FiltroResultados(self)
+        self.filtro_resultados.setSourceModel(self.modelo_resultados)
+        self.filtro_input.textChanged.connect(self.filtro_resultados.definir_filtro)
+        self.tree_resultados = QTreeView()
+        self.tree_resultados.setModel(self.filtro_resultados)
+        self.tree_resultados.setUniformRowHeights(True)
+        self.visualizacao_layout.addWidget(self.filtro_input)
+        self.visualizacao_layout.addWidget(self.tree_resultados)
+
+        # Medições de cada consulta da última execução; clicar no cabeçalho ordena a coluna
+        self.desempenho_label = QLabel("Camadas mais lentas:")
+        self.tabela_desempenho = QTableWidget(0, len(self.COLUNAS_DESEMPENHO))
+        self.tabela_desempenho.setHorizontalHeaderLabels([titulo for titulo, _ in self.COLUNAS_DESEMPENHO])
+        self.tabela_desempenho.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.tabela_desempenho.verticalHeader().setVisible(False)
+        self.tabela_desempenho.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.tabela_desempenho.setSortingEnabled(True)
+        self.tabela_desempenho.setMaximumHeight(180)
+        self.visualizacao_layout.addWidget(self.desempenho_label)
+        self.visualizacao_layout.addWidget(self.tabela_desempenho)
+
+        # Processamento das geometrias no servidor antes da transferência
+        opcoes_exportacao = QHBoxLayout()
+        self.recortar_chk = QCheckBox("Recortar na AOI")
+        self.recortar_chk.setToolTip("Exporta só a parte de cada feição que fica dentro da AOI")
+        self.simplificar_label = QLabel("Simplificar:")
+        self.simplificar_spin = QDoubleSpinBox()
+        self.simplificar_spin.setDecimals(6)
+        self.simplificar_spin.setRange(0, 1000)
+        self.simplificar_spin.setSpecialValueText("não")
+        self.simplificar_spin.setToolTip("Tolerância de ST_SimplifyPreserveTopology, nas unidades do SRID de cada camada")
+        self.casas_label = QLabel("Casas decimais:")
+        self.casas_spin = QSpinBox()
+        self.casas_spin.setRange(-1, 15)
+        self.casas_spin.setValue(-1)
+        self.casas_spin.setSpecialValueText("todas")
+        self.casas_spin.setToolTip("Precisão mantida por ST_QuantizeCoordinates (nas unidades do SRID de cada camada)")
+        self.cache_feicoes_chk = QCheckBox("Usar cache local de feições")
+        self.cache_feicoes_chk.setChecked(True)
+        self.cache_feicoes_chk.setToolTip(
+            "Guarda as feições exportadas e, numa AOI repetida ou próxima, só busca no servidor a área ainda não coberta"
+        )
+        for w in [self.recortar_chk, self.simplificar_label, self.simplificar_spin,
+                  self.casas_label, self.casas_spin, self.cache_feicoes_chk]:
+            opcoes_exportacao.addWidget(w)
+        opcoes_exportacao.addStretch()
+        self.visualizacao_layout.addLayout(opcoes_exportacao)
+
+        botoes_visualizacao = QHBoxLayout()
+
+        self.diagnostico_btn = QPushButton("Diagnóstico")
+        self.diagnostico_btn.setMinimumHeight(32)
+        self.diagnostico_btn.setEnabled(False)
+        self.diagnostico_btn.clicked.connect(self.exportar_csv_diagnostico)
+
+        self.exportar_gpkg_btn = QPushButton("Exportar GeoPackage")
+        self.exportar_gpkg_btn.setMinimumHeight(32)
+        self.exportar_gpkg_btn.clicked.connect(self.exportar_geopackage_final)
+
+        # Um arquivo GeoParquet por camada, para leitura em Spark/DuckDB
+        self.exportar_parquet_btn = QPushButton("Exportar GeoParquet")
+        self.exportar_parquet_btn.setMinimumHeight(32)
+        self.exportar_parquet_btn.clicked.connect(self.exportar_geoparquet_final)
+
+        # Área, comprimento e % da AOI calculados no servidor, opcionalmente por um campo
+        self.metricas_btn = QPushButton("Métricas")
+        self.metricas_btn.setMinimumHeight(32)
+        self.metricas_btn.clicked.connect(self.exportar_csv_metricas)
+        self.agrupar_input = QLineEdit()
+        self.agrupar_input.setPlaceholderText("Agrupar por campo (opcional)")
+        self.agrupar_input.setMaximumWidth(220)
+
+        # Contagem por feição da AOI (uma linha por feição, uma coluna por camada)
+        self.matriz_btn = QPushButton("Matriz por feição")
+        self.matriz_btn.setMinimumHeight(32)
+        self.matriz_btn.clicked.connect(self.exportar_csv_matriz)
+        self.campo_id_input = QLineEdit()
+        self.campo_id_input.setPlaceholderText("Campo identificador da AOI (opcional)")
+        self.campo_id_input.setMaximumWidth(240)
+
+        # Relatório das medições da última execução (JSON com os planos, ou CSV)
+        self.desempenho_btn = QPushButton("Relatório de desempenho")
+        self.desempenho_btn.setMinimumHeight(32)
+        self.desempenho_btn.clicked.connect(self.exportar_relatorio_desempenho)
+
+        botoes_visualizacao.addWidget(self.diagnostico_btn)
+        botoes_visualizacao.addWidget(self.exportar_gpkg_btn)
+        botoes_visualizacao.addWidget(self.exportar_parquet_btn)
+        botoes_visualizacao.addWidget(self.metricas_btn)
+        botoes_visualizacao.addWidget(self.agrupar_input)
+        botoes_visualizacao.addWidget(self.matriz_btn)
+        botoes_visualizacao.addWidget(self.campo_id_input)
+        botoes_visualizacao.addWidget(self.desempenho_btn)
+        botoes_visualizacao.addStretch()
+
+        self.visualizacao_layout.addLayout(botoes_visualizacao)
+
+        self.tabs.addTab(self.tab_input, "Entrada")
+        self.tabs.addTab(self.tab_visualizacao, "Visualização")
+        self.tabs.setTabVisible(1, False)
+
+        # Layout da aba de entrada
+        self.input_layout = QVBoxLayout(self.tab_input)
+        self.tab_input.setLayout(self.input_layout)
+
+        # Título principal: DIGLET
+        titulo_diglet = QLabel("DIGLET")
+        titulo_diglet.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        titulo_diglet.setStyleSheet("""
+            font-size: 24pt;
+            font-weight: bold;
+            color: #3daee9;
+            margin-top: 12px;
+        """)
+
+        # Subtítulo: sigla por extenso
+        subtitulo = QLabel("Diagnóstico Interativo de Geoinformação e Levantamento Espacial Territorial")
+        subtitulo.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        subtitulo.setStyleSheet("""
+            font-size: 10.5pt;
+            color: #e0e0e0;
+            margin-bottom: 12px;
+        """)
+
+        # Adiciona ao layout
+        self.input_layout.addWidget(titulo_diglet)
+        self.input_layout.addWidget(subtitulo)
+
+        # Entradas de conexão em grid compacto
+        grid = QHBoxLayout()
+        self.host_input = QLineEdit(); self.host_input.setPlaceholderText("Host")
+        self.port_input = QLineEdit(); self.port_input.setPlaceholderText("Porta"); self.port_input.setText("5432")
+        self.db_input = QLineEdit(); self.db_input.setPlaceholderText("Banco")
+        self.user_input = QLineEdit(); self.user_input.setPlaceholderText("Usuário")
+        self.pass_input = QLineEdit(); self.pass_input.setPlaceholderText("Senha"); self.pass_input.setEchoMode(QLineEdit.EchoMode.Password)
+        for w in [self.host_input, self.port_input, self.db_input, self.user_input, self.pass_input]:
+            w.setMaximumWidth(120)
+            grid.addWidget(w)
+        self.input_layout.addLayout(grid)
+
+        # Botões de importação/exportação JSON em linha
+        btns_json = QHBoxLayout()
+        self.importar_json_btn = QPushButton("Importar JSON")
+        self.importar_json_btn.setToolTip("Importar credenciais do arquivo JSON")
+        self.importar_json_btn.clicked.connect(self.importar_credenciais_json)
+        self.exportar_json_btn = QPushButton("Exportar JSON")
+        self.exportar_json_btn.setToolTip("Exportar credenciais para arquivo JSON")
+        self.exportar_json_btn.clicked.connect(self.exportar_credenciais_json)
+        btns_json.addWidget(self.importar_json_btn)
+        btns_json.addWidget(self.exportar_json_btn)
+        btns_json.addStretch()
+        self.input_layout.addLayout(btns_json)
+
+        # Botão de conexão
+        self.connect_button = QPushButton("Conectar")
+        self.connect_button.setMinimumHeight(28)
+        self.connect_button.clicked.connect(self.conectar_banco)
+        self.input_layout.addWidget(self.connect_button)
+
+        # Linha separadora
+        self.input_layout.addWidget(self._linha())
+
+        # ComboBox de esquemas (mais larga)
+        schema_row = QHBoxLayout()
+        self.schema_label = QLabel("Esquema:")
+        self.schema_combo = QComboBox()
+        self.schema_combo.setMinimumWidth(350)
+        self.schema_combo.setSizePolicy(self.schema_combo.sizePolicy().horizontalPolicy(), self.schema_combo.sizePolicy().verticalPolicy())
+        self.schema_combo.setEnabled(False)
+        schema_row.addWidget(self.schema_label)
+        schema_row.addWidget(self.schema_combo, stretch=1)
+        # Todas as camadas de todos os esquemas numa única busca e num único diagnóstico
+        self.banco_inteiro_chk = QCheckBox("Banco inteiro")
+        self.banco_inteiro_chk.setToolTip("Busca as camadas de todos os esquemas com colunas geométricas")
+        self.banco_inteiro_chk.toggled.connect(lambda marcado: self.schema_combo.setEnabled(
+            not marcado and self.schema_combo.count() > 0))
+        schema_row.addWidget(self.banco_inteiro_chk)
+        self.input_layout.addLayout(schema_row)
+
+        # Seletor de GeoJSON
+        geo_row = QHBoxLayout()
+        self.geojson_label = QLabel("AOI (GeoJSON):")
+        self.geojson_input = QLineEdit(); self.geojson_input.setReadOnly(True)
+        self.geojson_btn = QPushButton("Selecionar")
+        self.geojson_btn.setMaximumWidth(90)
+        self.geojson_btn.clicked.connect(self.selecionar_geojson)
+        geo_row.addWidget(self.geojson_label)
+        geo_row.addWidget(self.geojson_input)
+        geo_row.addWidget(self.geojson_btn)
+        self.input_layout.addLayout(geo_row)
+
+        # Botões principais em linha
+        btns_main = QHBoxLayout()
+        self.buscar_tabelas_btn = QPushButton("Buscar Tabelas")
+        self.buscar_tabelas_btn.clicked.connect(self.listar_tabelas_do_esquema)
+        self.buscar_tabelas_btn.setEnabled(False)
+        self.executar_intersecoes_btn = QPushButton("Executar Intersecção")
+        self.executar_intersecoes_btn.clicked.connect(self.executar_st_intersect)
+        self.executar_intersecoes_btn.setEnabled(False)
+        for b in [self.buscar_tabelas_btn, self.executar_intersecoes_btn]:
+            b.setMinimumHeight(28)
+            btns_main.addWidget(b)
+        btns_main.addStretch()
+        # Número de consultas simultâneas (1 = sequencial na conexão principal)
+        self.workers_label = QLabel("Paralelismo:")
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 32)
+        self.workers_spin.setValue(1)
+        self.workers_spin.setToolTip("Número de tabelas consultadas ao mesmo tempo (cada uma em sua própria conexão)")
+        btns_main.addWidget(self.workers_label)
+        btns_main.addWidget(self.workers_spin)
+        self.input_layout.addLayout(btns_main)
+
+        # Guarda no servidor as feições encontradas para a exportação não refazer a interseção
+        self.registrar_acertos_chk = QCheckBox("Preparar exportação (guardar feições encontradas no servidor)")
+        self.registrar_acertos_chk.setChecked(True)
+        self.input_layout.addWidget(self.registrar_acertos_chk)
+
+        # Consulta as tabelas em grupos, uma chamada ao servidor por grupo (útil em links lentos/VPN)
+        self.consulta_lote_chk = QCheckBox("Consulta em lote (uma ida ao servidor por conexão)")
+        self.consulta_lote_chk.setChecked(True)
+        self.input_layout.addWidget(self.consulta_lote_chk)
+
+        # Tempo máximo por tabela (0 = sem limite) e contagem aproximada para as que estourarem
+        tempo_row = QHBoxLayout()
+        self.tempo_limite_label = QLabel("Tempo limite por tabela (s):")
+        self.tempo_limite_spin = QSpinBox()
+        self.tempo_limite_spin.setRange(0, 86400)
+        self.tempo_limite_spin.setValue(0)
+        self.tempo_limite_spin.setSpecialValueText("sem limite")
+        self.aproximar_chk = QCheckBox("Contagem aproximada (retângulo envolvente) ao exceder o tempo")
+        tempo_row.addWidget(self.tempo_limite_label)
+        tempo_row.addWidget(self.tempo_limite_spin)
+        tempo_row.addWidget(self.aproximar_chk)
+        # EXPLAIN (ANALYZE, BUFFERS) das tabelas mais lentas, ao fim do diagnóstico
+        self.planos_label = QLabel("Planos das mais lentas:")
+        self.planos_spin = QSpinBox()
+        self.planos_spin.setRange(0, 50)
+        self.planos_spin.setValue(0)
+        self.planos_spin.setSpecialValueText("não")
+        self.planos_spin.setToolTip("Reexecuta com EXPLAIN (ANALYZE, BUFFERS) a contagem das N tabelas mais lentas")
+        tempo_row.addWidget(self.planos_label)
+        tempo_row.addWidget(self.planos_spin)
+        tempo_row.addStretch()
+        self.input_layout.addLayout(tempo_row)
+
+        # Log de operações
+        self.log_box = QTextEdit()
+        self.log_box.setReadOnly(True)
+        self.log_box.setMinimumHeight(110)
+        self.log_box.setStyleSheet("font-family: 'Consolas', 'Courier New', monospace; font-size: 10pt;")
+        self.input_layout.addWidget(self.log_box)
+
+        self.input_layout.addStretch()
+
+    def _linha(self):
+        line = QFrame()
+        line.setFrameShape(QFrame.Shape.HLine)
+        line.setFrameShadow(QFrame.Shadow.Sunken)
+        line.setStyleSheet("color: #444; margin: 8px 0;")
+        return line
+
+    def log(self, msg):
+        self.log_box.append(msg)
+        self.log_box.verticalScrollBar().setValue(self.log_box.verticalScrollBar().maximum())
+
+    def importar_credenciais_json(self):
+        caminho, _ = QFileDialog.getOpenFileName(self, "Selecionar arquivo JSON", "", "JSON (*.json)")
+        if not caminho:
+            return
+        try:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+            chaves = {"host", "port", "dbname", "user", "password"}
+            if not chaves.issubset(dados.keys()):
+                QMessageBox.warning(self, "Erro", "Arquivo JSON inválido ou incompleto.")
+                return
+            self.host_input.setText(dados["host"])
+            self.port_input.setText(str(dados["port"]))
+            self.db_input.setText(dados["dbname"])
+            self.user_input.setText(dados["user"])
+            self.pass_input.setText(dados["password"])
+            self.credenciais = {
+                "host": dados["host"],
+                "port": str(dados["port"]),
+                "dbname": dados["dbname"],
+                "user": dados["user"],
+                "password": dados["password"]
+            }
+            self.log(f"[Import] Credenciais carregadas: {self.credenciais}")
+        except Exception as e:
+            QMessageBox.critical(self, "Erro", f"Erro ao ler o JSON:\n{e}")
+
+    def exportar_credenciais_json(self):
+        dados = {
+            "host": self.host_input.text(),
+            "port": self.port_input.text(),
+            "dbname": self.db_input.text(),
+            "user": self.user_input.text(),
+            "password": self.pass_input.text()
+        }
+        caminho, _ = QFileDialog.getSaveFileName(self, "Salvar arquivo JSON", "", "JSON (*.json)")
+        if not caminho:
+            return
+        try:
+            with open(caminho, 'w', encoding='utf-8') as f:
+                json.dump(dados, f, indent=4, ensure_ascii=False)
+            QMessageBox.information(self, "Exportado", "Credenciais salvas com sucesso!")
+            self.log(f"[Export] Credenciais exportadas: {dados}")
+        except Exception as e:
+            QMessageBox.critical(self, "Erro", f"Erro ao salvar JSON:\n{e}")
+
+    def conectar_banco(self):
+        import psycopg2
+        self.credenciais = {
+            "host": self.host_input.text(),
+            "port": self.port_input.text(),
+            "dbname": self.db_input.text(),
+            "user": self.user_input.text(),
+            "password": self.pass_input.text()
+        }
+        try:
+            self.fechar_pool()
+            self.conn = psycopg2.connect(**self.credenciais)
+            QMessageBox.information(self, "Conexão", "Conectado ao banco com sucesso!")
+            self.log(f"[Conexão] Credenciais: {self.credenciais}")
+            self.preencher_combobox_esquemas()
+        except Exception as e:
+            QMessageBox.critical(self, "Erro de Conexão", f"Erro ao conectar:\n{e}")
+            self.log(f"[Erro] Falha ao conectar: {e}")
+
+    def obter_conexoes(self, workers):
+        from motor_intersecao import ConexaoUnica, PoolConexoes
+        if workers <= 1:
+            return ConexaoUnica(self.conn)
+        if self.pool_conexoes is None or self.pool_conexoes.tamanho != workers:
+            self.fechar_pool()
+            self.pool_conexoes = PoolConexoes(self.credenciais, workers)
+            self.log(f"[Pool] {workers} conexões disponíveis para consultas paralelas")
+        return self.pool_conexoes
+
+    def fechar_pool(self):
+        if self.pool_conexoes is not None:
+            self.pool_conexoes.fechar()
+            self.pool_conexoes = None
+
+    def closeEvent(self, event):
+        if self.thread_trabalho is not None:
+            self.cancelar_operacao()
+            self.thread_trabalho.quit()
+            self.thread_trabalho.wait()
+        if self.thread_carga is not None:
+            # Uma importação em andamento não pode ser interrompida
+            self.thread_carga.wait()
+        self.fechar_pool()
+        super().closeEvent(event)
+
+    def pre_carregar(self, ao_concluir=None, ao_falhar=None):
+        # Importa a pilha geoespacial numa thread à parte depois que a janela aparece, para
+        # que a primeira leitura de AOI ou consulta não espere por ela. Um método que precise
+        # de um módulo ainda em carga apenas aguarda a importação terminar.
+        self.thread_carga = QThread(self)
+        self.carregador = Trabalhador(lambda trabalhador: carregar_modulos())
+        self.carregador.moveToThread(self.thread_carga)
+        self.thread_carga.started.connect(self.carregador.executar)
+        self.carregador.concluido.connect(self.pre_carregamento_concluido)
+        if ao_concluir:
+            self.carregador.concluido.connect(ao_concluir)
+        self.carregador.falhou.connect(lambda msg: self.log(f"[Aviso] Falha no pré-carregamento: {msg}"))
+        if ao_falhar:
+            self.carregador.falhou.connect(ao_falhar)
+        # Ligação direta: a thread termina sozinha, mesmo com a thread da interface parada
+        # em closeEvent esperando por ela
+        self.carregador.finalizado.connect(self.thread_carga.quit, Qt.ConnectionType.DirectConnection)
+        self.thread_carga.finished.connect(self.carregador.deleteLater)
+        self.thread_carga.start()
+
+    def pre_carregamento_concluido(self, tempos):
+        ausentes = [nome for nome, segundos in tempos if segundos is None]
+        total = sum(segundos for _, segundos in tempos if segundos is not None)
+        self.log(f"[Info] Bibliotecas geoespaciais carregadas em segundo plano ({total:.1f}s)")
+        if ausentes:
+            self.log(f"[Aviso] Módulos não encontrados: {ausentes}")
+
+    def iniciar_trabalho(self, tarefa, total, ao_parcial, ao_concluir):
+        from motor_intersecao import ControleCancelamento
+        self.cancelamento = ControleCancelamento()
+        self.thread_trabalho = QThread(self)
+        self.trabalhador = Trabalhador(tarefa)
+        self.trabalhador.moveToThread(self.thread_trabalho)
+        self.thread_trabalho.started.connect(self.trabalhador.executar)
+        self.trabalhador.mensagem.connect(self.log)
+        self.trabalhador.progresso.connect(self.atualizar_progresso)
+        self.trabalhador.parcial.connect(ao_parcial)
+        self.trabalhador.concluido.connect(ao_concluir)
+        self.trabalhador.falhou.connect(self.trabalho_falhou)
+        self.trabalhador.finalizado.connect(self.trabalho_finalizado)
+        self.trabalhador.finalizado.connect(self.thread_trabalho.quit)
+        self.thread_trabalho.finished.connect(self.trabalhador.deleteLater)
+        self.thread_trabalho.finished.connect(self.thread_trabalho.deleteLater)
+
+        self.inicio_trabalho = time.monotonic()
+        self.progress_bar.setRange(0, max(total, 1))
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.eta_label.setText("")
+        self.cancelar_btn.setEnabled(True)
+        self.cancelar_btn.setVisible(True)
+        self.definir_controles_ocupados(True)
+        self.thread_trabalho.start()
+
+    def definir_controles_ocupados(self, ocupado):
+        for b in [self.connect_button, self.buscar_tabelas_btn, self.executar_intersecoes_btn,
+                  self.exportar_gpkg_btn, self.exportar_parquet_btn, self.diagnostico_btn, self.metricas_btn,
+                  self.matriz_btn, self.desempenho_btn]:
+            b.setEnabled(not ocupado)
+        if not ocupado and not getattr(self, "resultados_intersecao", None):
+            self.diagnostico_btn.setEnabled(False)
+        if not ocupado and not getattr(self, "camadas", None):
+            self.executar_intersecoes_btn.setEnabled(False)
+
+    def atualizar_progresso(self, feitos, total):
+        self.progress_bar.setValue(feitos)
+        if 0 < feitos < total:
+            decorrido = time.monotonic() - self.inicio_trabalho
+            restante = decorrido / feitos * (total - feitos)
+            self.eta_label.setText(f"{feitos}/{total} - restante ~{int(restante // 60)}m{int(restante % 60):02d}s")
+        else:
+            self.eta_label.setText(f"{feitos}/{total}")
+
+    def cancelar_operacao(self):
+        if self.cancelamento is not None and not self.cancelamento.cancelado:
+            self.cancelamento.cancelar()
+            self.cancelar_btn.setEnabled(False)
+            self.log("[Cancelar] Interrompendo consultas em andamento...")
+
+    def trabalho_falhou(self, msg):
+        QMessageBox.critical(self, "Erro", f"Erro durante a operação:\n{msg}")
+        self.log(f"[Erro] {msg}")
+
+    def trabalho_finalizado(self):
+        self.progress_bar.setVisible(False)
+        self.cancelar_btn.setVisible(False)
+        self.eta_label.setText("")
+        self.definir_controles_ocupados(False)
+        self.thread_trabalho = None
+        self.trabalhador = None
+        pendente, self.apos_trabalho = self.apos_trabalho, None
+        if pendente:
+            pendente()
+
+    def preencher_combobox_esquemas(self):
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT schema_name FROM information_schema.schemata;")
+            esquemas = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+            ignorar = {"pg_catalog", "information_schema"}
+            esquemas_validos = sorted([e for e in esquemas if e not in ignorar])
+            self.schema_combo.clear()
+            self.schema_combo.addItems(esquemas_validos)
+            self.schema_combo.setEnabled(not self.banco_inteiro_chk.isChecked())
+            self.buscar_tabelas_btn.setEnabled(True)
+            self.log(f"[Esquemas] Disponíveis: {esquemas_validos}")
+        except Exception as e:
+            QMessageBox.warning(self, "Erro", f"Erro ao buscar esquemas:\n{e}")
+            self.log(f"[Erro] Falha ao buscar esquemas: {e}")
+
+    def selecionar_geojson(self):
+        caminho, _ = QFileDialog.getOpenFileName(self, "Selecionar GeoJSON", "", "GeoJSON (*.geojson)")
+        if caminho:
+            self.geojson_input.setText(caminho)
+            self.aoi_info = {"geojson": caminho}
+            self.log(f"[AOI] Selecionado: {self.aoi_info}")
+
+    def listar_tabelas_do_esquema(self):
+        # A leitura do catálogo e das estatísticas pode demorar em esquemas grandes e roda
+        # fora da thread da interface
+        from motor_intersecao import listar_camadas, listar_camadas_banco
+        chave = chave_conexao(self.credenciais)
+        conn = self.conn
+        banco_inteiro = self.banco_inteiro_chk.isChecked()
+        esquema = self.schema_combo.currentText()
+
+        def tarefa(trabalhador):
+            if banco_inteiro:
+                camadas = listar_camadas_banco(conn, cache=self.cache_metadados, chave=chave,
+                                               log=trabalhador.mensagem.emit)
+                return camadas, "Banco inteiro"
+            camadas = listar_camadas(conn, esquema, cache=self.cache_metadados, chave=chave,
+                                     log=trabalhador.mensagem.emit)
+            return camadas, f"Esquema '{esquema}'"
+
+        self.camadas = []
+        self.iniciar_trabalho(tarefa, 0, self.log, self.tabelas_listadas)
+
+    def tabelas_listadas(self, retorno):
+        self.camadas, origem = retorno
+        self.log(f"[Tabelas] {origem}: {[c['nome'] for c in self.camadas]}")
+        # A verificação pode abrir outro trabalho; espera este terminar por completo
+        self.apos_trabalho = self.verificar_indices
+
+    def verificar_indices(self):
+        from motor_intersecao import OperacaoCancelada, diagnosticar_indices, aplicar_correcoes_indice
+        try:
+            problemas = diagnosticar_indices(self.conn, self.camadas)
+        except Exception as e:
+            self.log(f"[Aviso] Não foi possível verificar índices espaciais: {e}")
+            return
+        if not problemas:
+            self.log("[Índice] Todas as camadas têm índice espacial e estatísticas atualizadas")
+            return
+        sem_indice = [p["nome"] for p in problemas if p["sem_indice"]]
+        desatualizadas = [p["nome"] for p in problemas if p["estatisticas_desatualizadas"]]
+        if sem_indice:
+            self.log(f"[Índice] Camadas sem índice espacial: {sem_indice}")
+        if desatualizadas:
+            self.log(f"[Índice] Camadas com estatísticas desatualizadas: {desatualizadas}")
+        resposta = QMessageBox.question(
+            self, "Índices espaciais",
+            f"{len(sem_indice)} camada(s) sem índice espacial e {len(desatualizadas)} com estatísticas "
+            "desatualizadas.\n\nCriar os índices GiST e executar ANALYZE agora?\n"
+            "Em tabelas grandes isso pode levar alguns minutos. Os índices são criados com "
+            "CONCURRENTLY, sem bloquear escritas; em tabelas particionadas, as escritas ficam "
+            "bloqueadas até o índice ficar pronto."
+        )
+        if resposta != QMessageBox.StandardButton.Yes:
+            return
+        conn = self.conn
+
+        def tarefa(trabalhador):
+            def ao_concluir(indice, tabela):
+                trabalhador.progresso.emit(indice + 1, len(problemas))
+            try:
+                aplicar_correcoes_indice(
+                    conn, problemas, log=trabalhador.mensagem.emit,
+                    ao_concluir=ao_concluir, cancelamento=self.cancelamento
+                )
+            except OperacaoCancelada:
+                return False
+            return True
+
+        self.iniciar_trabalho(tarefa, len(problemas), self.log, self.correcao_indices_concluida)
+
+    def correcao_indices_concluida(self, completa):
+        if completa:
+            self.log("[Índice] Ajustes concluídos")
+        else:
+            self.log("[Cancelado] Ajuste de índices interrompido")
+
+    def executar_st_intersect(self):
+        from motor_intersecao import (
+            AreaInteresse, OperacaoCancelada, RegistroDesempenho, executar_intersecoes, capturar_planos
+        )
+        if not self.aoi_info.get("geojson"):
+            QMessageBox.warning(self, "Erro", "Selecione uma AOI antes de executar.")
+            return
+
+        camadas = list(self.camadas)
+        tabelas = [c["nome"] for c in camadas]
+        workers = self.workers_spin.value()
+        if workers > 1:
+            self.log(f"[Execução] {len(tabelas)} tabelas com {workers} consultas simultâneas")
+        conexoes = self.obter_conexoes(workers)
+        caminho_aoi = self.aoi_info["geojson"]
+        registrar = self.registrar_acertos_chk.isChecked()
+        em_lote = self.consulta_lote_chk.isChecked()
+        tempo_limite = self.tempo_limite_spin.value() or None
+        aproximar = self.aproximar_chk.isChecked()
+        planos = self.planos_spin.value()
+        desempenho = RegistroDesempenho()
+
+        def tarefa(trabalhador):
+            try:
+                aoi = AreaInteresse.ler(caminho_aoi)
+            except Exception as e:
+                raise RuntimeError(f"Falha ao ler AOI: {e}")
+
+            feitos = 0
+            def ao_concluir(indice, tabela, resultado):
+                nonlocal feitos
+                feitos += 1
+                trabalhador.progresso.emit(feitos, len(tabelas))
+                if resultado is not None and resultado["count"] > 0:
+                    trabalhador.parcial.emit((indice, resultado))
+
+            retorno = executar_intersecoes(
+                conexoes, camadas, aoi, workers=workers,
+                log=trabalhador.mensagem.emit, ao_concluir=ao_concluir,
+                cancelamento=self.cancelamento, cache=self.cache_resultados,
+                chave=chave_conexao(self.credenciais), registrar=registrar, em_lote=em_lote,
+                tempo_limite=tempo_limite, aproximar=aproximar, desempenho=desempenho
+            )
+            if planos and not self.cancelamento.cancelado:
+                try:
+                    capturar_planos(conexoes, camadas, aoi, desempenho, planos, log=trabalhador.mensagem.emit,
+                                    cancelamento=self.cancelamento, tempo_limite=tempo_limite)
+                except OperacaoCancelada:
+                    pass
+            return retorno + (aoi,)
+
+        self.resultados_intersecao = []
+        self.camadas_intersecao = {c["nome"]: c for c in camadas}
+        self.caminho_aoi_intersecao = caminho_aoi
+        self.desempenho = desempenho
+        self.modelo_resultados.limpar()
+        self.tabela_desempenho.setRowCount(0)
+        self.tabs.setTabVisible(1, True)
+        self.iniciar_trabalho(tarefa, len(tabelas), self.adicionar_resultado_parcial, self.intersecao_concluida)
+
+    def adicionar_resultado_parcial(self, dados):
+        # Resultados chegam na ordem em que terminam; a árvore é mantida na ordem do catálogo
+        indice, r = dados
+        self.modelo_resultados.inserir(indice, r)
+
+    def intersecao_concluida(self, retorno):
+        resultados, falhas, ignoradas, esgotadas, aoi = retorno
+        if self.cancelamento.cancelado:
+            self.log("[Cancelado] Diagnóstico interrompido; resultados parciais mantidos.")
+
+        if falhas:
+            self.log(f"[Aviso] Tabelas com erro de interseção: {falhas}")
+        if ignoradas:
+            self.log(f"[Aviso] Tabelas ignoradas: {ignoradas}")
+        if esgotadas:
+            self.log(f"[Aviso] Tabelas que excederam o tempo limite: {esgotadas}")
+
+        # Salva para uso posterior
+        self.resultados_intersecao = resultados
+        self.aoi_intersecao = aoi
+
+        self.tabs.setTabVisible(1, True)
+        self.tabs.setCurrentIndex(1)
+        self.diagnostico_btn.setEnabled(True)
+        self.atualizar_tabela_desempenho()
+        self.log(f"[Resumo] Total de camadas com interseção: {len(resultados)}")
+
+    def atualizar_tabela_desempenho(self):
+        linhas = self.desempenho.linhas if self.desempenho is not None else []
+        self.tabela_desempenho.setSortingEnabled(False)
+        self.tabela_desempenho.setRowCount(len(linhas))
+        for n, linha in enumerate(linhas):
+            for coluna, (_, campo) in enumerate(self.COLUNAS_DESEMPENHO):
+                valor = linha[campo]
+                item = QTableWidgetItem()
+                if campo == "bytes" and valor is not None:
+                    valor = round(valor / 1024, 1)
+                elif campo.startswith("tempo") and valor is not None:
+                    valor = round(valor, 3)
+                if valor is not None:
+                    # Valor numérico no papel de exibição para a ordenação não ser alfabética
+                    item.setData(Qt.ItemDataRole.DisplayRole, valor)
+                if coluna == 0 and (linha["plano"] or linha["erro"]):
+                    item.setToolTip(linha["plano"] or linha["erro"])
+                self.tabela_desempenho.setItem(n, coluna, item)
+        self.tabela_desempenho.setSortingEnabled(True)
+        self.tabela_desempenho.sortItems(3, Qt.SortOrder.DescendingOrder)
+
+    def exportar_relatorio_desempenho(self):
+        from motor_intersecao import gravar_relatorio_desempenho
+        if self.desempenho is None or not self.desempenho.linhas:
+            QMessageBox.warning(self, "Aviso", "Nenhuma medição disponível para exportar.")
+            return
+        caminho, _ = QFileDialog.getSaveFileName(self, "Salvar Relatório de Desempenho", "",
+                                                 "JSON (*.json);;CSV (*.csv)")
+        if not caminho:
+            return
+        try:
+            gravar_relatorio_desempenho(caminho, self.desempenho)
+            self.log(f"[Export] Relatório de desempenho salvo em: {caminho}")
+        except Exception as e:
+            QMessageBox.critical(self, "Erro", f"Erro ao exportar relatório:\n{e}")
+            self.log(f"[Erro] Falha ao exportar relatório de desempenho: {e}")
+
+    def exportar_csv_diagnostico(self):
+        from motor_intersecao import gravar_csv_diagnostico
+        if not hasattr(self, 'resultados_intersecao') or not self.resultados_intersecao:
+            QMessageBox.warning(self, "Aviso", "Nenhum resultado disponível para exportar.")
+            return
+
+        caminho, _ = QFileDialog.getSaveFileName(self, "Salvar Diagnóstico CSV", "", "CSV (*.csv)")
+        if not caminho:
+            return
+
+        try:
+            gravar_csv_diagnostico(caminho, self.resultados_intersecao)
+            QMessageBox.information(self, "Sucesso", "Diagnóstico exportado com sucesso!")
+            self.log(f"[Export] Diagnóstico salvo em: {caminho}")
+        except Exception as e:
+            QMessageBox.critical(self, "Erro", f"Erro ao exportar CSV:\n{e}")
+            self.log(f"[Erro] Falha ao exportar CSV: {e}")
+
+
+    def camadas_marcadas(self):
+        # Camadas marcadas na árvore (estejam ou não visíveis pelo filtro), com as colunas e
+        # feições já levantadas pelo diagnóstico
+        return [
+            dict(self.camadas_intersecao[r["tabela"]], colunas=r["colunas"], acertos=r.get("acertos"))
+            for r in self.modelo_resultados.resultados_marcados()
+        ]
+
+    def aoi_exportacao(self):
+        # Reaproveita a AOI já lida pelo diagnóstico se o arquivo selecionado não mudou
+        caminho_aoi = self.aoi_info["geojson"]
+        aoi = self.aoi_intersecao if caminho_aoi == self.caminho_aoi_intersecao else None
+        return caminho_aoi, aoi
+
+    def exportar_csv_metricas(self):
+        from motor_intersecao import AreaInteresse, calcular_metricas, gravar_csv_metricas
+        if not getattr(self, "resultados_intersecao", None):
+            QMessageBox.warning(self, "Aviso", "Nenhum resultado disponível para exportar.")
+            return
+        caminho, _ = QFileDialog.getSaveFileName(self, "Salvar Métricas CSV", "", "CSV (*.csv)")
+        if not caminho:
+            return
+        camadas = self.camadas_marcadas()
+        campo_grupo = self.agrupar_input.text().strip() or None
+        if campo_grupo:
+            sem_campo = [c["nome"] for c in camadas if campo_grupo not in (c.get("colunas") or [])]
+            if sem_campo:
+                self.log(f"[Aviso] Campo '{campo_grupo}' ausente em {sem_campo}; totais sem agrupamento")
+        caminho_aoi, aoi = self.aoi_exportacao()
+        workers = self.workers_spin.value()
+        conexoes = self.obter_conexoes(workers)
+
+        def tarefa(trabalhador):
+            def ao_concluir(indice, tabela):
+                trabalhador.progresso.emit(indice + 1, len(camadas))
+            linhas, falhas = calcular_metricas(
+                conexoes, camadas, aoi or AreaInteresse.ler(caminho_aoi), campo_grupo=campo_grupo,
+                workers=workers, log=trabalhador.mensagem.emit, ao_concluir=ao_concluir,
+                cancelamento=self.cancelamento
+            )
+            gravar_csv_metricas(caminho, linhas, campo_grupo)
+            return falhas
+
+        self.caminho_metricas = caminho
+        self.iniciar_trabalho(tarefa, len(camadas), self.log, self.metricas_concluidas)
+
+    def metricas_concluidas(self, falhas):
+        if self.cancelamento.cancelado:
+            self.log(f"[Cancelado] Métricas interrompidas; CSV parcial em: {self.caminho_metricas}")
+            return
+        if falhas:
+            self.log(f"[Aviso] Camadas sem métricas por erro: {falhas}")
+        self.log(f"[Export] Métricas salvas em: {self.caminho_metricas}")
+
+    def exportar_csv_matriz(self):
+        from motor_intersecao import AreaInteresse, calcular_matriz, gravar_csv_matriz
+        if not getattr(self, "resultados_intersecao", None):
+            QMessageBox.warning(self, "Aviso", "Nenhum resultado disponível para exportar.")
+            return
+        caminho, _ = QFileDialog.getSaveFileName(self, "Salvar Matriz CSV", "", "CSV (*.csv)")
+        if not caminho:
+            return
+        camadas = self.camadas_marcadas()
+        campo_id = self.campo_id_input.text().strip() or None
+        caminho_aoi, aoi = self.aoi_exportacao()
+        workers = self.workers_spin.value()
+        conexoes = self.obter_conexoes(workers)
+
+        def tarefa(trabalhador):
+            def ao_concluir(indice, tabela):
+                trabalhador.progresso.emit(indice + 1, len(camadas))
+            ids, matriz, falhas = calcular_matriz(
+                conexoes, camadas, aoi or AreaInteresse.ler(caminho_aoi), campo_id=campo_id,
+                workers=workers, log=trabalhador.mensagem.emit, ao_concluir=ao_concluir,
+                cancelamento=self.cancelamento
+            )
+            gravar_csv_matriz(caminho, ids, matriz, campo_id)
+            return matriz, falhas
+
+        self.caminho_matriz = caminho
+        self.iniciar_trabalho(tarefa, len(camadas), self.log, self.matriz_concluida)
+
+    def matriz_concluida(self, retorno):
+        matriz, falhas = retorno
+        for r in self.resultados_intersecao:
+            if r["tabela"] in matriz:
+                r["matriz"] = matriz[r["tabela"]]
+        self.modelo_resultados.definir_matriz(matriz)
+        if self.cancelamento.cancelado:
+            self.log(f"[Cancelado] Matriz interrompida; CSV parcial em: {self.caminho_matriz}")
+            return
+        if falhas:
+            self.log(f"[Aviso] Camadas fora da matriz por erro: {falhas}")
+        self.log(f"[Export] Matriz salva em: {self.caminho_matriz}")
+
+    def exportar_geopackage_final(self):
+        from motor_intersecao import AreaInteresse, OperacaoCancelada, exportar_geopackage
+        if not getattr(self, "resultados_intersecao", None):
+            QMessageBox.warning(self, "Aviso", "Nenhum resultado disponível para exportar.")
+            return
+        caminho, _ = QFileDialog.getSaveFileName(self, "Salvar GeoPackage", "", "GeoPackage (*.gpkg)")
+        if not caminho:
+            return
+        camadas = self.camadas_marcadas()
+        caminho_aoi, aoi = self.aoi_exportacao()
+        conexoes = self.obter_conexoes(self.workers_spin.value())
+        recortar = self.recortar_chk.isChecked()
+        tolerancia = self.simplificar_spin.value() or None
+        casas_decimais = self.casas_spin.value() if self.casas_spin.value() >= 0 else None
+        desempenho = self.desempenho
+        cache_feicoes = self.cache_feicoes if self.cache_feicoes_chk.isChecked() else None
+        chave = chave_conexao(self.credenciais)
+
+        def tarefa(trabalhador):
+            def ao_concluir(indice, tabela):
+                trabalhador.progresso.emit(indice + 1, len(camadas))
+            try:
+                exportar_geopackage(
+                    conexoes, caminho, aoi or AreaInteresse.ler(caminho_aoi), camadas,
+                    log=trabalhador.mensagem.emit, ao_concluir=ao_concluir,
+                    cancelamento=self.cancelamento, recortar=recortar,
+                    tolerancia=tolerancia, casas_decimais=casas_decimais, desempenho=desempenho,
+                    cache_feicoes=cache_feicoes, chave=chave
+                )
+            except OperacaoCancelada:
+                return False
+            return True
+
+        self.caminho_exportacao = caminho
+        self.formato_exportacao = "GeoPackage"
+        self.iniciar_trabalho(tarefa, len(camadas), self.log, self.exportacao_concluida)
+
+    def exportar_geoparquet_final(self):
+        from motor_intersecao import AreaInteresse, OperacaoCancelada, exportar_geoparquet
+        if not getattr(self, "resultados_intersecao", None):
+            QMessageBox.warning(self, "Aviso", "Nenhum resultado disponível para exportar.")
+            return
+        pasta = QFileDialog.getExistingDirectory(self, "Pasta para os arquivos GeoParquet")
+        if not pasta:
+            return
+        camadas = self.camadas_marcadas()
+        caminho_aoi, aoi = self.aoi_exportacao()
+        conexoes = self.obter_conexoes(self.workers_spin.value())
+        recortar = self.recortar_chk.isChecked()
+        tolerancia = self.simplificar_spin.value() or None
+        casas_decimais = self.casas_spin.value() if self.casas_spin.value() >= 0 else None
+        desempenho = self.desempenho
+
+        def tarefa(trabalhador):
+            def ao_concluir(indice, tabela):
+                trabalhador.progresso.emit(indice + 1, len(camadas))
+            try:
+                exportar_geoparquet(
+                    conexoes, pasta, aoi or AreaInteresse.ler(caminho_aoi), camadas,
+                    log=trabalhador.mensagem.emit, ao_concluir=ao_concluir,
+                    cancelamento=self.cancelamento, recortar=recortar,
+                    tolerancia=tolerancia, casas_decimais=casas_decimais, desempenho=desempenho
+                )
+            except OperacaoCancelada:
+                return False
+            return True
+
+        self.caminho_exportacao = pasta
+        self.formato_exportacao = "GeoParquet"
+        self.iniciar_trabalho(tarefa, len(camadas), self.log, self.exportacao_concluida)
+
+    def exportacao_concluida(self, completa):
+        self.atualizar_tabela_desempenho()
+        if not completa:
+            self.log(f"[Cancelado] Exportação interrompida; {self.formato_exportacao} parcial em: {self.caminho_exportacao}")
+            return
+        QMessageBox.information(self, "Sucesso", f"{self.formato_exportacao} exportado com sucesso!")
+        self.log(f"[Export] {self.formato_exportacao} salvo em: {self.caminho_exportacao}")
+
+def main():
+    # --perfil-inicio: escreve quanto tempo cada etapa da abertura levou, e quanto cada
+    # módulo pesado levou para ser importado em segundo plano, e fecha a janela.
+    # --sem-pre-carregamento: só importa os módulos pesados quando forem usados.
+    perfil = "--perfil-inicio" in sys.argv
+    pre_carregar = "--sem-pre-carregamento" not in sys.argv
+    argv = [a for a in sys.argv if a not in ("--perfil-inicio", "--sem-pre-carregamento")]
+    marcos = [("importações da interface", time.perf_counter())]
+    app = QApplication(argv)
+    app.setStyleSheet(DARK_STYLE)
+    marcos.append(("QApplication", time.perf_counter()))
+    janela = AbaConexaoPostgre()
+    marcos.append(("janela montada", time.perf_counter()))
+    janela.show()
+
+    def relatorio(tempos):
+        anterior = INICIO
+        for etapa, instante in marcos:
+            print(f"[Início] {etapa}: {instante - anterior:.3f}s (acumulado {instante - INICIO:.3f}s)")
+            anterior = instante
+        for nome, segundos in tempos:
+            print(f"[Início]   import {nome}: " + ("não encontrado" if segundos is None else f"{segundos:.3f}s"))
+        print(f"[Início] pilha geoespacial pronta: {time.perf_counter() - INICIO:.3f}s desde o início")
+        app.quit()
+
+    def falha(msg):
+        # Sem a pilha geoespacial não há relatório; encerra em vez de deixar a janela aberta
+        print(f"[Erro] Falha no pré-carregamento: {msg}")
+        app.quit()
+
+    def janela_exibida():
+        marcos.append(("janela exibida", time.perf_counter()))
+        if perfil:
+            janela.pre_carregar(ao_concluir=relatorio, ao_falhar=falha)
+        elif pre_carregar:
+            janela.pre_carregar()
+
+    # Executado na primeira volta do laço de eventos, com a janela já na tela
+    QTimer.singleShot(0, janela_exibida)
+    return app.exec()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+from bisect import bisect_right
+
+from PyQt6.QtCore import Qt, QAbstractItemModel, QModelIndex, QSortFilterProxyModel
+
+
+class No:
+    # Nó da árvore de resultados. filhos é None enquanto o nó não foi expandido: os
+    # campos de uma camada e os valores de um campo só são criados em fetchMore.
+    __slots__ = ("pai", "tipo", "dados", "filhos", "chave")
+
+    def __init__(self, pai, tipo, dados, chave=None):
+        self.pai = pai
+        self.tipo = tipo
+        self.dados = dados
+        self.filhos = None
+        self.chave = chave
+
+
+class ModeloResultados(QAbstractItemModel):
+    # Uma camada por linha, na ordem do catálogo, com caixa de marcação para a exportação.
+    # Filhos sob demanda: "Feições da AOI com interseção" (quando há matriz) e um nó por
+    # campo; sob cada campo, os valores mais frequentes do resumo do diagnóstico. Os
+    # rótulos são montados em data(), na hora de desenhar.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.camadas = []
+        self.indices = []
+        self.marcadas = {}
+
+    # --- Alterações feitas pela janela ---
+
+    def limpar(self):
+        self.beginResetModel()
+        self.camadas = []
+        self.indices = []
+        self.marcadas = {}
+        self.endResetModel()
+
+    def inserir(self, indice, r):
+        # Resultados parciais chegam na ordem em que terminam; a posição segue o catálogo
+        posicao = bisect_right(self.indices, indice)
+        self.beginInsertRows(QModelIndex(), posicao, posicao)
+        self.camadas.insert(posicao, No(None, "camada", r))
+        self.indices.insert(posicao, indice)
+        self.marcadas[r["tabela"]] = True
+        self.endInsertRows()
+
+    def resultados_marcados(self):
+        return [no.dados for no in self.camadas if self.marcadas.get(no.dados["tabela"])]
+
+    def definir_matriz(self, matriz):
+        # matriz: {tabela: {feição da AOI: contagem}}. Camadas já expandidas têm os filhos
+        # refeitos para mostrar o nó da matriz.
+        for linha, no in enumerate(self.camadas):
+            contagens = matriz.get(no.dados["tabela"])
+            if contagens is None:
+                continue
+            no.dados["matriz"] = contagens
+            if no.filhos is not None:
+                indice = self.index(linha, 0)
+                if no.filhos:
+                    self.beginRemoveRows(indice, 0, len(no.filhos) - 1)
+                    no.filhos = None
+                    self.endRemoveRows()
+                else:
+                    no.filhos = None
+                self.fetchMore(indice)
+
+    # --- Interface de QAbstractItemModel ---
+
+    def no(self, indice):
+        return indice.internalPointer() if indice.isValid() else None
+
+    def index(self, linha, coluna, parent=QModelIndex()):
+        if coluna != 0 or linha < 0:
+            return QModelIndex()
+        pai = self.no(parent)
+        filhos = self.camadas if pai is None else (pai.filhos or [])
+        if linha >= len(filhos):
+            return QModelIndex()
+        return self.createIndex(linha, 0, filhos[linha])
+
+    def parent(self, indice):
+        no = self.no(indice)
+        if no is None or no.pai is None:
+            return QModelIndex()
+        pai = no.pai
+        irmaos = self.camadas if pai.pai is None else pai.pai.filhos
+        return self.createIndex(irmaos.index(pai), 0, pai)
+
+    def rowCount(self, parent=QModelIndex()):
+        pai = self.no(parent)
+        if pai is None:
+            return len(self.camadas) if not parent.isValid() else 0
+        return len(pai.filhos or [])
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        pai = self.no(parent)
+        if pai is None:
+            return bool(self.camadas)
+        if pai.filhos is not None:
+            return bool(pai.filhos)
+        return self._tem_filhos(pai)
+
+    def canFetchMore(self, parent):
+        pai = self.no(parent)
+        return pai is not None and pai.filhos is None and self._tem_filhos(pai)
+
+    def fetchMore(self, parent):
+        pai = self.no(parent)
+        if pai is None or pai.filhos is not None:
+            return
+        filhos = self._filhos(pai)
+        if not filhos:
+            pai.filhos = []
+            return
+        self.beginInsertRows(parent, 0, len(filhos) - 1)
+        pai.filhos = [No(pai, tipo, dados, chave) for tipo, dados, chave in filhos]
+        self.endInsertRows()
+
+    def _tem_filhos(self, no):
+        # Chamado a cada desenho de linha: responde sem montar a lista de filhos
+        if no.tipo == "camada":
+            return no.dados.get("matriz") is not None or bool(no.dados.get("colunas"))
+        if no.tipo == "campo":
+            return bool(no.dados and no.dados["valores"])
+        return no.tipo == "matriz" and bool(no.dados)
+
+    def _filhos(self, no):
+        # (tipo, dados, chave) dos filhos de um nó, sem criá-los
+        if no.tipo == "camada":
+            r = no.dados
+            filhos = []
+            if r.get("matriz") is not None:
+                filhos.append(("matriz", r["matriz"], None))
+            resumo = r.get("resumo") or {}
+            filhos.extend(("campo", resumo.get(campo), campo) for campo in r.get("colunas") or [])
+            return filhos
+        if no.tipo == "campo":
+            return [("valor", v, None) for v in (no.dados["valores"] if no.dados else [])]
+        if no.tipo == "matriz":
+            return [("feicao", contagem, identificador) for identificador, contagem in no.dados.items()]
+        return []
+
+    def flags(self, indice):
+        no = self.no(indice)
+        if no is None:
+            return Qt.ItemFlag.NoItemFlags
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if no.tipo == "camada":
+            flags |= Qt.ItemFlag.ItemIsUserCheckable
+        return flags
+
+    def data(self, indice, papel=Qt.ItemDataRole.DisplayRole):
+        no = self.no(indice)
+        if no is None:
+            return None
+        if papel == Qt.ItemDataRole.DisplayRole:
+            return self.rotulo(no)
+        if no.tipo != "camada":
+            return None
+        r = no.dados
+        if papel == Qt.ItemDataRole.CheckStateRole:
+            return Qt.CheckState.Checked if self.marcadas.get(r["tabela"]) else Qt.CheckState.Unchecked
+        if papel == Qt.ItemDataRole.ToolTipRole and r.get("aproximado"):
+            return f"Contagem aproximada pelo retângulo envolvente: ~{r['count']} feições"
+        return None
+
+    def setData(self, indice, valor, papel=Qt.ItemDataRole.EditRole):
+        no = self.no(indice)
+        if no is None or no.tipo != "camada" or papel != Qt.ItemDataRole.CheckStateRole:
+            return False
+        self.marcadas[no.dados["tabela"]] = Qt.CheckState(valor) == Qt.CheckState.Checked
+        self.dataChanged.emit(indice, indice, [papel])
+        return True
+
+    def headerData(self, secao, orientacao, papel=Qt.ItemDataRole.DisplayRole):
+        if orientacao == Qt.Orientation.Horizontal and papel == Qt.ItemDataRole.DisplayRole:
+            return "Camada"
+        return None
+
+    @staticmethod
+    def rotulo(no):
+        if no.tipo == "camada":
+            return no.dados["tabela"]
+        if no.tipo == "campo":
+            info = no.dados
+            rotulo = f" {no.chave}"
+            if info and info["distintos"] > len(info["valores"]):
+                rotulo += f" ({info['distintos']} valores distintos na amostra)"
+            return rotulo
+        if no.tipo == "valor":
+            return f"  -> {no.dados}"
+        if no.tipo == "matriz":
+            return f" Feições da AOI com interseção: {len(no.dados)}"
+        return f"  -> {no.chave}: {no.dados} feições"
+
+
+class FiltroResultados(QSortFilterProxyModel):
+    # Filtra por trecho do nome da camada ou de um campo, sem diferenciar maiúsculas. Os
+    # nomes dos campos vêm de r["colunas"], então a busca não obriga a criar os nós filhos:
+    # uma camada aparece se o nome dela ou de algum campo contém o texto; expandida, mostra
+    # todos os campos quando o nome da camada corresponde, ou só os campos que correspondem.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.texto = ""
+
+    def definir_filtro(self, texto):
+        self.texto = texto.strip().casefold()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, linha, parent):
+        if not self.texto:
+            return True
+        modelo = self.sourceModel()
+        no = modelo.no(modelo.index(linha, 0, parent))
+        if no is None:
+            return False
+        if no.tipo == "camada":
+            return self.texto in no.dados["tabela"].casefold() or any(
+                self.texto in campo.casefold() for campo in no.dados.get("colunas") or []
+            )
+        if no.tipo == "campo":
+            return self.texto in no.pai.dados["tabela"].casefold() or self.texto in no.chave.casefold()
+        return True
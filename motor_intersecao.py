@@ -0,0 +1,1924 @@
+import base64
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import sql
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Máximo de vértices por pedaço da AOI subdividida no servidor
+VERTICES_POR_PEDACO = 256
+
+# Incrementar quando a consulta de diagnóstico mudar o que devolve, invalidando o cache de resultados
+VERSAO_RESULTADOS = 2
+
+
+class OperacaoCancelada(Exception):
+    pass
+
+
+class TempoEsgotado(Exception):
+    # A consulta de uma tabela passou do statement_timeout configurado
+    pass
+
+
+class ControleCancelamento:
+    # Compartilhado entre a interface e o motor: cancelar() interrompe no servidor
+    # as consultas em andamento e impede que novas sejam iniciadas
+    def __init__(self):
+        self._evento = threading.Event()
+        self._ativas = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelado(self):
+        return self._evento.is_set()
+
+    def verificar(self):
+        if self.cancelado:
+            raise OperacaoCancelada()
+
+    def cancelar(self):
+        self._evento.set()
+        with self._lock:
+            ativas = list(self._ativas)
+        for conn in ativas:
+            try:
+                conn.cancel()
+            except Exception:
+                pass
+
+    @contextmanager
+    def monitorar(self, conn):
+        self.verificar()
+        with self._lock:
+            self._ativas.add(conn)
+        try:
+            yield conn
+        except psycopg2.extensions.QueryCanceledError:
+            if self.cancelado:
+                raise OperacaoCancelada()
+            raise
+        finally:
+            with self._lock:
+                self._ativas.discard(conn)
+
+
+class RegistroDesempenho:
+    # Medições de uma execução, uma linha por tabela e etapa ("diagnostico" ou "exportacao"),
+    # preenchidas pelas threads do pool. Tempos em segundos. tempo_total é o tempo de parede
+    # da chamada que incluiu a tabela (num lote, a chamada do grupo inteiro); tempo_servidor
+    # é o tempo da tabela no servidor (na exportação, a espera pelos lotes do cursor).
+    CAMPOS = ["etapa", "tabela", "tempo_total", "tempo_servidor", "linhas_lidas",
+              "linhas_encontradas", "bytes", "tabelas_na_chamada", "erro", "plano"]
+
+    def __init__(self):
+        self.inicio = time.time()
+        self.linhas = []
+        self._lock = threading.Lock()
+
+    def registrar(self, **medicao):
+        linha = dict.fromkeys(self.CAMPOS)
+        linha.update(medicao)
+        with self._lock:
+            self.linhas.append(linha)
+
+    def mais_lentas(self, etapa, quantidade=None):
+        with self._lock:
+            linhas = [l for l in self.linhas if l["etapa"] == etapa and l["erro"] is None]
+        linhas.sort(key=lambda l: -(l["tempo_servidor"] if l["tempo_servidor"] is not None else l["tempo_total"] or 0))
+        return linhas[:quantidade]
+
+
+class ConexaoUnica:
+    # Execução sequencial: todas as consultas usam a conexão já aberta pela janela
+    tamanho = 1
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextmanager
+    def conexao(self, preferida=None):
+        yield self.conn
+
+    def fechar(self):
+        pass
+
+
+class PoolConexoes:
+    # Pool limitado de conexões abertas sob demanda com as mesmas credenciais
+    def __init__(self, credenciais, tamanho):
+        self.credenciais = dict(credenciais)
+        self.tamanho = max(1, int(tamanho))
+        self._livres = []
+        self._todas = []
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def conexao(self, preferida=None):
+        # preferida: PID de uma sessão específica (ex.: a que guardou dados em tabelas
+        # temporárias). Se essa sessão ainda existir, espera por ela.
+        conn = self._obter(preferida)
+        try:
+            yield conn
+        finally:
+            self._devolver(conn)
+
+    def _obter(self, preferida):
+        with self._cond:
+            while True:
+                if preferida is not None:
+                    sessao = [c for c in self._todas if not c.closed and c.get_backend_pid() == preferida]
+                    if sessao:
+                        if sessao[0] in self._livres:
+                            self._livres.remove(sessao[0])
+                            return sessao[0]
+                        self._cond.wait()
+                        continue
+                if self._livres:
+                    return self._livres.pop()
+                if len(self._todas) < self.tamanho:
+                    break
+                self._cond.wait()
+            conn = psycopg2.connect(**self.credenciais)
+            self._todas.append(conn)
+            return conn
+
+    def _devolver(self, conn):
+        with self._cond:
+            if conn.closed:
+                self._todas.remove(conn)
+            else:
+                self._livres.append(conn)
+            self._cond.notify_all()
+
+    def fechar(self):
+        with self._cond:
+            for conn in self._todas:
+                if not conn.closed:
+                    conn.close()
+            self._livres.clear()
+            self._todas.clear()
+
+
+class AreaInteresse:
+    # AOI dissolvida em EPSG:4674; o hash do WKB identifica a AOI nas conexões e caches
+    def __init__(self, geometria, gdf=None):
+        self.geometria = geometria
+        self.gdf = gdf
+        self.wkb = geometria.wkb
+        self.hash = hashlib.sha1(self.wkb).hexdigest()
+
+    @classmethod
+    def ler(cls, caminho):
+        aoi = gpd.read_file(caminho).to_crs(epsg=4674)
+        return cls(aoi.geometry.union_all(), aoi)
+
+    def identificadores(self, campo=None):
+        # Identificador de cada feição da AOI: o valor do campo escolhido ou a posição
+        # no arquivo (1, 2, ...)
+        if not campo:
+            return [str(i) for i in range(1, len(self.gdf) + 1)]
+        if campo not in self.gdf.columns:
+            raise ValueError(f"Campo '{campo}' não existe na AOI")
+        ids = self.gdf[campo].astype(str).tolist()
+        if len(set(ids)) != len(ids):
+            raise ValueError(f"Campo '{campo}' tem valores repetidos na AOI")
+        return ids
+
+
+# Conexões que já têm a AOI atual carregada (conexão -> hash da AOI)
+_aoi_por_conexao = weakref.WeakKeyDictionary()
+
+
+def garantir_aoi(conn, aoi):
+    # Carrega a AOI uma única vez por sessão numa tabela temporária subdividida e
+    # indexada. O hash fica no comentário da tabela, então uma conexão reaproveitada
+    # só recebe a geometria de novo quando a AOI muda.
+    if _aoi_por_conexao.get(conn) == aoi.hash:
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT obj_description(to_regclass('pg_temp.diglet_aoi'), 'pg_class')")
+            if cur.fetchone()[0] != aoi.hash:
+                cur.execute("DROP TABLE IF EXISTS pg_temp.diglet_aoi")
+                cur.execute(
+                    """
+                    CREATE TEMP TABLE diglet_aoi AS
+                    SELECT ST_Subdivide(ST_GeomFromWKB(%s, 4674), %s) AS geom
+                    """,
+                    (psycopg2.Binary(aoi.wkb), VERTICES_POR_PEDACO)
+                )
+                cur.execute("CREATE INDEX ON pg_temp.diglet_aoi USING GIST (geom)")
+                cur.execute("ANALYZE pg_temp.diglet_aoi")
+                cur.execute("COMMENT ON TABLE pg_temp.diglet_aoi IS %s", (aoi.hash,))
+                # Feições encontradas pelo diagnóstico (ctid por tabela); valem só para esta AOI
+                cur.execute("DROP TABLE IF EXISTS pg_temp.diglet_acertos")
+                cur.execute("CREATE TEMP TABLE diglet_acertos (tabela text, id tid)")
+                cur.execute("CREATE INDEX ON pg_temp.diglet_acertos (tabela)")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    _aoi_por_conexao[conn] = aoi.hash
+
+
+# Conexões que já têm as feições da AOI carregadas (conexão -> hash da AOI e dos identificadores)
+_feicoes_por_conexao = weakref.WeakKeyDictionary()
+
+
+def garantir_feicoes_aoi(conn, aoi, ids):
+    # Feições da AOI, uma linha por identificador, para a matriz feição x camada. Ao
+    # contrário de diglet_aoi, as feições não são subdivididas: cada par (feição da AOI,
+    # feição da camada) aparece uma vez na junção, e o PostGIS prepara as geometrias
+    # grandes da AOI ao reutilizá-las na junção.
+    chave = hashlib.sha1((aoi.hash + "\n" + "\n".join(ids)).encode()).hexdigest()
+    if _feicoes_por_conexao.get(conn) == chave:
+        return
+    geometrias = aoi.gdf.geometry.values
+    validas = ~(shapely.is_missing(geometrias) | shapely.is_empty(geometrias))
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS pg_temp.diglet_aoi_feicoes")
+            cur.execute("CREATE TEMP TABLE diglet_aoi_feicoes (id text, geom geometry)")
+            cur.execute(
+                """
+                INSERT INTO pg_temp.diglet_aoi_feicoes (id, geom)
+                SELECT u.id, ST_GeomFromWKB(u.wkb, 4674)
+                FROM unnest(%s::text[], %s::bytea[]) AS u(id, wkb)
+                """,
+                (
+                    [i for i, valida in zip(ids, validas) if valida],
+                    [psycopg2.Binary(shapely.to_wkb(g)) for g in geometrias[validas]]
+                )
+            )
+            cur.execute("CREATE INDEX ON pg_temp.diglet_aoi_feicoes USING GIST (geom)")
+            cur.execute("ANALYZE pg_temp.diglet_aoi_feicoes")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    _feicoes_por_conexao[conn] = chave
+
+
+def _consultar_geometry_columns(conn, esquema):
+    # Uma entrada por tabela (a primeira coluna geométrica registrada), na ordem do catálogo
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT g.f_table_name, g.f_geometry_column, g.srid, g.type, g.coord_dimension, c.relkind
+            FROM geometry_columns g
+            JOIN pg_namespace n ON n.nspname = g.f_table_schema
+            JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = g.f_table_name
+            WHERE g.f_table_schema = %s;
+        """, (esquema,))
+        linhas = cur.fetchall()
+    camadas = []
+    vistas = set()
+    for tabela, coluna_geom, srid, tipo, dimensao, relkind in linhas:
+        if tabela in vistas:
+            continue
+        vistas.add(tabela)
+        camadas.append({"esquema": esquema, "tabela": tabela, "nome": tabela, "coluna_geom": coluna_geom,
+                        "srid": srid, "tipo": tipo, "dimensao": dimensao, "relkind": relkind})
+    return camadas
+
+
+def listar_esquemas_geometria(conn):
+    # Esquemas que têm ao menos uma coluna registrada em geometry_columns
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT f_table_schema FROM geometry_columns ORDER BY 1;")
+            return [linha[0] for linha in cur.fetchall()]
+    finally:
+        conn.rollback()
+
+
+def marcadores_alteracao(conn, esquema, incluir_analise=False):
+    # Marcador por relação do esquema: muda quando há INSERT/UPDATE/DELETE (pg_stat_user_tables)
+    # ou quando o arquivo da tabela é trocado (TRUNCATE, VACUUM FULL, CLUSTER).
+    # Visões e tabelas particionadas não têm contadores próprios e ficam com None.
+    # incluir_analise: marcador dos metadados da listagem. Muda também a cada ANALYZE, para
+    # os metadados que vêm das estatísticas (linhas e extensão estimadas), que só se
+    # atualizam com ele, e quando uma coluna geométrica é criada, removida, renomeada ou
+    # muda de tipo ou SRID (o que não mexe nos contadores); nesse modo, todas as relações
+    # têm marcador.
+    if incluir_analise:
+        marcador = sql.SQL("""concat_ws('|',
+                   CASE WHEN c.relkind IN ('r', 'm') THEN
+                       c.relfilenode::text || ':' ||
+                       COALESCE(s.n_tup_ins + s.n_tup_upd + s.n_tup_del, 0)::text || ':' ||
+                       COALESCE(COALESCE(s.last_analyze, s.last_autoanalyze)::text, '')
+                   END,
+                   (SELECT string_agg(a.attname || ' ' || format_type(a.atttypid, a.atttypmod), ', '
+                                      ORDER BY a.attnum)
+                    FROM pg_attribute a
+                    WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+                    AND format_type(a.atttypid, NULL) = 'geometry'))""")
+    else:
+        marcador = sql.SQL("""CASE WHEN c.relkind IN ('r', 'm') THEN
+                       c.relfilenode::text || ':' ||
+                       COALESCE(s.n_tup_ins + s.n_tup_upd + s.n_tup_del, 0)::text
+                   END""")
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("""
+            SELECT c.relname, {marcador}
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE n.nspname = %s
+            AND c.relkind IN ('r', 'v', 'm', 'p', 'f');
+        """).format(marcador=marcador), (esquema,))
+        return dict(cur.fetchall())
+
+
+def estatisticas_camadas(conn, esquema, camadas):
+    # {tabela: {"linhas_estimadas", "extensao"}} numa só consulta: linhas estimadas
+    # (pg_class.reltuples) e extensão estimada pelo ANALYZE, levada a EPSG:4674. O retângulo
+    # é densificado antes da reprojeção para que as bordas curvas fiquem dentro dele.
+    # Tabelas sem estatísticas da coluna, ou alteradas desde o último ANALYZE (cuja extensão
+    # estimada pode não incluir as linhas novas), ficam sem extensão e não são podadas.
+    estatisticas = {c["tabela"]: {"linhas_estimadas": None, "extensao": None} for c in camadas}
+    if not camadas:
+        return estatisticas
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT l.tabela, c.reltuples, ST_XMin(y.b), ST_YMin(y.b), ST_XMax(y.b), ST_YMax(y.b)
+                FROM unnest(%(tabelas)s::text[], %(colunas)s::text[], %(srids)s::int[]) AS l(tabela, coluna, srid)
+                JOIN pg_namespace n ON n.nspname = %(esquema)s
+                JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = l.tabela
+                LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+                CROSS JOIN LATERAL (
+                    SELECT CASE WHEN c.relkind IN ('r', 'm', 'p')
+                        AND COALESCE(s.n_mod_since_analyze, 0) = 0
+                        AND EXISTS (
+                            SELECT 1 FROM pg_stats p
+                            WHERE p.schemaname = n.nspname AND p.tablename = l.tabela AND p.attname = l.coluna
+                        )
+                    THEN ST_EstimatedExtent(n.nspname, l.tabela, l.coluna) END AS e
+                ) x
+                CROSS JOIN LATERAL (
+                    SELECT CASE WHEN l.srid IN (0, 4674) THEN x.e
+                    ELSE ST_Transform(
+                        ST_Segmentize(
+                            ST_SetSRID(x.e::geometry, l.srid),
+                            GREATEST(ST_XMax(x.e) - ST_XMin(x.e), ST_YMax(x.e) - ST_YMin(x.e), 1e-6) / 32
+                        ), 4674
+                    )::box2d END AS b
+                ) y;
+            """, {"esquema": esquema, "tabelas": [c["tabela"] for c in camadas],
+                  "colunas": [c["coluna_geom"] for c in camadas], "srids": [c["srid"] or 0 for c in camadas]})
+            for tabela, linhas, *extensao in cur.fetchall():
+                estatisticas[tabela] = {"linhas_estimadas": linhas,
+                                        "extensao": list(extensao) if extensao[0] is not None else None}
+    except psycopg2.Error:
+        # Falha ao ler as estatísticas: nenhuma camada é podada
+        pass
+    finally:
+        conn.rollback()
+    return estatisticas
+
+
+def listar_camadas(conn, esquema, cache=None, chave=None, log=print):
+    # Sem cache, consulta geometry_columns diretamente. Com cache, uma única consulta aos
+    # marcadores de alteração decide o que pode ser reaproveitado: geometry_columns só é
+    # consultada de novo se alguma relação do esquema mudou (ou surgiu, ou sumiu), e as
+    # estatísticas só são recalculadas para as tabelas alteradas desde a última visita.
+    if cache is None:
+        try:
+            return _consultar_geometry_columns(conn, esquema)
+        finally:
+            conn.rollback()
+
+    try:
+        marcadores = marcadores_alteracao(conn, esquema, incluir_analise=True)
+        anterior = cache.obter(chave, esquema)
+        if anterior and anterior["marcadores"] == marcadores:
+            camadas = [dict(c, esquema=esquema, nome=c["tabela"]) for c in anterior["camadas"]]
+        else:
+            camadas = _consultar_geometry_columns(conn, esquema)
+    finally:
+        conn.rollback()
+
+    antigas = {c["tabela"]: c for c in anterior["camadas"]} if anterior else {}
+    alteradas = []
+    for camada in camadas:
+        antiga = antigas.get(camada["tabela"])
+        marcador = marcadores.get(camada["tabela"])
+        # Visões e tabelas particionadas não têm contadores: estatísticas sempre relidas
+        if (antiga and camada.get("relkind") in ("r", "m") and antiga.get("marcador") == marcador
+                and antiga["coluna_geom"] == camada["coluna_geom"] and antiga["srid"] == camada["srid"]):
+            camada["linhas_estimadas"] = antiga.get("linhas_estimadas")
+            camada["extensao"] = antiga.get("extensao")
+        else:
+            alteradas.append(camada)
+        camada["marcador"] = marcador
+    estatisticas = estatisticas_camadas(conn, esquema, alteradas)
+    for camada in alteradas:
+        camada.update(estatisticas[camada["tabela"]])
+    atualizadas = len(alteradas)
+    cache.gravar(chave, esquema, {"marcadores": marcadores, "camadas": camadas})
+    log(f"[Cache] Metadados de '{esquema}': {len(camadas) - atualizadas} reaproveitados, {atualizadas} atualizados")
+    return camadas
+
+
+def listar_camadas_banco(conn, cache=None, chave=None, log=print):
+    # Todas as camadas do banco numa lista só; o nome exibido leva o esquema
+    # (esquema.tabela) para que tabelas homônimas de esquemas diferentes não se confundam
+    camadas = []
+    for esquema in listar_esquemas_geometria(conn):
+        for camada in listar_camadas(conn, esquema, cache=cache, chave=chave, log=log):
+            camada["nome"] = f"{esquema}.{camada['tabela']}"
+            camadas.append(camada)
+    return camadas
+
+
+# Folga aplicada à extensão estimada, que vem de uma amostra do ANALYZE e pode ficar
+# um pouco aquém da extensão real
+MARGEM_EXTENSAO = 0.05
+
+
+def fora_da_extensao(camada, aoi):
+    extensao = camada.get("extensao")
+    if not extensao:
+        return False
+    xmin, ymin, xmax, ymax = extensao
+    dx = (xmax - xmin) * MARGEM_EXTENSAO
+    dy = (ymax - ymin) * MARGEM_EXTENSAO
+    axmin, aymin, axmax, aymax = aoi.geometria.bounds
+    return axmin > xmax + dx or axmax < xmin - dx or aymin > ymax + dy or aymax < ymin - dy
+
+
+def geometria_aoi(camada, alias="a"):
+    # A AOI é levada ao SRID da camada para que o índice da coluna geométrica continue utilizável
+    geom = sql.SQL("{}.geom").format(sql.Identifier(alias))
+    if camada["srid"] in (0, 4674):
+        return geom
+    return sql.SQL("ST_Transform({}, {})").format(geom, sql.Literal(camada["srid"]))
+
+
+def filtro_aoi(camada, coluna, tabela_aoi="diglet_aoi"):
+    # Predicado completo: && usa o índice GiST antes do teste exato de ST_Intersects.
+    # EXISTS evita contar duas vezes feições que tocam mais de um pedaço da AOI.
+    # tabela_aoi: tabela temporária com os pedaços (diglet_aoi ou diglet_restante).
+    return sql.SQL("""EXISTS (
+            SELECT 1 FROM {tabela} a
+            WHERE {g} && {aoi} AND ST_Intersects({g}, {aoi})
+        )""").format(tabela=sql.Identifier("pg_temp", tabela_aoi), g=coluna, aoi=geometria_aoi(camada))
+
+
+def chave_acertos(camada):
+    # Identifica a tabela em pg_temp.diglet_acertos; qualificada pelo esquema porque a
+    # mesma sessão pode ter consultado tabelas homônimas de esquemas diferentes
+    return f"{camada['esquema']}.{camada['tabela']}"
+
+
+def fonte_encontrados(camada, identificar=False):
+    # Trecho FROM ... WHERE com as feições que intersectam a AOI. Todas as colunas da tabela
+    # ficam disponíveis em "c"; c.diglet_geom é a geometria e, com identificar=True,
+    # c.diglet_id é o ctid da feição.
+    geom = sql.Identifier(camada["coluna_geom"])
+    # A subconsulta só passa adiante as linhas cujo retângulo envolvente toca a AOI;
+    # OFFSET 0 impede que o planejador antecipe ST_IsValid para a tabela inteira.
+    return sql.SQL("""
+        FROM (
+            SELECT {id}t.*, t.{geom} AS diglet_geom
+            FROM {tabela} t
+            WHERE {filtro_srid}EXISTS (
+                SELECT 1 FROM pg_temp.diglet_aoi a
+                WHERE t.{geom} && {aoi}
+            )
+            OFFSET 0
+        ) c
+        WHERE ST_IsValid(c.diglet_geom)
+        AND {intersecta}
+    """).format(
+        id=sql.SQL("t.ctid AS diglet_id, " if identificar else ""),
+        geom=geom,
+        tabela=sql.Identifier(camada["esquema"], camada["tabela"]),
+        aoi=geometria_aoi(camada),
+        # Colunas sem SRID declarado podem misturar sistemas; mantém só as de 4674
+        filtro_srid=sql.SQL("ST_SRID(t.{}) = 4674 AND ").format(geom) if camada["srid"] == 0 else sql.SQL(""),
+        intersecta=filtro_aoi(camada, sql.SQL("c.diglet_geom"))
+    )
+
+
+# Máximo de tabelas numa única chamada em lote; lotes menores dão retorno de progresso mais frequente
+TABELAS_POR_LOTE = 200
+
+# Feições que intersectam a AOI lidas por tabela para montar o resumo dos campos
+LIMITE_AMOSTRA = 1000
+
+# Função temporária que diagnostica uma ou várias tabelas numa só ida ao servidor. Para cada
+# tabela, um único comando devolve a contagem e, havendo feições, o resumo dos campos: até
+# 5 valores mais frequentes e o número de valores distintos por campo, calculados sobre as
+# primeiras LIMITE_AMOSTRA feições que intersectam a AOI. Só atributos comuns entram na
+# amostra (geometria, raster e bytea ficam no servidor). O filtro espacial roda uma vez só:
+# com identificados[i] (tabelas e views materializadas, cuja fonte traz c.diglet_id), só os
+# ctids encontrados ficam guardados e a amostra relê as primeiras LIMITE_AMOSTRA feições por
+# ctid; nas demais relações, as próprias linhas encontradas ficam guardadas para a contagem e
+# a amostra (uma CTE usada duas vezes é materializada). Com acertos[i] preenchido, os ctids
+# vão para pg_temp.diglet_acertos no mesmo comando. Tabelas com filhas por herança (INHERITS)
+# são lidas junto com as filhas, e o ctid não identifica a feição entre elas: essas tabelas
+# seguem como as demais relações, sem registrar acertos (marcador fica NULL).
+# tempo_ms é o tempo gasto no servidor pela tabela e lidas, as linhas lidas dela (varredura
+# sequencial + buscas por índice, de pg_stat_xact_user_tables; NULL para views).
+# Cada tabela roda no seu próprio bloco EXCEPTION (uma subtransação): o erro fica na coluna
+# "erro" e as demais tabelas seguem. Cancelamentos (query_canceled) não são capturados por
+# WHEN OTHERS e interrompem a chamada inteira.
+FUNCAO_LOTE = """
+    CREATE OR REPLACE FUNCTION pg_temp.diglet_lote(
+        esquemas text[], tabelas text[], colunas_geom text[], fontes text[],
+        identificados boolean[], acertos text[], limite integer
+    )
+    RETURNS TABLE (indice integer, contagem bigint, colunas text[], resumo json,
+                   marcador text, erro text, tempo_ms double precision, lidas bigint)
+    LANGUAGE plpgsql AS $lote$
+    DECLARE
+        relacao regclass;
+        lista text;
+        ctes text;
+        sql_amostra text;
+        identificada boolean;
+        inicio timestamptz;
+        lidas_antes bigint;
+    BEGIN
+        FOR i IN 1 .. COALESCE(array_length(tabelas, 1), 0) LOOP
+            indice := i - 1;
+            contagem := NULL;
+            colunas := NULL;
+            resumo := NULL;
+            marcador := NULL;
+            erro := NULL;
+            lidas := NULL;
+            inicio := clock_timestamp();
+            BEGIN
+                relacao := format('%I.%I', esquemas[i], tabelas[i])::regclass;
+                SELECT COALESCE(st.seq_tup_read, 0) + COALESCE(st.idx_tup_fetch, 0) INTO lidas_antes
+                FROM pg_stat_xact_user_tables st WHERE st.relid = relacao;
+                SELECT array_agg(att.attname::text ORDER BY att.attnum),
+                       string_agg('c.' || quote_ident(att.attname), ', ' ORDER BY att.attnum)
+                           FILTER (WHERE format_type(att.atttypid, NULL)
+                                   NOT IN ('geometry', 'geography', 'raster', 'bytea'))
+                INTO colunas, lista
+                FROM pg_attribute att
+                WHERE att.attrelid = relacao AND att.attnum > 0 AND NOT att.attisdropped
+                AND att.attname <> colunas_geom[i];
+
+                SELECT identificados[i] AND NOT cl.relhassubclass INTO identificada
+                FROM pg_class cl WHERE cl.oid = relacao;
+                IF acertos[i] IS NOT NULL THEN
+                    DELETE FROM pg_temp.diglet_acertos WHERE tabela = acertos[i];
+                END IF;
+
+                IF acertos[i] IS NOT NULL AND identificada THEN
+                    ctes := 'encontrados AS (INSERT INTO pg_temp.diglet_acertos (tabela, id) SELECT '
+                        || quote_literal(acertos[i]) || ', c.diglet_id ' || fontes[i]
+                        || ' RETURNING id)';
+                ELSIF lista IS NULL THEN
+                    ctes := 'encontrados AS (SELECT 1 ' || fontes[i] || ')';
+                ELSIF identificada THEN
+                    ctes := 'encontrados AS (SELECT c.diglet_id AS id ' || fontes[i] || ')';
+                ELSE
+                    ctes := 'encontrados AS (SELECT ' || lista || ' ' || fontes[i] || ')';
+                END IF;
+                ctes := ctes || ', total AS (SELECT COUNT(*) AS n FROM encontrados)';
+                IF identificada THEN
+                    sql_amostra := 'SELECT ' || lista || ' FROM ' || format('%I.%I', esquemas[i], tabelas[i])
+                        || ' c WHERE c.ctid = ANY (ARRAY(SELECT id FROM encontrados LIMIT ' || limite || '))';
+                ELSE
+                    sql_amostra := 'SELECT * FROM encontrados LIMIT ' || limite;
+                END IF;
+
+                IF lista IS NULL THEN
+                    EXECUTE 'WITH ' || ctes || ' SELECT n, NULL::json FROM total'
+                    INTO contagem, resumo;
+                ELSE
+                    -- A amostra só é lida quando há feições (o CASE não avalia o resumo com n = 0)
+                    EXECUTE 'WITH ' || ctes
+                        || ', amostra AS (' || sql_amostra || ')'
+                        || ' SELECT n, CASE WHEN n > 0 THEN (' || $resumo$
+                            SELECT json_object_agg(campo, json_build_object(
+                                'distintos', distintos, 'valores', valores))
+                            FROM (
+                                SELECT campo, COUNT(*) AS distintos,
+                                       (array_agg(valor ORDER BY frequencia DESC, valor))[1:5] AS valores
+                                FROM (
+                                    SELECT e.key AS campo, left(btrim(e.value #>> '{}'), 100) AS valor,
+                                           COUNT(*) AS frequencia
+                                    FROM amostra s, jsonb_each(to_jsonb(s)) e
+                                    WHERE jsonb_typeof(e.value) NOT IN ('object', 'array', 'null')
+                                    GROUP BY 1, 2
+                                ) f
+                                WHERE valor <> ''
+                                GROUP BY campo
+                            ) r
+                        $resumo$ || ') END FROM total'
+                    INTO contagem, resumo;
+                END IF;
+
+                IF acertos[i] IS NOT NULL AND identificada THEN
+                    SELECT cl.relfilenode::text || ':' ||
+                           COALESCE(st.n_tup_ins + st.n_tup_upd + st.n_tup_del, 0)::text
+                    INTO marcador
+                    FROM pg_class cl
+                    LEFT JOIN pg_stat_user_tables st ON st.relid = cl.oid
+                    WHERE cl.oid = relacao;
+                END IF;
+
+                SELECT COALESCE(st.seq_tup_read, 0) + COALESCE(st.idx_tup_fetch, 0) - lidas_antes INTO lidas
+                FROM pg_stat_xact_user_tables st WHERE st.relid = relacao;
+            EXCEPTION WHEN OTHERS THEN
+                erro := SQLERRM;
+            END;
+            tempo_ms := 1000 * extract(epoch FROM clock_timestamp() - inicio);
+            RETURN NEXT;
+        END LOOP;
+    END;
+    $lote$
+"""
+
+# Custo estimado pelo planejador (EXPLAIN, sem executar) da contagem de cada tabela;
+# NULL quando o plano não pode ser obtido
+FUNCAO_CUSTOS = """
+    CREATE OR REPLACE FUNCTION pg_temp.diglet_custos(consultas text[])
+    RETURNS TABLE (indice integer, custo double precision)
+    LANGUAGE plpgsql AS $custos$
+    DECLARE
+        plano json;
+    BEGIN
+        FOR i IN 1 .. COALESCE(array_length(consultas, 1), 0) LOOP
+            indice := i - 1;
+            custo := NULL;
+            BEGIN
+                EXECUTE 'EXPLAIN (FORMAT JSON) ' || consultas[i] INTO plano;
+                custo := (plano -> 0 -> 'Plan' ->> 'Total Cost')::double precision;
+            EXCEPTION WHEN OTHERS THEN
+                NULL;
+            END;
+            RETURN NEXT;
+        END LOOP;
+    END;
+    $custos$
+"""
+
+# Conexões em que as funções de diagnóstico já foram criadas
+_lote_por_conexao = weakref.WeakKeyDictionary()
+
+
+def garantir_funcao_lote(conn):
+    if _lote_por_conexao.get(conn):
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute(FUNCAO_LOTE)
+            cur.execute(FUNCAO_CUSTOS)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    _lote_por_conexao[conn] = True
+
+
+def limite_tempo(segundos):
+    # SET LOCAL vale só até o fim da transação; vai no mesmo comando da consulta, sem ida extra
+    if not segundos:
+        return sql.SQL("")
+    return sql.SQL("SET LOCAL statement_timeout = {}; ").format(sql.Literal(int(segundos * 1000)))
+
+
+def estimar_custos(conn, camadas, aoi):
+    # Custo do plano da contagem de cada tabela, numa só ida ao servidor; None quando indisponível
+    garantir_aoi(conn, aoi)
+    garantir_funcao_lote(conn)
+    consultas = [
+        sql.SQL("SELECT COUNT(*) {}").format(fonte_encontrados(c)).as_string(conn) for c in camadas
+    ]
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT indice, custo FROM pg_temp.diglet_custos(%s);", (consultas,))
+            custos = dict(cur.fetchall())
+    finally:
+        conn.rollback()
+    return [custos.get(i) for i in range(len(camadas))]
+
+
+def contar_aproximado(conn, camada, aoi, tempo_limite=None):
+    # Conta as feições cujo retângulo envolvente toca a AOI (só o operador &&, atendido pelo
+    # índice), sem ST_IsValid nem ST_Intersects. É mais rápida e superestima a contagem exata.
+    geom = sql.Identifier(camada["coluna_geom"])
+    query = sql.SQL("""{limite}SELECT COUNT(*)
+        FROM {tabela} t
+        WHERE {filtro_srid}EXISTS (
+            SELECT 1 FROM pg_temp.diglet_aoi a
+            WHERE t.{geom} && {aoi}
+        );
+    """).format(
+        limite=limite_tempo(tempo_limite),
+        tabela=sql.Identifier(camada["esquema"], camada["tabela"]),
+        geom=geom,
+        aoi=geometria_aoi(camada),
+        filtro_srid=sql.SQL("ST_SRID(t.{}) = 4674 AND ").format(geom) if camada["srid"] == 0 else sql.SQL("")
+    )
+    garantir_aoi(conn, aoi)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query)
+            count = cur.fetchone()[0]
+        # Sem resumo dos campos, mas com a lista deles, como nos resultados exatos
+        colunas = colunas_atributos(conn, camada)
+    finally:
+        conn.rollback()
+    return {"tabela": camada["nome"], "count": count, "colunas": colunas, "aproximado": True}
+
+
+def consultar_lote(conn, camadas, aoi, registrar=False, tempo_limite=None, desempenho=None):
+    # Contagem e resumo dos campos de uma ou mais tabelas (de um ou mais esquemas) numa só
+    # ida ao servidor. Retorna [(resultado, erro)] na ordem de camadas, com resultado None
+    # quando a tabela falha. Com registrar=True (só tabelas comuns sem filhas por herança e
+    # materializadas, em que o ctid identifica a feição), as feições encontradas ficam em pg_temp.diglet_acertos para a exportação
+    # buscá-las sem repetir o teste espacial. tempo_limite (segundos) vale para a chamada
+    # inteira; estourado, a consulta levanta QueryCanceledError. Com um RegistroDesempenho,
+    # cada tabela respondida gera uma medição.
+    garantir_aoi(conn, aoi)
+    garantir_funcao_lote(conn)
+    identificados = [c.get("relkind") in ("r", "m") for c in camadas]
+    registrar_em = [registrar and ident for ident in identificados]
+    inicio = time.monotonic()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(limite_tempo(tempo_limite).as_string(conn) + """
+                SELECT indice, contagem, colunas, resumo, marcador, erro, tempo_ms, lidas,
+                       octet_length(resumo::text)
+                FROM pg_temp.diglet_lote(%s, %s, %s, %s, %s, %s::text[], %s);
+            """, (
+                [c["esquema"] for c in camadas],
+                [c["tabela"] for c in camadas],
+                [c["coluna_geom"] for c in camadas],
+                [fonte_encontrados(c, ident).as_string(conn) for c, ident in zip(camadas, identificados)],
+                identificados,
+                [chave_acertos(c) if reg else None for c, reg in zip(camadas, registrar_em)],
+                LIMITE_AMOSTRA
+            ))
+            linhas = cur.fetchall()
+        tempo_total = time.monotonic() - inicio
+        sessao = conn.get_backend_pid()
+        if any(registrar_em):
+            conn.commit()
+    finally:
+        # Encerra a transação de leitura: a conexão volta limpa para o pool
+        conn.rollback()
+
+    respostas = [(None, "sem resposta do servidor")] * len(camadas)
+    for indice, contagem, colunas, resumo, marcador, erro, tempo_ms, lidas, tamanho in linhas:
+        camada = camadas[indice]
+        if desempenho is not None:
+            desempenho.registrar(
+                etapa="diagnostico", tabela=camada["nome"], tempo_total=tempo_total,
+                tempo_servidor=tempo_ms / 1000, linhas_lidas=lidas, linhas_encontradas=contagem,
+                bytes=tamanho or 0, tabelas_na_chamada=len(camadas), erro=erro
+            )
+        if erro is not None:
+            respostas[indice] = (None, erro)
+            continue
+        if not contagem:
+            respostas[indice] = ({"tabela": camada["nome"], "count": 0}, None)
+            continue
+        r = {"tabela": camada["nome"], "count": contagem, "colunas": colunas or [], "resumo": resumo or {}}
+        if registrar_em[indice] and marcador is not None:
+            r["acertos"] = {"sessao": sessao, "aoi": aoi.hash, "marcador": marcador}
+        respostas[indice] = (r, None)
+    return respostas
+
+
+def distribuir_grupos(pendentes, custos, quantidade):
+    # Maior primeiro: cada tabela, em ordem decrescente de custo, vai para o grupo com
+    # menor carga que ainda cabe em TABELAS_POR_LOTE. Os grupos saem do mais pesado ao mais leve.
+    # No empate (inclusive quando nenhum custo é conhecido), vai para o grupo com menos
+    # tabelas, para que as conexões continuem recebendo partes parecidas.
+    grupos = [[] for _ in range(quantidade)]
+    cargas = [0.0] * quantidade
+    for i in sorted(pendentes, key=lambda i: -(custos.get(i) or 0)):
+        k = min((k for k in range(quantidade) if len(grupos[k]) < TABELAS_POR_LOTE),
+                key=lambda k: (cargas[k], len(grupos[k])))
+        grupos[k].append(i)
+        cargas[k] += custos.get(i) or 0
+    ordem = sorted(range(quantidade), key=lambda k: -cargas[k])
+    return [grupos[k] for k in ordem if grupos[k]]
+
+
+def executar_intersecoes(conexoes, camadas, aoi, workers=1, log=print, ao_concluir=None,
+                         cancelamento=None, cache=None, chave=None, registrar=False, em_lote=False,
+                         tempo_limite=None, aproximar=False, desempenho=None):
+    # Retorna (resultados, falhas, ignoradas, esgotadas) na ordem do catálogo, seja qual for
+    # o paralelismo.
+    # ao_concluir(indice, tabela, resultado) é chamado assim que cada tabela termina,
+    # com resultado None quando a consulta falha. Camadas cuja extensão conhecida não
+    # alcança a AOI são ignoradas sem consulta ao servidor. Com um CacheResultados,
+    # só as tabelas alteradas desde a última execução com a mesma AOI são consultadas.
+    # registrar=True guarda no servidor as feições encontradas (ver consultar_lote).
+    # em_lote=True divide as tabelas entre as conexões e consulta cada grupo numa só
+    # chamada, em vez de uma ida ao servidor por tabela.
+    # Havendo mais de uma conexão ou grupo, o custo de cada tabela é estimado pelo
+    # planejador e as mais caras começam primeiro. tempo_limite (segundos) limita cada
+    # tabela: com ele, cada tabela vai numa chamada própria mesmo com em_lote=True, já que
+    # o statement_timeout vale para a chamada inteira e não para cada tabela do lote. As tabelas
+    # que estouram vão para "esgotadas", separadas das falhas; com aproximar=True, recebem
+    # a contagem só pelo retângulo envolvente (resultado com "aproximado": True).
+    # desempenho: RegistroDesempenho que recebe as medições de cada tabela consultada.
+    cancelamento = cancelamento or ControleCancelamento()
+    nomes = [c["nome"] for c in camadas]
+    concluidos = {}
+    ignoradas = []
+    pendentes = []
+    marcadores = {}
+    if cache is not None:
+        with conexoes.conexao() as conn:
+            try:
+                for esquema in dict.fromkeys(c["esquema"] for c in camadas):
+                    marcadores.update({
+                        (esquema, tabela): marcador
+                        for tabela, marcador in marcadores_alteracao(conn, esquema).items()
+                    })
+            finally:
+                conn.rollback()
+    chaves_cache = {}
+    for i, camada in enumerate(camadas):
+        nome = nomes[i]
+        marcador = marcadores.get((camada["esquema"], camada["tabela"]))
+        if fora_da_extensao(camada, aoi):
+            log(f"[Info] {nome} -> fora da extensão da AOI (consulta evitada)")
+            ignoradas.append(nome)
+            concluidos[i] = {"tabela": nome, "count": 0}
+        elif marcador is not None:
+            chaves_cache[i] = cache.chave(chave, camada["esquema"], camada["tabela"], aoi.hash, VERSAO_RESULTADOS)
+            r = cache.obter(chaves_cache[i], marcador)
+            if r is None:
+                pendentes.append(i)
+                continue
+            log(f"[Cache] {nome} -> {r['count']} feições intersectam (tabela sem alterações)")
+            concluidos[i] = dict(r, tabela=nome)
+        else:
+            pendentes.append(i)
+            continue
+        if ao_concluir:
+            ao_concluir(i, nome, concluidos[i])
+
+    def tarefa(grupo):
+        cancelamento.verificar()
+        with conexoes.conexao() as conn, cancelamento.monitorar(conn):
+            try:
+                return consultar_lote(conn, [camadas[i] for i in grupo], aoi, registrar=registrar,
+                                      tempo_limite=tempo_limite, desempenho=desempenho)
+            except psycopg2.extensions.QueryCanceledError:
+                if cancelamento.cancelado or len(grupo) > 1:
+                    raise
+                # Se a contagem aproximada também estourar, a tabela fica só como esgotada
+                aproximado = contar_aproximado(conn, camadas[grupo[0]], aoi, tempo_limite) if aproximar else None
+                return [(aproximado, TempoEsgotado())]
+
+    if em_lote and tempo_limite:
+        log("[Lote] Com tempo limite por tabela, cada tabela é consultada numa chamada própria")
+        em_lote = False
+    workers = max(1, min(int(workers), conexoes.tamanho, len(pendentes) or 1))
+    quantidade = max(workers, -(-len(pendentes) // TABELAS_POR_LOTE)) if em_lote else len(pendentes)
+    custos = {}
+    if len(pendentes) > 1 and min(workers, quantidade) > 1:
+        try:
+            with conexoes.conexao() as conn, cancelamento.monitorar(conn):
+                custos = dict(zip(pendentes, estimar_custos(conn, [camadas[i] for i in pendentes], aoi)))
+        except OperacaoCancelada:
+            # Como no laço do pool: os grupos param na primeira verificação e o que já
+            # veio do cache é devolvido
+            pass
+        except Exception as e:
+            log(f"[Aviso] Não foi possível estimar o custo das tabelas: {e}")
+        if any(custos.values()):
+            maior = max(custos, key=lambda i: custos[i] or 0)
+            log(f"[Plano] Maior custo estimado: {nomes[maior]} ({custos[maior]:.0f}); as mais caras começam primeiro")
+    if em_lote:
+        grupos = distribuir_grupos(pendentes, custos, quantidade)
+        if grupos:
+            log(f"[Lote] {len(pendentes)} tabelas em {len(grupos)} chamada(s) ao servidor")
+    else:
+        grupos = [[i] for i in sorted(pendentes, key=lambda i: -(custos.get(i) or 0))]
+    esgotadas = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futuros = {executor.submit(tarefa, grupo): grupo for grupo in grupos}
+        while futuros:
+            prontos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                grupo = futuros.pop(futuro)
+                try:
+                    respostas = futuro.result()
+                except OperacaoCancelada:
+                    continue
+                except psycopg2.extensions.QueryCanceledError as e:
+                    if cancelamento.cancelado:
+                        continue
+                    if len(grupo) > 1:
+                        log(f"[Tempo] Lote de {len(grupo)} tabelas excedeu o limite; repetindo uma a uma")
+                        for i in grupo:
+                            futuros[executor.submit(tarefa, [i])] = [i]
+                        continue
+                    respostas = [(None, TempoEsgotado(e))]
+                except Exception as e:
+                    if cancelamento.cancelado:
+                        continue
+                    respostas = [(None, e)] * len(grupo)
+                for i, (r, erro) in zip(grupo, respostas):
+                    nome = nomes[i]
+                    if isinstance(erro, TempoEsgotado):
+                        esgotadas.add(i)
+                        if desempenho is not None:
+                            desempenho.registrar(etapa="diagnostico", tabela=nome, tempo_total=tempo_limite,
+                                                 tabelas_na_chamada=1, erro="tempo limite excedido")
+                        log(f"[Tempo] {nome} -> limite de {tempo_limite}s excedido")
+                        if r is not None:
+                            log(f"[Aprox.] {nome} -> ~{r['count']} feições (só retângulo envolvente)")
+                    elif erro is not None:
+                        log(f"[Erro] ao processar {nome}: {erro}")
+                    elif r["count"] > 0:
+                        log(f"[OK] {nome} -> {r['count']} feições intersectam")
+                    else:
+                        log(f"[Info] {nome} -> 0 feições intersectam")
+                    concluidos[i] = r
+                    if ao_concluir:
+                        ao_concluir(i, nome, r)
+
+    if cache is not None:
+        cache.gravar({
+            chaves_cache[i]: (
+                marcadores[(camadas[i]["esquema"], camadas[i]["tabela"])],
+                {k: v for k, v in concluidos[i].items() if k != "acertos"}
+            )
+            for i in pendentes
+            if i in chaves_cache and concluidos.get(i) is not None and i not in esgotadas
+        })
+
+    resultados = []
+    falhas = []
+    for i in sorted(concluidos):
+        r = concluidos[i]
+        if r is None:
+            if i not in esgotadas:
+                falhas.append(nomes[i])
+        elif r["count"] > 0:
+            resultados.append(r)
+    return resultados, falhas, ignoradas, [nomes[i] for i in sorted(esgotadas)]
+
+
+def gravar_csv_diagnostico(caminho, resultados):
+    dados = [
+        {"Tabela": r["tabela"], "Feições Encontradas": r["count"], "Aproximada": bool(r.get("aproximado"))}
+        for r in resultados
+    ]
+    colunas = ["Tabela", "Feições Encontradas"]
+    # A coluna só aparece quando alguma contagem foi feita pelo retângulo envolvente
+    if any(d["Aproximada"] for d in dados):
+        colunas.append("Aproximada")
+    df = pd.DataFrame(dados, columns=colunas)
+    df.to_csv(caminho, index=False, encoding="utf-8-sig")
+
+
+def capturar_planos(conexoes, camadas, aoi, desempenho, quantidade, log=print, cancelamento=None,
+                    tempo_limite=None):
+    # Reexecuta com EXPLAIN (ANALYZE, BUFFERS) a contagem das `quantidade` tabelas mais lentas
+    # do diagnóstico e guarda o plano na medição de cada uma. Só a contagem é analisada (o
+    # resumo dos campos fica de fora), o que basta para ver o custo do teste espacial.
+    cancelamento = cancelamento or ControleCancelamento()
+    por_nome = {c["nome"]: c for c in camadas}
+    lentas = [l for l in desempenho.mais_lentas("diagnostico", quantidade) if l["tabela"] in por_nome]
+    if not lentas:
+        return
+    with conexoes.conexao() as conn, cancelamento.monitorar(conn):
+        garantir_aoi(conn, aoi)
+        for linha in lentas:
+            cancelamento.verificar()
+            query = sql.SQL("{limite}EXPLAIN (ANALYZE, BUFFERS) SELECT COUNT(*) {fonte}").format(
+                limite=limite_tempo(tempo_limite), fonte=fonte_encontrados(por_nome[linha["tabela"]])
+            )
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(query)
+                    linha["plano"] = "\n".join(r[0] for r in cur.fetchall())
+                log(f"[Plano] {linha['tabela']} -> plano de execução capturado")
+            except psycopg2.extensions.QueryCanceledError:
+                if cancelamento.cancelado:
+                    raise
+                log(f"[Aviso] {linha['tabela']} -> EXPLAIN ANALYZE excedeu o tempo limite")
+            except Exception as e:
+                log(f"[Aviso] Não foi possível obter o plano de {linha['tabela']}: {e}")
+            finally:
+                conn.rollback()
+
+
+def gravar_relatorio_desempenho(caminho, desempenho):
+    # .json: resumo por etapa e todas as medições (com os planos); outra extensão: CSV
+    linhas = list(desempenho.linhas)
+    if not caminho.lower().endswith(".json"):
+        df = pd.DataFrame(linhas, columns=RegistroDesempenho.CAMPOS)
+        # Contagens ausentes (views, erros) não devem transformar a coluna em float
+        for coluna in ["linhas_lidas", "linhas_encontradas", "bytes", "tabelas_na_chamada"]:
+            df[coluna] = df[coluna].astype("Int64")
+        df.to_csv(caminho, index=False, encoding="utf-8-sig")
+        return
+    resumo = {}
+    for linha in linhas:
+        etapa = resumo.setdefault(linha["etapa"], {"tabelas": 0, "erros": 0, "tempo_servidor": 0.0,
+                                                   "linhas_lidas": 0, "bytes": 0})
+        etapa["tabelas"] += 1
+        etapa["erros"] += linha["erro"] is not None
+        etapa["tempo_servidor"] += linha["tempo_servidor"] or 0
+        etapa["linhas_lidas"] += linha["linhas_lidas"] or 0
+        etapa["bytes"] += linha["bytes"] or 0
+    relatorio = {
+        "inicio": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(desempenho.inicio)),
+        "resumo": resumo,
+        "consultas": linhas,
+    }
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2, default=str)
+
+
+# Albers cônica de áreas iguais para o Brasil (parâmetros do IBGE, elipsoide GRS80/SIRGAS 2000);
+# áreas e comprimentos das métricas são medidos nesta projeção
+PROJECAO_AREA = (
+    "+proj=aea +lat_0=-12 +lon_0=-54 +lat_1=-2 +lat_2=-22 "
+    "+x_0=5000000 +y_0=10000000 +ellps=GRS80 +units=m +no_defs"
+)
+
+
+def consultar_metricas(conn, camada, aoi, campo_grupo=None):
+    # Área e comprimento da parte de cada feição que cai dentro da AOI, somados por camada
+    # (ou por valor de campo_grupo). Os pedaços da AOI não se sobrepõem, então somar a
+    # interseção com cada pedaço dá a interseção com a AOI inteira. Só as linhas agregadas
+    # saem do servidor. Feições sobrepostas na mesma camada são somadas, de modo que o
+    # percentual da AOI pode passar de 100.
+    if campo_grupo and campo_grupo in (camada.get("colunas") or []):
+        grupo = sql.SQL("c.{}::text").format(sql.Identifier(campo_grupo))
+    else:
+        grupo = sql.SQL("NULL::text")
+    projecao = sql.Literal(PROJECAO_AREA)
+    aoi_sql = geometria_aoi(camada)
+    query = sql.SQL("""
+        SELECT e.grupo, COUNT(*), SUM(m.area), SUM(m.comprimento),
+               100 * SUM(m.area) / NULLIF((
+                   SELECT SUM(ST_Area(ST_Transform(geom, {projecao}))) FROM pg_temp.diglet_aoi
+               ), 0)
+        FROM (SELECT {grupo} AS grupo, c.diglet_geom AS geom {fonte}) e
+        CROSS JOIN LATERAL (
+            SELECT COALESCE(SUM(ST_Area(x.g)), 0) AS area, COALESCE(SUM(ST_Length(x.g)), 0) AS comprimento
+            FROM (
+                SELECT ST_Transform(ST_Intersection(e.geom, {aoi}), {projecao}) AS g
+                FROM pg_temp.diglet_aoi a
+                WHERE e.geom && {aoi} AND ST_Intersects(e.geom, {aoi})
+            ) x
+        ) m
+        GROUP BY e.grupo
+        ORDER BY e.grupo;
+    """).format(grupo=grupo, fonte=fonte_encontrados(camada), aoi=aoi_sql, projecao=projecao)
+    garantir_aoi(conn, aoi)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query)
+            linhas = cur.fetchall()
+    finally:
+        conn.rollback()
+    return [
+        {"tabela": camada["nome"], "grupo": grupo, "feicoes": feicoes, "area_m2": area,
+         "comprimento_m": comprimento, "percentual_aoi": percentual}
+        for grupo, feicoes, area, comprimento, percentual in linhas
+    ]
+
+
+def executar_por_camada(conexoes, camadas, consulta, descrever, rotulo, workers=1, log=print,
+                        ao_concluir=None, cancelamento=None):
+    # Executa consulta(conn, camada) para cada camada, em paralelo no pool de conexões.
+    # Retorna ({indice: resultado}, falhas); descrever(resultado) compõe a mensagem do log.
+    # ao_concluir(indice, tabela) é chamado ao fim de cada camada, com ou sem erro.
+    cancelamento = cancelamento or ControleCancelamento()
+    por_camada = {}
+    falhas = []
+
+    def tarefa(camada):
+        cancelamento.verificar()
+        with conexoes.conexao() as conn, cancelamento.monitorar(conn):
+            return consulta(conn, camada)
+
+    workers = max(1, min(int(workers), conexoes.tamanho, len(camadas) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futuros = {executor.submit(tarefa, camada): i for i, camada in enumerate(camadas)}
+        for futuro in as_completed(futuros):
+            i = futuros[futuro]
+            nome = camadas[i]["nome"]
+            try:
+                por_camada[i] = futuro.result()
+                log(f"[{rotulo}] {nome} -> {descrever(por_camada[i])}")
+            except OperacaoCancelada:
+                continue
+            except Exception as e:
+                if cancelamento.cancelado:
+                    continue
+                log(f"[Erro] {rotulo}: falha em {nome}: {e}")
+                falhas.append(nome)
+            if ao_concluir:
+                ao_concluir(i, nome)
+    return por_camada, falhas
+
+
+def calcular_metricas(conexoes, camadas, aoi, campo_grupo=None, workers=1, log=print,
+                      ao_concluir=None, cancelamento=None):
+    # Retorna (linhas, falhas) na ordem das camadas
+    por_camada, falhas = executar_por_camada(
+        conexoes, camadas, lambda conn, camada: consultar_metricas(conn, camada, aoi, campo_grupo),
+        lambda linhas: f"{len(linhas)} linha(s)", "Métricas", workers=workers, log=log,
+        ao_concluir=ao_concluir, cancelamento=cancelamento
+    )
+    linhas = [linha for i in sorted(por_camada) for linha in por_camada[i]]
+    return linhas, falhas
+
+
+def gravar_csv_metricas(caminho, linhas, campo_grupo=None):
+    colunas = ["Tabela"] + ([campo_grupo] if campo_grupo else []) + [
+        "Feições", "Área (ha)", "Comprimento (km)", "% da AOI"
+    ]
+    dados = []
+    for linha in linhas:
+        registro = {
+            "Tabela": linha["tabela"],
+            "Feições": linha["feicoes"],
+            "Área (ha)": round(linha["area_m2"] / 10000, 4),
+            "Comprimento (km)": round(linha["comprimento_m"] / 1000, 4),
+            "% da AOI": None if linha["percentual_aoi"] is None else round(linha["percentual_aoi"], 4)
+        }
+        if campo_grupo:
+            registro[campo_grupo] = linha["grupo"]
+        dados.append(registro)
+    df = pd.DataFrame(dados, columns=colunas)
+    df.to_csv(caminho, index=False, encoding="utf-8-sig")
+
+
+def consultar_matriz(conn, camada, aoi, ids):
+    # Feições da camada que intersectam cada feição da AOI, numa única junção espacial:
+    # para cada feição da AOI, o índice GiST da camada localiza as candidatas (&&).
+    # Retorna {identificador: contagem}, na ordem da AOI e só com as feições que têm interseção.
+    geom = sql.Identifier(camada["coluna_geom"])
+    query = sql.SQL("""
+        SELECT f.id, COUNT(*)
+        FROM (SELECT id, {aoi} AS geom FROM pg_temp.diglet_aoi_feicoes f) f
+        JOIN {tabela} t ON t.{geom} && f.geom AND ST_Intersects(t.{geom}, f.geom)
+        WHERE {filtro_srid}ST_IsValid(t.{geom})
+        GROUP BY f.id;
+    """).format(
+        aoi=geometria_aoi(camada, "f"),
+        tabela=sql.Identifier(camada["esquema"], camada["tabela"]),
+        geom=geom,
+        filtro_srid=sql.SQL("ST_SRID(t.{}) = 4674 AND ").format(geom) if camada["srid"] == 0 else sql.SQL("")
+    )
+    garantir_feicoes_aoi(conn, aoi, ids)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query)
+            contagens = dict(cur.fetchall())
+    finally:
+        conn.rollback()
+    return {i: contagens[i] for i in ids if i in contagens}
+
+
+def calcular_matriz(conexoes, camadas, aoi, campo_id=None, workers=1, log=print,
+                    ao_concluir=None, cancelamento=None):
+    # Matriz feição da AOI x camada. Retorna (ids, {tabela: {identificador: contagem}}, falhas).
+    ids = aoi.identificadores(campo_id)
+    por_camada, falhas = executar_por_camada(
+        conexoes, camadas, lambda conn, camada: consultar_matriz(conn, camada, aoi, ids),
+        lambda contagens: f"{len(contagens)} de {len(ids)} feições da AOI com interseção", "Matriz",
+        workers=workers, log=log, ao_concluir=ao_concluir, cancelamento=cancelamento
+    )
+    matriz = {camadas[i]["nome"]: por_camada[i] for i in sorted(por_camada)}
+    return ids, matriz, falhas
+
+
+def gravar_csv_matriz(caminho, ids, matriz, campo_id=None):
+    # Uma linha por feição da AOI e uma coluna por camada, com o número de feições da camada
+    # que a intersectam (0 quando nenhuma)
+    df = pd.DataFrame({
+        tabela: [contagens.get(i, 0) for i in ids] for tabela, contagens in matriz.items()
+    }, index=pd.Index(ids, name=campo_id or "Feição"))
+    df.to_csv(caminho, encoding="utf-8-sig")
+
+
+def diagnosticar_indices(conn, camadas):
+    # Camadas sem índice espacial na coluna geométrica ou cujas estatísticas estão
+    # defasadas (nunca analisadas, ou mais de 10% + 50 linhas alteradas desde o
+    # último ANALYZE, o mesmo limiar padrão do autovacuum). Visões ficam de fora.
+    if not camadas:
+        return []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT v.esquema, v.tabela, v.coluna, c.relkind,
+                       NOT EXISTS (
+                           SELECT 1
+                           FROM pg_index i
+                           JOIN pg_class ic ON ic.oid = i.indexrelid
+                           JOIN pg_am am ON am.oid = ic.relam
+                           JOIN pg_attribute att
+                             ON att.attrelid = i.indrelid AND att.attnum = ANY(i.indkey)
+                           WHERE i.indrelid = c.oid
+                           AND am.amname IN ('gist', 'spgist', 'brin')
+                           AND att.attname = v.coluna
+                       ) AS sem_indice,
+                       COALESCE(s.last_analyze, s.last_autoanalyze) IS NULL
+                       OR s.n_mod_since_analyze > GREATEST(c.reltuples, 0) * 0.1 + 50
+                           AS estatisticas_desatualizadas
+                FROM unnest(%s::text[], %s::text[], %s::text[]) AS v(esquema, tabela, coluna)
+                JOIN pg_namespace n ON n.nspname = v.esquema
+                JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = v.tabela
+                LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+                WHERE c.relkind IN ('r', 'p', 'm');
+            """, (
+                [c["esquema"] for c in camadas],
+                [c["tabela"] for c in camadas],
+                [c["coluna_geom"] for c in camadas]
+            ))
+            linhas = cur.fetchall()
+    finally:
+        conn.rollback()
+    nomes = {(c["esquema"], c["tabela"]): c["nome"] for c in camadas}
+    return [
+        {"esquema": esquema, "tabela": tabela, "nome": nomes[(esquema, tabela)], "coluna_geom": coluna,
+         "relkind": relkind, "sem_indice": sem_indice, "estatisticas_desatualizadas": desatualizadas}
+        for esquema, tabela, coluna, relkind, sem_indice, desatualizadas in linhas
+        if sem_indice or desatualizadas
+    ]
+
+
+def nome_indice(p):
+    # Nome do índice criado pelo programa, cortado nos 63 bytes que o PostgreSQL aceita
+    return f"{p['tabela']}_{p['coluna_geom']}_gist".encode("utf-8")[:63].decode("utf-8", "ignore")
+
+
+def remover_indice_invalido(conn, p):
+    # CREATE INDEX CONCURRENTLY interrompido deixa um índice inválido, que ainda pesa nas
+    # escritas; só é removido se for mesmo inválido (o nome pode ser de um índice que já existia)
+    indice = sql.Identifier(p["esquema"], nome_indice(p))
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)",
+                        (indice.as_string(conn),))
+            linha = cur.fetchone()
+            if linha and linha[0]:
+                cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(indice))
+    except psycopg2.Error:
+        pass
+
+
+def aplicar_correcoes_indice(conn, problemas, log=print, ao_concluir=None, cancelamento=None):
+    # Cria o índice GiST que falta e atualiza as estatísticas, uma tabela por vez. O índice é
+    # criado com CONCURRENTLY, que não bloqueia escritas na tabela durante a construção e
+    # não roda dentro de transação (a conexão fica em autocommit até o fim). Tabelas
+    # particionadas não aceitam CONCURRENTLY e usam CREATE INDEX comum, que bloqueia as escritas.
+    cancelamento = cancelamento or ControleCancelamento()
+    conn.rollback()
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        for i, p in enumerate(problemas):
+            cancelamento.verificar()
+            tabela = sql.Identifier(p["esquema"], p["tabela"])
+            concorrente = p.get("relkind") != "p"
+            criar = sql.SQL("CREATE INDEX {concorrente}{indice} ON {tabela} USING GIST ({coluna})").format(
+                concorrente=sql.SQL("CONCURRENTLY " if concorrente else ""),
+                indice=sql.Identifier(nome_indice(p)),
+                tabela=tabela,
+                coluna=sql.Identifier(p["coluna_geom"])
+            )
+            try:
+                with cancelamento.monitorar(conn), conn.cursor() as cur:
+                    if p["sem_indice"]:
+                        cur.execute(criar)
+                        log(f"[Índice] GiST criado em {p['nome']}.{p['coluna_geom']}")
+                    cur.execute(sql.SQL("ANALYZE {}").format(tabela))
+                    log(f"[Índice] ANALYZE executado em {p['nome']}")
+            except OperacaoCancelada:
+                if p["sem_indice"] and concorrente:
+                    remover_indice_invalido(conn, p)
+                raise
+            except Exception as e:
+                if p["sem_indice"] and concorrente:
+                    remover_indice_invalido(conn, p)
+                log(f"[Erro] Falha ao ajustar {p['nome']}: {e}")
+            if ao_concluir:
+                ao_concluir(i, p["nome"])
+    finally:
+        conn.autocommit = autocommit
+
+
+# Feições lidas do servidor e gravadas no GeoPackage por vez; limita o pico de memória da exportação
+TAMANHO_LOTE_EXPORTACAO = 10000
+
+
+def colunas_atributos(conn, camada):
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("SELECT * FROM {} LIMIT 0").format(
+            sql.Identifier(camada["esquema"], camada["tabela"])))
+        return [desc[0] for desc in cur.description if desc[0] != camada["coluna_geom"]]
+
+
+def linhas_lidas_transacao(conn, camada):
+    # Linhas lidas da tabela na transação atual (varredura sequencial + buscas por índice);
+    # None para views, que não têm estatísticas próprias
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT COALESCE(seq_tup_read, 0) + COALESCE(idx_tup_fetch, 0)
+            FROM pg_stat_xact_user_tables WHERE relid = %s::regclass;
+        """, (sql.Identifier(camada["esquema"], camada["tabela"]).as_string(conn),))
+        linha = cur.fetchone()
+    return linha[0] if linha else None
+
+
+def ler_lotes(conn, query, tamanho_lote, nome_cursor="diglet_exportacao"):
+    # Cursor nomeado (server-side): o servidor mantém o resultado e entrega tamanho_lote
+    # linhas por vez, em vez de o cliente receber a tabela inteira de uma só vez
+    with conn.cursor(name=nome_cursor) as cur:
+        cur.itersize = tamanho_lote
+        cur.execute(query)
+        while True:
+            linhas = cur.fetchmany(tamanho_lote)
+            if not linhas:
+                break
+            yield linhas
+
+
+def geometria_sem_m(camada, geom):
+    # Descarta a coordenada M no próprio servidor, antes da transferência. A dimensão
+    # declarada em geometry_columns decide a conversão; colunas sem tipo declarado
+    # (GEOMETRY genérico) são decididas linha a linha por ST_Zmflag
+    # (0 = XY, 1 = XYM, 2 = XYZ, 3 = XYZM).
+    # Retorna a expressão SQL e o aviso a registrar no log (ou None).
+    tipo = (camada.get("tipo") or "GEOMETRY").upper()
+    dimensao = camada.get("dimensao")
+    if tipo == "GEOMETRY" or dimensao is None:
+        expressao = sql.SQL(
+            "CASE ST_Zmflag({g}) WHEN 3 THEN ST_Force3DZ({g}) WHEN 1 THEN ST_Force2D({g}) ELSE {g} END"
+        ).format(g=geom)
+        return expressao, None
+    if dimensao == 4:
+        return sql.SQL("ST_Force3DZ({})").format(geom), "Geometrias ZM convertidas para Z"
+    if dimensao == 3 and tipo.endswith("M"):
+        return sql.SQL("ST_Force2D({})").format(geom), "Geometrias XYM convertidas para XY"
+    return geom, None
+
+
+# Código de ST_CollectionExtract por tipo declarado (1 = pontos, 2 = linhas, 3 = polígonos)
+TIPOS_EXTRACAO = {"POINT": 1, "LINESTRING": 2, "POLYGON": 3}
+
+
+def geometria_exportada(camada, geom, recortar=False, tolerancia=None, casas_decimais=None):
+    # Geometria como sai do servidor: sem M e, opcionalmente, recortada pela AOI, simplificada
+    # (tolerância nas unidades do SRID da camada) e com as coordenadas quantizadas.
+    # Retorna a expressão SQL e o aviso a registrar no log (ou None).
+    expressao, aviso = geometria_sem_m(camada, geom)
+    if recortar:
+        # ST_ClipByBox2D corta barato pelo retângulo de cada pedaço da AOI antes do
+        # ST_Intersection exato; os pedaços recortados da mesma feição são reunidos.
+        # Feições inválidas ficam com geometria nula (descartadas no cliente, como sem
+        # recorte) e um recorte inválido é corrigido, para que um erro do GEOS não
+        # interrompa a exportação da camada inteira.
+        expressao = sql.SQL("""(
+            SELECT ST_Union(ST_Intersection(
+                CASE WHEN ST_IsValid(r.geom) THEN r.geom ELSE ST_MakeValid(r.geom) END, p.geom))
+            FROM (SELECT {expressao} AS geom) f,
+                 (SELECT {aoi} AS geom FROM pg_temp.diglet_aoi a) p,
+                 LATERAL (SELECT ST_ClipByBox2D(f.geom, Box2D(p.geom)) AS geom) r
+            WHERE f.geom && p.geom AND ST_IsValid(f.geom) AND ST_Intersects(f.geom, p.geom)
+        )""").format(aoi=geometria_aoi(camada), expressao=expressao)
+        # A interseção pode trazer pedaços de dimensão menor (bordas que só se tocam)
+        tipo = (camada.get("tipo") or "GEOMETRY").upper().rstrip("M").replace("MULTI", "")
+        if tipo in TIPOS_EXTRACAO:
+            expressao = sql.SQL("ST_CollectionExtract({}, {})").format(expressao, sql.Literal(TIPOS_EXTRACAO[tipo]))
+    if tolerancia:
+        expressao = sql.SQL("ST_SimplifyPreserveTopology({}, {})").format(expressao, sql.Literal(float(tolerancia)))
+    if casas_decimais is not None:
+        expressao = sql.SQL("ST_QuantizeCoordinates({}, {})").format(expressao, sql.Literal(int(casas_decimais)))
+    return expressao, aviso
+
+
+def wkb_transferido(geom):
+    # O psycopg2 recebe os resultados em formato texto, em que bytea chega em hexadecimal
+    # (2 bytes por byte de WKB); em base64 a geometria ocupa 4/3 do tamanho binário
+    return sql.SQL("encode(ST_AsBinary({}), 'base64')").format(geom)
+
+
+def montar_lote(linhas, colunas, camada):
+    # Última coluna de cada linha é o WKB da geometria em base64. Decodificação e filtros
+    # são feitos sobre o array inteiro de geometrias, sem laço Python por feição.
+    geometrias = shapely.from_wkb([None if linha[-1] is None else base64.b64decode(linha[-1]) for linha in linhas])
+    # Remove geometrias nulas, inválidas e vazias, mas aceita qualquer tipo
+    validas = ~shapely.is_missing(geometrias) & shapely.is_valid(geometrias) & ~shapely.is_empty(geometrias)
+    indices = np.flatnonzero(validas)
+    df = pd.DataFrame.from_records([linhas[i][:-1] for i in indices], columns=colunas)
+    # A geometria já entra com o nome da coluna da tabela (que pode ser "geometry")
+    df[camada["coluna_geom"]] = geometrias[indices]
+    return gpd.GeoDataFrame(df, geometry=camada["coluna_geom"], crs=camada["srid"] or 4674)
+
+
+def filtro_acertos(camada):
+    # ctid = ANY(array) vira um TID Scan: busca direta das linhas, sem predicado espacial
+    return sql.SQL(
+        "t.ctid = ANY (ARRAY(SELECT a.id FROM pg_temp.diglet_acertos a WHERE a.tabela = {}))"
+    ).format(sql.Literal(chave_acertos(camada)))
+
+
+def garantir_restante(conn, geometria):
+    # Parte da AOI que o cache de feições ainda não cobre, subdividida e indexada como
+    # diglet_aoi. Recriada a cada camada, já que cada camada tem a sua cobertura.
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS pg_temp.diglet_restante")
+            cur.execute(
+                "CREATE TEMP TABLE diglet_restante AS SELECT ST_Subdivide(ST_GeomFromWKB(%s, 4674), %s) AS geom",
+                (psycopg2.Binary(geometria.wkb), VERTICES_POR_PEDACO)
+            )
+            cur.execute("CREATE INDEX ON pg_temp.diglet_restante USING GIST (geom)")
+            cur.execute("ANALYZE pg_temp.diglet_restante")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def garantir_guardadas(conn, lotes_ctids):
+    # ctids das feições já guardadas no cache local, em pg_temp.diglet_guardadas, para a
+    # consulta ao servidor deixá-las de fora. Recebe os ctids em lotes e os envia um lote
+    # por vez, sem juntar o cache inteiro na memória.
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS pg_temp.diglet_guardadas")
+            cur.execute("CREATE TEMP TABLE diglet_guardadas (id tid)")
+            for ctids in lotes_ctids:
+                cur.execute("INSERT INTO pg_temp.diglet_guardadas SELECT unnest(%s::text[])::tid", (ctids,))
+            cur.execute("ANALYZE pg_temp.diglet_guardadas")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def ler_cache_feicoes(cache_feicoes, chave, camada, marcador, colunas):
+    # Entrada do cache de feições da camada e a cobertura dela em EPSG:4674, ou
+    # (None, None). Uma entrada de outra versão da tabela ou com outras colunas é descartada.
+    entrada = cache_feicoes.obter(chave, marcador) if marcador is not None else None
+    if entrada is None or entrada["colunas"] != colunas or entrada["srid"] != camada["srid"]:
+        cache_feicoes.descartar(chave)
+        return None, None
+    cobertura = gpd.read_file(cache_feicoes.arquivo(chave), layer="cobertura").geometry.union_all()
+    return entrada, cobertura
+
+
+def lotes_cache_feicoes(arquivo, total, tamanho_lote, **opcoes):
+    # Lê a camada "feicoes" do cache em faixas de fid de tamanho_lote. As feições só são
+    # acrescentadas ao arquivo (que é recriado quando a entrada é descartada), então os fids
+    # vão de 1 a total. opcoes segue para gpd.read_file (bbox, columns, ignore_geometry).
+    for inicio in range(0, total, tamanho_lote):
+        yield gpd.read_file(arquivo, layer="feicoes", where=f"fid > {inicio} AND fid <= {inicio + tamanho_lote}",
+                            **opcoes)
+
+
+def exportar_camada_gpkg(conn, caminho, camada, log=print, cancelamento=None,
+                         tamanho_lote=TAMANHO_LOTE_EXPORTACAO, usar_acertos=False,
+                         recortar=False, tolerancia=None, casas_decimais=None, desempenho=None,
+                         cache_feicoes=None, chave_cache=None, marcador=None, aoi=None):
+    # Lê as feições em lotes por um cursor nomeado e acrescenta cada lote à camada do
+    # GeoPackage. Retorna o número de feições gravadas. As colunas vindas do diagnóstico
+    # (camada["colunas"]) dispensam a consulta de metadados. Com um RegistroDesempenho, a
+    # camada gera uma medição (tempo_servidor = espera pelos lotes do cursor).
+    # Com um CacheFeicoes (e o marcador atual da tabela), as feições guardadas que
+    # intersectam a AOI saem do arquivo local e só a parte da AOI fora da cobertura é
+    # consultada no servidor; as feições novas entram no cache, identificadas pelo ctid.
+    cancelamento = cancelamento or ControleCancelamento()
+    tabela = camada["nome"]
+    geom = sql.SQL("t.{}").format(sql.Identifier(camada["coluna_geom"]))
+    with cancelamento.monitorar(conn):
+        colunas = camada.get("colunas")
+        if colunas is None:
+            colunas = colunas_atributos(conn, camada)
+        selecao = [sql.SQL("t.{}").format(sql.Identifier(c)) for c in colunas]
+        colunas_lote = list(colunas)
+        intersecta = filtro_acertos(camada) if usar_acertos else filtro_aoi(camada, geom)
+        gravadas = 0
+        restante = None
+        if cache_feicoes is not None:
+            entrada, cobertura = ler_cache_feicoes(cache_feicoes, chave_cache, camada, marcador, colunas)
+            guardadas = entrada["feicoes"] if entrada else 0
+            restante = aoi.geometria if cobertura is None else shapely.difference(aoi.geometria, cobertura)
+            if guardadas:
+                arquivo_cache = cache_feicoes.arquivo(chave_cache)
+                area = aoi.geometria
+                if camada["srid"] not in (0, 4674):
+                    area = gpd.GeoSeries([area], crs=4674).to_crs(camada["srid"]).iloc[0]
+                # O filtro por retângulo usa o índice R-tree do GeoPackage; o teste exato vem depois
+                for locais in lotes_cache_feicoes(arquivo_cache, guardadas, tamanho_lote, bbox=area.bounds):
+                    cancelamento.verificar()
+                    locais = locais[locais.intersects(area)]
+                    if locais.empty:
+                        continue
+                    locais = locais.drop(columns="diglet_ctid")
+                    if locais.geometry.name != camada["coluna_geom"]:
+                        locais = locais.rename_geometry(camada["coluna_geom"])
+                    locais.to_file(caminho, layer=tabela, driver="GPKG", encoding="utf-8", geometry_type=None,
+                                   mode="a" if gravadas else "w")
+                    gravadas += len(locais)
+            if restante.is_empty:
+                log(f"[Cache] {tabela}: {gravadas} feições do cache local (AOI inteira já coberta)")
+            elif cobertura is not None:
+                log(f"[Cache] {tabela}: {gravadas} feições do cache local; "
+                    "consultando no servidor só a parte da AOI fora da cobertura")
+                garantir_restante(conn, restante)
+                restante_filtro = filtro_aoi(camada, geom, "diglet_restante")
+                intersecta = sql.SQL("{} AND {}").format(intersecta, restante_filtro) if usar_acertos else restante_filtro
+                if guardadas:
+                    # As feições guardadas já saíram do cache local (se intersectam a AOI); o
+                    # servidor só devolve as que ainda não estão no cache
+                    garantir_guardadas(conn, (
+                        lote["diglet_ctid"].tolist() for lote in lotes_cache_feicoes(
+                            arquivo_cache, guardadas, tamanho_lote, columns=["diglet_ctid"], ignore_geometry=True)
+                    ))
+                    intersecta = sql.SQL("{} AND NOT EXISTS (SELECT 1 FROM pg_temp.diglet_guardadas g "
+                                         "WHERE g.id = t.ctid)").format(intersecta)
+            selecao.append(sql.SQL("t.ctid::text"))
+            colunas_lote.append("diglet_ctid")
+        geom_saida, aviso_dimensao = geometria_exportada(camada, geom, recortar, tolerancia, casas_decimais)
+        selecao.append(wkb_transferido(geom_saida))
+        query = sql.SQL("""
+            SELECT {selecao}
+            FROM {tabela} t
+            WHERE {intersecta}
+        """).format(
+            selecao=sql.SQL(", ").join(selecao),
+            tabela=sql.Identifier(camada["esquema"], camada["tabela"]),
+            intersecta=intersecta
+        )
+        if aviso_dimensao:
+            log(f"[Aviso] {aviso_dimensao} na camada '{tabela}'.")
+        lidas = 0
+        descartadas = 0
+        bytes_geometria = 0
+        espera = 0.0
+        inicio = time.monotonic()
+        varridas = linhas_lidas_transacao(conn, camada) if desempenho is not None else None
+        lotes = ler_lotes(conn, query, tamanho_lote) if restante is None or not restante.is_empty else iter(())
+        guardadas_antes = guardadas if cache_feicoes is not None else None
+        try:
+            while True:
+                antes = time.monotonic()
+                linhas = next(lotes, None)
+                espera += time.monotonic() - antes
+                if linhas is None:
+                    break
+                cancelamento.verificar()
+                lidas += len(linhas)
+                bytes_geometria += sum(len(linha[-1]) for linha in linhas if linha[-1] is not None)
+                gdf = montar_lote(linhas, colunas_lote, camada)
+                descartadas += len(linhas) - len(gdf)
+                if cache_feicoes is not None and not gdf.empty:
+                    gdf.to_file(cache_feicoes.arquivo(chave_cache), layer="feicoes", driver="GPKG",
+                                encoding="utf-8", geometry_type="Unknown", mode="a" if guardadas else "w")
+                    guardadas += len(gdf)
+                    gdf = gdf.drop(columns="diglet_ctid")
+                if gdf.empty:
+                    continue
+                # Exporta sem transformar o tipo de geometria, aceita qualquer tipo (incluindo Z)
+                gdf.to_file(
+                    caminho,
+                    layer=tabela,
+                    driver="GPKG",
+                    encoding="utf-8",
+                    geometry_type=None,
+                    mode="a" if gravadas else "w"
+                )
+                gravadas += len(gdf)
+                log(f"[Export] {tabela}: {gravadas} feições gravadas...")
+        except BaseException:
+            # Feições acrescentadas ao cache sem a entrada atualizada ficariam fora da contagem
+            # (e das faixas de fid lidas depois); a entrada incompleta é descartada
+            if cache_feicoes is not None and guardadas != guardadas_antes:
+                cache_feicoes.descartar(chave_cache)
+            raise
+        if varridas is not None:
+            varridas = linhas_lidas_transacao(conn, camada) - varridas
+    conn.rollback()
+    if cache_feicoes is not None:
+        # A cobertura só cresce depois que todas as feições da parte restante foram guardadas
+        if not restante.is_empty:
+            nova_cobertura = aoi.geometria if cobertura is None else shapely.union_all([cobertura, aoi.geometria])
+            gpd.GeoDataFrame(geometry=[nova_cobertura], crs=4674).to_file(
+                cache_feicoes.arquivo(chave_cache), layer="cobertura", driver="GPKG", mode="w")
+        cache_feicoes.gravar(chave_cache, {"marcador": marcador, "colunas": colunas, "srid": camada["srid"],
+                                           "feicoes": guardadas})
+    if desempenho is not None:
+        desempenho.registrar(
+            etapa="exportacao", tabela=tabela, tempo_total=time.monotonic() - inicio,
+            tempo_servidor=espera, linhas_lidas=varridas, linhas_encontradas=lidas,
+            bytes=bytes_geometria, tabelas_na_chamada=1
+        )
+    if lidas:
+        log(f"[Export] {tabela}: {bytes_geometria / 1048576:.1f} MB de geometria recebidos "
+            f"em {time.monotonic() - inicio:.1f}s")
+    if lidas == 0 and not gravadas:
+        log(f"[Aviso] Tabela '{tabela}' não possui feições para exportar.")
+    elif gravadas == 0:
+        log(f"[Aviso] Tabela '{tabela}' só possui geometrias inválidas/vazias e foi ignorada.")
+    elif descartadas:
+        log(f"[Aviso] {descartadas} geometrias inválidas/vazias descartadas em '{tabela}'.")
+    return gravadas
+
+
+def marcador_atual(conn, camada, marcadores):
+    # Marcador de alteração da tabela; marcadores guarda os já lidos, um esquema por vez
+    esquema = camada["esquema"]
+    if esquema not in marcadores:
+        marcadores[esquema] = marcadores_alteracao(conn, esquema)
+        conn.rollback()
+    return marcadores[esquema].get(camada["tabela"])
+
+
+def acertos_validos(conn, camada, aoi, marcadores):
+    # As feições guardadas pelo diagnóstico (camada["acertos"]) servem para a exportação se
+    # a AOI e a sessão são as mesmas e a tabela não mudou desde então
+    acertos = camada.get("acertos")
+    return bool(acertos and acertos["aoi"] == aoi.hash and _aoi_por_conexao.get(conn) == aoi.hash
+                and conn.get_backend_pid() == acertos["sessao"]
+                and marcador_atual(conn, camada, marcadores) == acertos["marcador"])
+
+
+def exportar_geopackage(conexoes, caminho, aoi, camadas, log=print,
+                        ao_concluir=None, cancelamento=None, tamanho_lote=TAMANHO_LOTE_EXPORTACAO,
+                        recortar=False, tolerancia=None, casas_decimais=None, desempenho=None,
+                        cache_feicoes=None, chave=None):
+    # ao_concluir(indice, tabela) é chamado ao fim de cada camada, exportada ou não.
+    # recortar, tolerancia e casas_decimais: ver geometria_exportada. desempenho: ver
+    # exportar_camada_gpkg.
+    # Camadas com camada["acertos"] são lidas na sessão que guardou as feições do
+    # diagnóstico, desde que a AOI seja a mesma e a tabela não tenha mudado desde então;
+    # caso contrário, o teste espacial é refeito.
+    # cache_feicoes (CacheFeicoes) e chave (chave_conexao): tabelas e visões materializadas
+    # são lidas do cache local de feições quando possível; visões comuns não têm marcador
+    # de alteração e sempre vão ao servidor.
+    cancelamento = cancelamento or ControleCancelamento()
+    aoi.gdf.to_file(caminho, layer="AOI", driver="GPKG")
+    if cache_feicoes is not None and (recortar or tolerancia or casas_decimais is not None):
+        # O cache guarda as geometrias originais; com recorte ou simplificação elas mudam
+        log("[Cache] Cache de feições não usado com recorte, simplificação ou quantização")
+        cache_feicoes = None
+    marcadores = {}
+    for i, camada in enumerate(camadas):
+        cancelamento.verificar()
+        tabela = camada["nome"]
+        acertos = camada.get("acertos")
+        with conexoes.conexao(preferida=acertos["sessao"] if acertos else None) as conn:
+            try:
+                usar_acertos = acertos_validos(conn, camada, aoi, marcadores)
+                if not usar_acertos:
+                    garantir_aoi(conn, aoi)
+                cache_camada = chave_cache = marcador = None
+                if cache_feicoes is not None and camada.get("relkind", "r") in ("r", "m"):
+                    marcador = marcador_atual(conn, camada, marcadores)
+                    if marcador is not None:
+                        cache_camada = cache_feicoes
+                        chave_cache = cache_feicoes.chave(chave, camada["esquema"], camada["tabela"])
+                gravadas = exportar_camada_gpkg(conn, caminho, camada, log=log,
+                                                cancelamento=cancelamento, tamanho_lote=tamanho_lote,
+                                                usar_acertos=usar_acertos, recortar=recortar,
+                                                tolerancia=tolerancia, casas_decimais=casas_decimais,
+                                                desempenho=desempenho, cache_feicoes=cache_camada,
+                                                chave_cache=chave_cache, marcador=marcador, aoi=aoi)
+                if gravadas:
+                    origem = " a partir do diagnóstico" if usar_acertos else ""
+                    log(f"[OK] Camada '{tabela}' exportada ({gravadas} feições){origem}.")
+            except OperacaoCancelada:
+                conn.rollback()
+                raise
+            except Exception as e:
+                conn.rollback()
+                if cancelamento.cancelado:
+                    raise OperacaoCancelada()
+                log(f"[Erro] Falha ao exportar camada '{tabela}': {e}")
+                if desempenho is not None:
+                    desempenho.registrar(etapa="exportacao", tabela=tabela, erro=str(e))
+            finally:
+                if ao_concluir:
+                    ao_concluir(i, tabela)
+
+
+LIMITES_BBOX = ("xmin", "ymin", "xmax", "ymax")
+
+
+@functools.lru_cache(maxsize=None)
+def tipos_arrow():
+    # Tipos do PostgreSQL (OID) gravados com tipo próprio no Parquet, com a conversão feita
+    # no servidor quando necessária; os demais (json, uuid, arrays, domínios...) saem como
+    # texto. Montado na primeira exportação: o pyarrow só é importado quando usado.
+    import pyarrow as pa
+    return {
+        16: (pa.bool_(), None),
+        21: (pa.int16(), None),
+        23: (pa.int32(), None),
+        20: (pa.int64(), None),
+        26: (pa.int64(), None),
+        700: (pa.float32(), None),
+        701: (pa.float64(), None),
+        1700: (pa.float64(), "float8"),
+        19: (pa.string(), None),
+        25: (pa.string(), None),
+        1042: (pa.string(), None),
+        1043: (pa.string(), None),
+        17: (pa.binary(), None),
+        1082: (pa.date32(), None),
+        1114: (pa.timestamp("us"), None),
+        1184: (pa.timestamp("us", tz="UTC"), None),
+    }
+
+
+def tipos_colunas(conn, camada):
+    # {coluna: OID do tipo} da tabela, numa consulta ao catálogo
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT attname, atttypid::int FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped;
+        """, (sql.Identifier(camada["esquema"], camada["tabela"]).as_string(conn),))
+        return dict(cur.fetchall())
+
+
+def metadados_geoparquet(camada, coluna_bbox):
+    # Metadados "geo" (GeoParquet 1.1): geometria em WKB, CRS em PROJJSON e a coluna com o
+    # retângulo de cada feição, que permite ao leitor filtrar sem decodificar a geometria
+    import pyproj
+    # Sem SRID declarado, EPSG:4674, como no GeoPackage (montar_lote)
+    try:
+        crs = pyproj.CRS.from_epsg(camada["srid"] or 4674).to_json_dict()
+    except pyproj.exceptions.CRSError:
+        crs = None
+    return {
+        "version": "1.1.0",
+        "primary_column": camada["coluna_geom"],
+        "columns": {
+            camada["coluna_geom"]: {
+                "encoding": "WKB",
+                "geometry_types": [],
+                "crs": crs,
+                "covering": {"bbox": {limite: [coluna_bbox, limite] for limite in LIMITES_BBOX}},
+            }
+        },
+    }
+
+
+def lote_arrow(linhas, esquema):
+    # Tuplas do cursor -> RecordBatch, uma coluna por vez. As quatro últimas colunas de cada
+    # linha são o retângulo, e a anterior, o WKB em base64, que vai para o Arrow como bytes
+    # sem passar pelo shapely.
+    import pyarrow as pa
+    valores = list(zip(*linhas))
+    n = len(esquema) - 2
+    arrays = [pa.array(valores[i], type=esquema.field(i).type) for i in range(n)]
+    arrays.append(pa.array([None if v is None else base64.b64decode(v) for v in valores[n]], type=pa.binary()))
+    limites = [pa.array(valores[n + 1 + k], type=pa.float64()) for k in range(len(LIMITES_BBOX))]
+    arrays.append(pa.StructArray.from_arrays(limites, names=LIMITES_BBOX, mask=limites[0].is_null()))
+    return pa.RecordBatch.from_arrays(arrays, schema=esquema)
+
+
+def exportar_camada_parquet(conn, caminho, camada, log=print, cancelamento=None,
+                            tamanho_lote=TAMANHO_LOTE_EXPORTACAO, usar_acertos=False,
+                            recortar=False, tolerancia=None, casas_decimais=None, desempenho=None):
+    # Mesma leitura em lotes de exportar_camada_gpkg, mas cada lote vira um row group do
+    # arquivo GeoParquet. O retângulo de cada feição é calculado no servidor. Geometrias
+    # nulas, inválidas ou vazias não são descartadas. Retorna o número de feições gravadas.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    cancelamento = cancelamento or ControleCancelamento()
+    tabela = camada["nome"]
+    geom = sql.SQL("t.{}").format(sql.Identifier(camada["coluna_geom"]))
+    with cancelamento.monitorar(conn):
+        colunas = camada.get("colunas")
+        if colunas is None:
+            colunas = colunas_atributos(conn, camada)
+        tipos = tipos_colunas(conn, camada)
+        selecao = []
+        campos = []
+        for coluna in colunas:
+            tipo, conversao = tipos_arrow().get(tipos.get(coluna), (pa.string(), "text"))
+            expressao = sql.SQL("t.{}").format(sql.Identifier(coluna))
+            if conversao:
+                expressao = sql.SQL("{}::{}").format(expressao, sql.SQL(conversao))
+            selecao.append(expressao)
+            campos.append(pa.field(coluna, tipo))
+        geom_saida, aviso_dimensao = geometria_exportada(camada, geom, recortar, tolerancia, casas_decimais)
+        # A geometria exportada é calculada uma vez por linha (LATERAL) e usada no WKB e no retângulo
+        g = sql.SQL("s.g")
+        selecao.append(wkb_transferido(g))
+        selecao.extend(sql.SQL(funcao + "({})").format(g) for funcao in ("ST_XMin", "ST_YMin", "ST_XMax", "ST_YMax"))
+        query = sql.SQL("""
+            SELECT {selecao}
+            FROM {tabela} t CROSS JOIN LATERAL (SELECT {geom_saida} AS g) s
+            WHERE {intersecta}
+        """).format(
+            selecao=sql.SQL(", ").join(selecao),
+            tabela=sql.Identifier(camada["esquema"], camada["tabela"]),
+            geom_saida=geom_saida,
+            intersecta=filtro_acertos(camada) if usar_acertos else filtro_aoi(camada, geom)
+        )
+        if aviso_dimensao:
+            log(f"[Aviso] {aviso_dimensao} na camada '{tabela}'.")
+        coluna_bbox = "bbox" if "bbox" not in colunas else f"{camada['coluna_geom']}_bbox"
+        campos.append(pa.field(camada["coluna_geom"], pa.binary()))
+        campos.append(pa.field(coluna_bbox, pa.struct([(limite, pa.float64()) for limite in LIMITES_BBOX])))
+        esquema = pa.schema(campos, metadata={"geo": json.dumps(metadados_geoparquet(camada, coluna_bbox))})
+        gravadas = 0
+        bytes_geometria = 0
+        espera = 0.0
+        inicio = time.monotonic()
+        varridas = linhas_lidas_transacao(conn, camada) if desempenho is not None else None
+        with pq.ParquetWriter(caminho, esquema, compression="zstd") as escritor:
+            lotes = ler_lotes(conn, query, tamanho_lote)
+            while True:
+                antes = time.monotonic()
+                linhas = next(lotes, None)
+                espera += time.monotonic() - antes
+                if linhas is None:
+                    break
+                cancelamento.verificar()
+                bytes_geometria += sum(len(linha[len(colunas)]) for linha in linhas if linha[len(colunas)] is not None)
+                lote = lote_arrow(linhas, esquema)
+                escritor.write_batch(lote)
+                gravadas += lote.num_rows
+                log(f"[Export] {tabela}: {gravadas} feições gravadas...")
+        if varridas is not None:
+            varridas = linhas_lidas_transacao(conn, camada) - varridas
+    conn.rollback()
+    if desempenho is not None:
+        desempenho.registrar(
+            etapa="exportacao", tabela=tabela, tempo_total=time.monotonic() - inicio,
+            tempo_servidor=espera, linhas_lidas=varridas, linhas_encontradas=gravadas,
+            bytes=bytes_geometria, tabelas_na_chamada=1
+        )
+    if gravadas:
+        log(f"[Export] {tabela}: {bytes_geometria / 1048576:.1f} MB de geometria recebidos "
+            f"em {time.monotonic() - inicio:.1f}s")
+    else:
+        log(f"[Aviso] Tabela '{tabela}' não possui feições para exportar.")
+    return gravadas
+
+
+def exportar_geoparquet(conexoes, pasta, aoi, camadas, log=print,
+                        ao_concluir=None, cancelamento=None, tamanho_lote=TAMANHO_LOTE_EXPORTACAO,
+                        recortar=False, tolerancia=None, casas_decimais=None, desempenho=None):
+    # Um arquivo GeoParquet por camada em pasta (<camada>.parquet), mais AOI.parquet. Os
+    # parâmetros e o reaproveitamento das feições do diagnóstico são os de exportar_geopackage.
+    cancelamento = cancelamento or ControleCancelamento()
+    os.makedirs(pasta, exist_ok=True)
+    aoi.gdf.to_parquet(os.path.join(pasta, "AOI.parquet"))
+    marcadores = {}
+    for i, camada in enumerate(camadas):
+        cancelamento.verificar()
+        tabela = camada["nome"]
+        acertos = camada.get("acertos")
+        caminho = os.path.join(pasta, f"{tabela}.parquet")
+        with conexoes.conexao(preferida=acertos["sessao"] if acertos else None) as conn:
+            try:
+                usar_acertos = acertos_validos(conn, camada, aoi, marcadores)
+                if not usar_acertos:
+                    garantir_aoi(conn, aoi)
+                gravadas = exportar_camada_parquet(conn, caminho, camada, log=log,
+                                                   cancelamento=cancelamento, tamanho_lote=tamanho_lote,
+                                                   usar_acertos=usar_acertos, recortar=recortar,
+                                                   tolerancia=tolerancia, casas_decimais=casas_decimais,
+                                                   desempenho=desempenho)
+                if gravadas:
+                    origem = " a partir do diagnóstico" if usar_acertos else ""
+                    log(f"[OK] Camada '{tabela}' exportada ({gravadas} feições){origem}.")
+                else:
+                    os.remove(caminho)
+            except OperacaoCancelada:
+                conn.rollback()
+                raise
+            except Exception as e:
+                conn.rollback()
+                if cancelamento.cancelado:
+                    raise OperacaoCancelada()
+                log(f"[Erro] Falha ao exportar camada '{tabela}': {e}")
+                if desempenho is not None:
+                    desempenho.registrar(etapa="exportacao", tabela=tabela, erro=str(e))
+            finally:
+                if ao_concluir:
+                    ao_concluir(i, tabela)
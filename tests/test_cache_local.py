@@ -0,0 +1,70 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_local import CacheFeicoes, CacheMetadados, CacheResultados
+
+
+def test_arquivo_so_lido_no_primeiro_acesso(tmp_path):
+    caminho = tmp_path / "resultados.json"
+    caminho.write_text(json.dumps({"k": {"marcador": "m1", "resultado": {"count": 3}}}), encoding="utf-8")
+    cache = CacheResultados(str(caminho))
+    assert cache._dados is None
+    assert cache.obter("k", "m1") == {"count": 3}
+
+
+def test_arquivo_corrompido_vira_cache_vazio(tmp_path):
+    caminho = tmp_path / "metadados.json"
+    caminho.write_text("{", encoding="utf-8")
+    assert CacheMetadados(str(caminho)).obter("conexao", "public") is None
+
+
+def test_metadados_persistem(tmp_path):
+    caminho = str(tmp_path / "metadados.json")
+    CacheMetadados(caminho).gravar("conexao", "public", {"marcadores": {"t": "1"}, "camadas": []})
+    assert CacheMetadados(caminho).obter("conexao", "public") == {"marcadores": {"t": "1"}, "camadas": []}
+
+
+def test_resultados_validos_so_com_o_mesmo_marcador(tmp_path):
+    caminho = str(tmp_path / "resultados.json")
+    CacheResultados(caminho).gravar({"k": ("m1", {"count": 3})})
+    cache = CacheResultados(caminho)
+    assert cache.obter("k", "m1") == {"count": 3}
+    assert cache.obter("k", "m2") is None
+
+
+def test_resultados_mais_antigos_saem_primeiro(tmp_path, monkeypatch):
+    monkeypatch.setattr(CacheResultados, "LIMITE_ENTRADAS", 2)
+    cache = CacheResultados(str(tmp_path / "resultados.json"))
+    cache.gravar({"a": ("m", {"count": 1}), "b": ("m", {"count": 2})})
+    cache.gravar({"c": ("m", {"count": 3})})
+    assert list(cache.dados) == ["b", "c"]
+
+
+def escrever_arquivo(cache, chave, tamanho):
+    with open(cache.arquivo(chave), "wb") as f:
+        f.write(b"\0" * tamanho)
+
+
+def test_feicoes_marcador_diferente_apaga_o_arquivo(tmp_path):
+    cache = CacheFeicoes(str(tmp_path / "feicoes.json"))
+    chave = cache.chave("conexao", "public", "t")
+    escrever_arquivo(cache, chave, 10)
+    cache.gravar(chave, {"marcador": "m1", "colunas": ["id"], "srid": 4674, "feicoes": 1})
+    assert cache.obter(chave, "m1")["feicoes"] == 1
+    assert cache.obter(chave, "m2") is None
+    assert not os.path.exists(cache.arquivo(chave))
+    assert cache.obter(chave, "m1") is None
+
+
+def test_feicoes_limite_apaga_os_usados_ha_mais_tempo(tmp_path):
+    cache = CacheFeicoes(str(tmp_path / "feicoes.json"), limite_mb=1)
+    antiga, nova = cache.chave("c", "s", "antiga"), cache.chave("c", "s", "nova")
+    for chave in (antiga, nova):
+        escrever_arquivo(cache, chave, 600 * 1024)
+        cache.gravar(chave, {"marcador": "m", "colunas": [], "srid": 4674, "feicoes": 0})
+    assert cache.obter(antiga, "m") is None
+    assert not os.path.exists(cache.arquivo(antiga))
+    assert cache.obter(nova, "m") is not None
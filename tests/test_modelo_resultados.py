@@ -0,0 +1,63 @@
+import os
+import sys
+
+from PyQt6.QtCore import QModelIndex, Qt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modelo_resultados import ModeloResultados
+
+
+def resultado(tabela, **extra):
+    return dict({"tabela": tabela, "count": 1, "colunas": ["uso"],
+                 "resumo": {"uso": {"distintos": 3, "valores": ["a", "b"]}}}, **extra)
+
+
+def rotulos(modelo, parent=QModelIndex()):
+    return [modelo.data(modelo.index(i, 0, parent)) for i in range(modelo.rowCount(parent))]
+
+
+def test_inserir_segue_a_ordem_do_catalogo():
+    modelo = ModeloResultados()
+    for indice, tabela in [(2, "c"), (0, "a"), (1, "b")]:
+        modelo.inserir(indice, resultado(tabela))
+    assert rotulos(modelo) == ["a", "b", "c"]
+
+
+def test_filhos_criados_so_ao_expandir():
+    modelo = ModeloResultados()
+    modelo.inserir(0, resultado("a"))
+    camada = modelo.index(0, 0)
+    assert modelo.hasChildren(camada)
+    assert modelo.rowCount(camada) == 0
+    assert modelo.canFetchMore(camada)
+    modelo.fetchMore(camada)
+    assert not modelo.canFetchMore(camada)
+    assert rotulos(modelo, camada) == [" uso (3 valores distintos na amostra)"]
+    campo = modelo.index(0, 0, camada)
+    modelo.fetchMore(campo)
+    assert rotulos(modelo, campo) == ["  -> a", "  -> b"]
+    assert modelo.parent(campo) == camada
+
+
+def test_camada_sem_colunas_nao_tem_filhos():
+    modelo = ModeloResultados()
+    modelo.inserir(0, resultado("a", colunas=[]))
+    assert not modelo.hasChildren(modelo.index(0, 0))
+
+
+def test_matriz_refaz_os_filhos_ja_expandidos():
+    modelo = ModeloResultados()
+    modelo.inserir(0, resultado("a"))
+    camada = modelo.index(0, 0)
+    modelo.fetchMore(camada)
+    modelo.definir_matriz({"a": {"lote 1": 2}})
+    assert rotulos(modelo, camada)[0] == " Feições da AOI com interseção: 1"
+
+
+def test_resultados_marcados():
+    modelo = ModeloResultados()
+    modelo.inserir(0, resultado("a"))
+    modelo.inserir(1, resultado("b"))
+    modelo.setData(modelo.index(0, 0), Qt.CheckState.Unchecked.value, Qt.ItemDataRole.CheckStateRole)
+    assert [r["tabela"] for r in modelo.resultados_marcados()] == ["b"]
@@ -0,0 +1,122 @@
+import base64
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pyarrow as pa
+import shapely
+from psycopg2 import sql
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor_intersecao import (
+    LIMITES_BBOX, TABELAS_POR_LOTE, distribuir_grupos, fora_da_extensao, geometria_sem_m, lote_arrow,
+    metadados_geoparquet, montar_lote
+)
+
+
+def wkb64(geometria):
+    return None if geometria is None else base64.b64encode(geometria.wkb).decode()
+
+
+def test_distribuir_grupos_sem_custos_divide_pelas_conexoes():
+    # Sem EXPLAIN (falha ou tempo esgotado) os custos ficam vazios ou None
+    for custos in ({}, {i: None for i in range(120)}):
+        grupos = distribuir_grupos(list(range(120)), custos, 4)
+        assert sorted(len(g) for g in grupos) == [30, 30, 30, 30]
+        assert sorted(i for g in grupos for i in g) == list(range(120))
+
+
+def test_distribuir_grupos_equilibra_custos():
+    custos = {0: 100.0, 1: 60.0, 2: 50.0, 3: 10.0}
+    grupos = distribuir_grupos([0, 1, 2, 3], custos, 2)
+    assert sorted(sorted(g) for g in grupos) == [[0, 3], [1, 2]]
+
+
+def test_distribuir_grupos_respeita_limite_por_lote():
+    n = TABELAS_POR_LOTE * 2 + 1
+    grupos = distribuir_grupos(list(range(n)), {0: 1e9}, 3)
+    assert all(len(g) <= TABELAS_POR_LOTE for g in grupos)
+    assert sum(len(g) for g in grupos) == n
+
+
+def test_montar_lote_coluna_geometry():
+    # "geometry" é o nome padrão do to_postgis do geopandas
+    camada = {"coluna_geom": "geometry", "srid": 31983}
+    gdf = montar_lote([(1, wkb64(shapely.Point(0, 0)))], ["id"], camada)
+    assert gdf.geometry.name == "geometry"
+    assert list(gdf.columns) == ["id", "geometry"]
+    assert gdf.crs.to_epsg() == 31983
+
+
+def test_montar_lote_descarta_nulas_invalidas_e_vazias():
+    gravata = shapely.Polygon([(0, 0), (1, 1), (1, 0), (0, 1)])
+    linhas = [(1, wkb64(shapely.Point(0, 0))), (2, None), (3, wkb64(gravata)), (4, wkb64(shapely.Point()))]
+    gdf = montar_lote(linhas, ["id"], {"coluna_geom": "geom", "srid": 0})
+    assert gdf["id"].tolist() == [1]
+    assert gdf.geometry.name == "geom"
+    # Sem SRID declarado a camada é tratada como EPSG:4674
+    assert gdf.crs.to_epsg() == 4674
+
+
+def test_geometria_sem_m_pela_dimensao_declarada():
+    geom = sql.SQL("t.geom")
+    assert geometria_sem_m({"tipo": "POINTM", "dimensao": 3}, geom) == (
+        sql.SQL("ST_Force2D({})").format(geom), "Geometrias XYM convertidas para XY")
+    assert geometria_sem_m({"tipo": "POLYGON", "dimensao": 4}, geom) == (
+        sql.SQL("ST_Force3DZ({})").format(geom), "Geometrias ZM convertidas para Z")
+    # XYZ e XY saem como estão
+    assert geometria_sem_m({"tipo": "POINTZ", "dimensao": 3}, geom) == (geom, None)
+    assert geometria_sem_m({"tipo": "POINT", "dimensao": 2}, geom) == (geom, None)
+
+
+def test_geometria_sem_m_tipo_generico_decide_por_linha():
+    expressao, aviso = geometria_sem_m({"tipo": "GEOMETRY", "dimensao": 2}, sql.SQL("t.geom"))
+    assert "ST_Zmflag" in repr(expressao)
+    assert aviso is None
+
+
+def aoi(*caixa):
+    return SimpleNamespace(geometria=shapely.box(*caixa))
+
+
+def test_fora_da_extensao():
+    camada = {"extensao": [0.0, 0.0, 10.0, 10.0]}
+    assert fora_da_extensao(camada, aoi(20, 20, 30, 30))
+    assert not fora_da_extensao(camada, aoi(5, 5, 15, 15))
+    # Dentro da margem de MARGEM_EXTENSAO além da extensão estimada
+    assert not fora_da_extensao(camada, aoi(10.2, 0, 11, 1))
+    # Sem extensão conhecida a camada nunca é podada
+    assert not fora_da_extensao({"extensao": None}, aoi(20, 20, 30, 30))
+
+
+def test_metadados_geoparquet():
+    geo = metadados_geoparquet({"coluna_geom": "geom", "srid": 31983}, "bbox")
+    assert geo["primary_column"] == "geom"
+    coluna = geo["columns"]["geom"]
+    assert coluna["encoding"] == "WKB"
+    assert coluna["crs"]["id"] == {"authority": "EPSG", "code": 31983}
+    assert coluna["covering"]["bbox"]["xmin"] == ["bbox", "xmin"]
+    # Sem SRID declarado, o mesmo EPSG:4674 do GeoPackage
+    sem_srid = metadados_geoparquet({"coluna_geom": "geom", "srid": 0}, "bbox")
+    assert sem_srid["columns"]["geom"]["crs"]["id"]["code"] == 4674
+    json.dumps(geo)
+
+
+def test_lote_arrow():
+    esquema = pa.schema([
+        pa.field("id", pa.int32()), pa.field("nome", pa.string()), pa.field("geom", pa.binary()),
+        pa.field("bbox", pa.struct([(limite, pa.float64()) for limite in LIMITES_BBOX])),
+    ])
+    ponto = shapely.Point(1, 2)
+    linhas = [
+        (1, "a", wkb64(ponto), 1.0, 2.0, 1.0, 2.0),
+        (2, None, None, None, None, None, None),
+    ]
+    lote = lote_arrow(linhas, esquema)
+    assert lote.schema == esquema
+    assert lote.column("id").to_pylist() == [1, 2]
+    assert lote.column("nome").to_pylist() == ["a", None]
+    assert lote.column("geom").to_pylist() == [ponto.wkb, None]
+    assert lote.column("bbox").to_pylist() == [{"xmin": 1.0, "ymin": 2.0, "xmax": 1.0, "ymax": 2.0}, None]